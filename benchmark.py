@@ -0,0 +1,479 @@
+import contextlib
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import tempfile
+import time
+from typing import List, Optional, Tuple
+import typer
+from rich.console import Console
+from rich.table import Table
+from walker import walk_video_dirs, VIDEO_EXTENSIONS
+from filename_parser import parse_filename
+from matching import normalize_title
+from build import build_structure, SCRIPT_FORMATS
+from layouts import LAYOUTS, parse_targets
+from dedup import dedup_with_policies, dedup_content
+from refresh import films_to_refresh
+import cache
+import db
+import local_index
+import perf
+import scan
+import tmdb_client
+import tmdb_stub
+
+CORPUS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "filename_corpus.tsv")
+
+app = typer.Typer(help="Movie Organiser benchmarks")
+console = Console()
+
+@app.callback()
+def main():
+    """Run with a benchmark name, e.g. `python benchmark.py walk`."""
+
+def make_synthetic_tree(root: str, dirs: int, files_per_dir: int, depth: int, video_ratio: float = 0.3):
+    """Nested tree of empty files: about video_ratio of them videos, the rest subtitles/artwork/nfo."""
+    other_exts = (".srt", ".nfo", ".jpg", ".txt")
+    videos_per_dir = max(1, int(files_per_dir * video_ratio))
+    for d in range(dirs):
+        # Spread directories over `depth` levels: a/b/c/...
+        parts = [f"level{level}_{(d // (level + 1)) % 7}" for level in range(d % depth)]
+        path = os.path.join(root, *parts, f"Movie.Collection.{d}")
+        os.makedirs(path, exist_ok=True)
+        for f in range(files_per_dir):
+            ext = VIDEO_EXTENSIONS[f % len(VIDEO_EXTENSIONS)] if f < videos_per_dir else other_exts[f % len(other_exts)]
+            open(os.path.join(path, f"Some.Movie.{d}.{f}.{2000 + f % 20}.1080p{ext}"), "w").close()
+
+def baseline_walk(source_dir: str) -> int:
+    # The walk scan_directory used before walker.py: os.walk, then path work, then the extension test
+    count = 0
+    for root, _, files in os.walk(source_dir):
+        for file in files:
+            abs_path = os.path.abspath(os.path.join(root, file))
+            os.path.relpath(abs_path, source_dir)
+            if file.lower().endswith(VIDEO_EXTENSIONS):
+                count += 1
+    return count
+
+def scandir_walk(source_dir: str, workers: int) -> int:
+    return sum(len(entries) for _, _, _, entries in walk_video_dirs(source_dir, workers=workers))
+
+def best_of(repeat: int, fn, *args):
+    times, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+@app.command()
+def walk(
+    dirs: int = typer.Option(500, help="Number of directories in the synthetic tree"),
+    files_per_dir: int = typer.Option(20, help="Files per directory"),
+    depth: int = typer.Option(4, help="Maximum nesting depth"),
+    workers: int = typer.Option(8, help="Walker threads"),
+    repeat: int = typer.Option(3, help="Runs per walker (best is reported)"),
+    path: str = typer.Option(None, help="Walk this existing tree instead of a synthetic one (e.g. a network mount)")
+):
+    """Compare the scandir-based walker with the original os.walk loop."""
+    tmp = None
+    if path is None:
+        tmp = tempfile.mkdtemp(prefix="movieorg-bench-")
+        make_synthetic_tree(tmp, dirs, files_per_dir, depth)
+        path = tmp
+    try:
+        base_time, base_count = best_of(repeat, baseline_walk, path)
+        serial_time, serial_count = best_of(repeat, scandir_walk, path, 1)
+        par_time, par_count = best_of(repeat, scandir_walk, path, workers)
+    finally:
+        if tmp:
+            shutil.rmtree(tmp)
+    table = Table(title=f"Directory walk ({base_count} video files)")
+    table.add_column("Walker")
+    table.add_column("Time", justify="right")
+    table.add_column("Files", justify="right")
+    table.add_column("Speed-up", justify="right")
+    for name, t, count in (
+        ("os.walk (original)", base_time, base_count),
+        ("scandir, 1 thread", serial_time, serial_count),
+        (f"scandir, {workers} threads", par_time, par_count),
+    ):
+        table.add_row(name, f"{t * 1000:.1f} ms", str(count), f"{base_time / t:.2f}x")
+    console.print(table)
+
+def baseline_guess_title_year(filename: str):
+    # guess_title_year as it was before filename_parser.py
+    name = os.path.splitext(filename)[0]
+    name = re.sub(r"[\[\(].*?[\]\)]", "", name)
+    name = re.sub(r"[._-]", " ", name)
+    name = re.sub(r"\b(720p|1080p|2160p|x264|x265|h264|h265|bluray|bdrip|webrip|dvdrip|hdrip|subs?|ac3|dts|aac|ita|eng|spa|trilogia|fanart|poster|thumb)\b", "", name, flags=re.I)
+    name = re.sub(r"\s+", " ", name).strip()
+    match = re.search(r"(19|20)\d{2}", filename)
+    year = int(match.group(0)) if match else None
+    return name, year
+
+def parsed_title_year(filename: str):
+    parsed = parse_filename(filename)
+    return parsed.title, parsed.year
+
+def load_corpus(path: str):
+    """(filename, title, year) rows of a tab-separated labelled corpus; '#' lines are comments."""
+    rows = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip() or line.startswith("#"):
+                continue
+            filename, title, year = line.rstrip("\n").split("\t")
+            rows.append((filename, title, int(year) if year else None))
+    return rows
+
+def accuracy(guess, corpus):
+    titles = years = both = 0
+    for filename, title, year in corpus:
+        g_title, g_year = guess(filename)
+        title_ok = normalize_title(g_title) == normalize_title(title)
+        titles += title_ok
+        years += g_year == year
+        both += title_ok and g_year == year
+    n = len(corpus)
+    return titles / n, years / n, both / n
+
+@app.command()
+def parse(
+    corpus: str = typer.Option(CORPUS_FILE, help="Labelled corpus: filename<TAB>title<TAB>year"),
+    iterations: int = typer.Option(200, help="Passes over the corpus for the throughput measurement")
+):
+    """Parse throughput and accuracy of the filename parser against the original guess_title_year."""
+    rows = load_corpus(corpus)
+    filenames = [r[0] for r in rows]
+    # Distinct names each pass, so the parser's LRU cache does not flatter it
+    uncached = [f"{i}.{name}" for i in range(iterations) for name in filenames]
+
+    def throughput(fn, names):
+        start = time.perf_counter()
+        for name in names:
+            fn(name)
+        return len(names) / (time.perf_counter() - start)
+
+    parse_filename.cache_clear()
+    results = [
+        ("original", throughput(baseline_guess_title_year, uncached), None, accuracy(baseline_guess_title_year, rows)),
+        ("filename_parser", throughput(parsed_title_year, uncached), throughput(parsed_title_year, filenames * iterations), accuracy(parsed_title_year, rows)),
+    ]
+    table = Table(title=f"Filename parsing ({len(rows)} labelled names)")
+    table.add_column("Parser")
+    table.add_column("Names/s", justify="right")
+    table.add_column("Names/s (cached)", justify="right")
+    table.add_column("Title", justify="right")
+    table.add_column("Year", justify="right")
+    table.add_column("Both", justify="right")
+    for name, rate, cached_rate, (title_acc, year_acc, both_acc) in results:
+        table.add_row(
+            name, f"{rate:,.0f}", f"{cached_rate:,.0f}" if cached_rate else "-",
+            f"{title_acc:.0%}", f"{year_acc:.0%}", f"{both_acc:.0%}"
+        )
+    console.print(table)
+
+# --- End-to-end suite: synthetic library, stub TMDb, every hot path timed ---
+
+TITLE_WORDS = (
+    "Silent", "River", "Night", "Shadow", "Empire", "Last", "Storm", "Garden", "Winter", "Iron", "Golden", "Lost",
+    "City", "Dream", "Fire", "Ghost", "Heart", "Island", "Kingdom", "Light", "Moon", "Ocean", "Road", "Secret",
+    "Star", "Stone", "Sun", "Time", "War", "Wild", "Blue", "Black", "Red", "Broken", "Hidden", "Burning",
+)
+GENRES = ("Action", "Drama", "Comedy", "Thriller", "Science Fiction", "Horror", "Romance", "Animation", "Crime", "Family")
+# Release-style names as they turn up in real download folders
+RELEASE_STYLES = (
+    "{dotted}.{year}.1080p.BluRay.x264-GROUP.mkv",
+    "{dotted}.{year}.2160p.WEB-DL.DDP5.1.x265-NOGRP.mkv",
+    "{title} ({year}) [720p].mp4",
+    "{title} {year} DVDRip XviD.avi",
+    "{lower}_{year}_hdrip.mkv",
+    "{title} ({year}).mkv",
+)
+SUITE_STAGES = ("scan", "build", "dedup", "db")
+
+def make_catalogue(films: int, seed: int = 1) -> List[dict]:
+    """Stub-server films with two- to four-word titles; some titles repeat across years, as remakes do."""
+    rng = random.Random(seed)
+    movies = []
+    for i in range(films):
+        words = rng.sample(TITLE_WORDS, rng.randint(2, 4))
+        title = " ".join(["The"] + words if rng.random() < 0.3 else words)
+        movies.append({
+            "id": 100000 + i,
+            "title": title,
+            "release_date": f"{rng.randint(1950, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "runtime": rng.randint(80, 180),
+            "popularity": round(rng.uniform(1, 100), 1),
+            "genres": rng.sample(GENRES, rng.randint(1, 3)),
+            "director": f"Director {i % 997}",
+            "collection": {"id": i % 50, "name": f"{words[0]} Collection"} if i % 10 == 0 else None,
+        })
+    return movies
+
+def release_name(movie: dict, style: int) -> str:
+    title, year = movie["title"], movie["release_date"][:4]
+    return RELEASE_STYLES[style % len(RELEASE_STYLES)].format(
+        title=title, year=year, dotted=title.replace(" ", "."), lower=title.lower().replace(" ", "_")
+    )
+
+def make_library(root: str, catalogue: List[dict], files: int, duplicates: float = 0.1, copies: float = 0.05,
+                 depth: int = 3, file_size: int = 2048, seed: int = 1) -> int:
+    """
+    A tree of `files` video files for films of the catalogue, in nested folders (by letter, by folder per film,
+    or loose in numbered download batches). About `duplicates` of the films get a second release (other quality,
+    other content) and `copies` of them a byte-identical copy elsewhere. Every file holds file_size bytes.
+    Returns the number of films used.
+    """
+    rng = random.Random(seed)
+    films = max(1, min(len(catalogue), int(files / (1 + duplicates + copies))))
+    written = 0
+
+    def write(path, content):
+        nonlocal written
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(content)
+        written += 1
+
+    def folder(movie, i):
+        kind = i % 3
+        if kind == 0 or depth < 2:
+            parts = [movie["title"][0].upper()]
+        elif kind == 1:
+            parts = [movie["title"][0].upper(), f"{movie['title']} ({movie['release_date'][:4]})"]
+        else:
+            parts = ["Downloads", f"batch_{i // 100:04d}"]
+        return os.path.join(root, *parts[:max(1, depth)])
+
+    for i in range(films):
+        if written >= files:
+            break
+        movie = catalogue[i]
+        content = (f"{movie['id']}:{i}:".encode() * (file_size // 8 + 1))[:file_size]
+        path = os.path.join(folder(movie, i), release_name(movie, i))
+        write(path, content)
+        if written < files and rng.random() < duplicates:
+            write(os.path.join(folder(movie, i + 1), release_name(movie, i + 1)), content[::-1])
+        if written < files and rng.random() < copies:
+            write(os.path.join(root, "Copies", f"{i:06d}", os.path.basename(path)), content)
+    return films
+
+class ScriptedPrompt:
+    """Stands in for rich's Prompt and Confirm during a scan: takes the first candidate, skips files with none."""
+    @staticmethod
+    def ask(prompt="", default=None, **kwargs):
+        if prompt.startswith("Select match"):
+            return "1"
+        if prompt.startswith("Select option"):
+            return "0"  # Manual mode: skip the file
+        if prompt.startswith("TMDb unavailable"):
+            return "s"
+        return default if default is not None else True
+
+@contextlib.contextmanager
+def scripted_prompts():
+    saved = scan.Prompt, scan.Confirm
+    scan.Prompt = scan.Confirm = ScriptedPrompt
+    try:
+        yield
+    finally:
+        scan.Prompt, scan.Confirm = saved
+
+def use_database(path: str):
+    """Point db (and the TMDb cache, which lives in it) at a fresh database file."""
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    db.DB_FILE = path
+    db.init_db()
+    cache.init_cache()
+
+def timed_stage(results: List[dict], name: str, items: Optional[int], fn, *args, **kwargs):
+    """Run fn with its console output swallowed and append {name, seconds, items, per_second} to results."""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        value = fn(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+    results.append({
+        "name": name,
+        "seconds": round(elapsed, 6),
+        "items": items,
+        "per_second": round(items / elapsed, 1) if items and elapsed > 0 else None,
+    })
+    return value
+
+def db_operations(results: List[dict], files: int, catalogue: List[dict], db_dir: str):
+    def page_all():
+        after, rows = None, 0
+        while True:
+            page = db.get_review_page(after, limit=25)
+            if not page:
+                return rows
+            rows += len(page)
+            after = page[-1][0]
+
+    timed_stage(results, "db: get_file_index", files, db.get_file_index)
+    timed_stage(results, "db: iter_build_rows", files, lambda: sum(1 for _ in db.iter_build_rows(order_by="title")))
+    timed_stage(results, "db: iter_build_rows (details)", files, lambda: sum(1 for _ in db.iter_build_rows(order_by="title", details=True)))
+    timed_stage(results, "db: review paging (25 per page)", files, page_all)
+    timed_stage(results, "db: get_duplicate_file_groups", files, db.get_duplicate_file_groups)
+    timed_stage(results, "db: films_to_refresh", files, films_to_refresh)
+    paths = db.get_all_file_paths()
+    timed_stage(results, "db: set_skip_flags", len(paths), db.set_skip_flags, [(p, False) for p in paths])
+    # Bulk insert into an empty database, with the full details a scan stores
+    use_database(os.path.join(db_dir, "insert.db"))
+    rows = [
+        (f"/library/{i}.mkv", f"{i}.mkv", *scan.tmdb_movie_fields(tmdb_stub.movie_details(catalogue[i % len(catalogue)], credits=True)), 0)
+        for i in range(files)
+    ]
+    timed_stage(results, "db: add_movies", files, db.add_movies, rows)
+
+@app.command()
+def suite(
+    files: int = typer.Option(1000, help="Video files in the synthetic library (1k to 1M)"),
+    duplicates: float = typer.Option(0.1, help="Share of films with a second release"),
+    copies: float = typer.Option(0.05, help="Share of films with a byte-identical copy elsewhere"),
+    depth: int = typer.Option(3, help="Folder nesting depth"),
+    file_size: int = typer.Option(2048, help="Bytes per file (content is what find-duplicates hashes)"),
+    latency: float = typer.Option(0.005, help="Seconds the stub TMDb adds to every response"),
+    rate_limit_every: int = typer.Option(0, help="Stub answers every Nth request with 429 (0 = never)"),
+    rate: float = typer.Option(500.0, help="Client request rate limit (the real TMDb allows about 40/s)"),
+    workers: int = typer.Option(8, help="Workers for scan --auto, hashing and probing"),
+    stages: List[str] = typer.Option(None, "--stage", help=f"Only run these stages ({', '.join(SUITE_STAGES)}); repeatable"),
+    library: str = typer.Option(None, help="Keep the library and databases here instead of a temporary directory"),
+    seed: int = typer.Option(1, help="Random seed of the generated catalogue and library"),
+    output: str = typer.Option(None, help="Write the JSON results to this file"),
+    compare: str = typer.Option(None, help="Earlier JSON results: exit 1 if a stage got slower by more than --tolerance"),
+    tolerance: float = typer.Option(0.25, help="Allowed slow-down against --compare (0.25 = 25%)"),
+    json_only: bool = typer.Option(False, "--json", help="Print only the JSON results")
+):
+    """Generate a library, serve it from the stub TMDb, and time scan, build, dedup and database operations."""
+    stages = stages or list(SUITE_STAGES)
+    unknown = set(stages) - set(SUITE_STAGES)
+    if unknown:
+        console.print(f"[red]Unknown stage(s): {', '.join(sorted(unknown))}. Use: {', '.join(SUITE_STAGES)}[/red]")
+        raise typer.Exit(1)
+    work = library or tempfile.mkdtemp(prefix="movieorg-suite-")
+    lib_dir, out_dir = os.path.join(work, "library"), os.path.join(work, "out")
+    os.makedirs(out_dir, exist_ok=True)
+    catalogue = make_catalogue(max(1, files), seed)
+    results: List[dict] = []
+    start = time.perf_counter()
+    films = make_library(lib_dir, catalogue, files, duplicates, copies, depth, file_size, seed)
+    generated = time.perf_counter() - start
+
+    server, url, stub = tmdb_stub.start_stub_server(catalogue[:films], latency=latency, rate_limit_every=rate_limit_every)
+    saved_url, saved_db = tmdb_client.TMDB_API_URL, db.DB_FILE
+    tmdb_client.TMDB_API_URL = url
+    token = "benchmark"
+    tmdb_client._clients[token] = tmdb_client.TMDbClient(token, base_url=url, rate=rate, burst=max(tmdb_client.BURST, int(rate)))
+    local_index.enabled = False
+    perf.quiet = True
+    try:
+        if "scan" in stages:
+            use_database(os.path.join(work, "interactive.db"))
+            with scripted_prompts():
+                timed_stage(results, "scan: interactive (scripted answers)", files, scan.scan_directory, lib_dir, token, workers=2)
+            use_database(os.path.join(work, "staged.db"))
+            timed_stage(results, "scan: discover", files, scan.discover_files, lib_dir)
+            timed_stage(results, "scan: fetch", files, scan.auto_scan_directory, lib_dir, token, workers=workers, decide=False)
+            timed_stage(results, "scan: decide from queue (--auto)", files, scan.auto_scan_directory, lib_dir, token, workers=workers)
+            use_database(os.path.join(work, "library.db"))
+            timed_stage(results, "scan: --auto", files, scan.auto_scan_directory, lib_dir, token, workers=workers)
+            timed_stage(results, "scan: --auto, nothing changed", files, scan.auto_scan_directory, lib_dir, token, workers=workers)
+        else:
+            # The other stages need a matched library: build it once, untimed
+            use_database(os.path.join(work, "library.db"))
+            timed_stage([], "match library", None, scan.auto_scan_directory, lib_dir, token, workers=workers)
+
+        if "build" in stages:
+            for mode in LAYOUTS:
+                target = os.path.join(out_dir, mode)
+                shutil.rmtree(target, ignore_errors=True)
+                timed_stage(results, f"build: {mode}", files, build_structure, target, mode=mode)
+            timed_stage(results, "build: title, nothing changed", files, build_structure, os.path.join(out_dir, "title"), mode="title")
+            timed_stage(results, "build: title, --verify", files, build_structure, os.path.join(out_dir, "title"), mode="title", verify=True)
+            multi = [(f"{mode}=" + os.path.join(out_dir, "multi", mode)) for mode in LAYOUTS if mode != "title"]
+            shutil.rmtree(os.path.join(out_dir, "multi"), ignore_errors=True)
+            timed_stage(results, "build: all layouts in one pass", files, build_structure, os.path.join(out_dir, "multi", "title"),
+                        mode="title", extra_targets=parse_targets(multi))
+            for script_format in SCRIPT_FORMATS:
+                timed_stage(results, f"build script: {script_format}", files, build_structure, os.path.join(out_dir, "remote"),
+                            script_path=os.path.join(out_dir, f"links.{script_format}"), source_root="/mnt/movies", script_format=script_format)
+
+        if "dedup" in stages:
+            timed_stage(results, "dedup: policy plan", files, dedup_with_policies, ["prefer-resolution", "keep-largest"], dry_run=True)
+            timed_stage(results, "dedup: content, partial hashes", files, dedup_content, [lib_dir], workers=workers)
+            timed_stage(results, "dedup: content, cached hashes", files, dedup_content, [lib_dir], workers=workers)
+            timed_stage(results, "dedup: content, full hashes", files, dedup_content, [lib_dir], full=True, workers=workers)
+
+        if "db" in stages:
+            db_operations(results, files, catalogue[:films], work)
+    finally:
+        server.shutdown()
+        tmdb_client.TMDB_API_URL = saved_url
+        tmdb_client._clients.pop(token, None)
+        db.close_db()
+        db.DB_FILE = saved_db
+        if not library:
+            shutil.rmtree(work, ignore_errors=True)
+
+    report = {
+        "suite": "movie-organiser",
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "files": files, "films": films, "duplicates": duplicates, "copies": copies, "depth": depth,
+            "file_size": file_size, "latency": latency, "rate_limit_every": rate_limit_every, "rate": rate,
+            "workers": workers, "seed": seed, "stages": stages,
+        },
+        "generate_seconds": round(generated, 6),
+        "stub": {"requests": stub.requests, "rate_limited": stub.rate_limited},
+        "results": results,
+    }
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    regressions = compare_results(report, compare, tolerance) if compare else []
+    if json_only:
+        print(json.dumps(report, indent=2))
+    else:
+        print_suite(report, regressions)
+    if regressions:
+        raise typer.Exit(1)
+
+def compare_results(report: dict, baseline_path: str, tolerance: float) -> List[Tuple[str, float, float]]:
+    """(stage, baseline seconds, seconds) of every stage slower than its baseline by more than tolerance."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {r["name"]: r["seconds"] for r in json.load(f)["results"]}
+    # Stages too quick to time reliably are not held to the tolerance
+    return [
+        (r["name"], baseline[r["name"]], r["seconds"])
+        for r in report["results"]
+        if r["name"] in baseline and r["seconds"] > max(baseline[r["name"]] * (1 + tolerance), baseline[r["name"]] + 0.01)
+    ]
+
+def print_suite(report: dict, regressions: List[Tuple[str, float, float]]):
+    slower = {name for name, _, _ in regressions}
+    config = report["config"]
+    table = Table(title=f"Suite: {config['files']} files, {config['films']} films "
+                        f"(stub: {report['stub']['requests']} requests, {report['stub']['rate_limited']} rate-limited)")
+    table.add_column("Stage")
+    table.add_column("Time", justify="right")
+    table.add_column("Files/s", justify="right")
+    for r in report["results"]:
+        style = "red" if r["name"] in slower else None
+        table.add_row(r["name"], f"{r['seconds'] * 1000:.1f} ms", f"{r['per_second']:,.0f}" if r["per_second"] else "-", style=style)
+    console.print(table)
+    for name, before, after in regressions:
+        console.print(f"[red]Regression: {name}: {before * 1000:.1f} ms -> {after * 1000:.1f} ms[/red]")
+
+if __name__ == "__main__":
+    app()
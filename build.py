@@ -1,81 +1,202 @@
 import os
 import json
-import re
-from typing import Literal
-from db import get_all_movies
+import tarfile
+import time
+from typing import List, Optional, Tuple
+from layouts import Layout, FilmFields
+from db import iter_build_rows, get_library_version, get_build_state, get_build_manifest, save_build
+from reconcile import scan_target_tree, plan_build, apply_plan, print_plan_summary, print_error_summary, FS_WORKERS, DRY_RUN_EXAMPLES
 from rich.console import Console
+import perf
 
 console = Console()
 
-def safe_symlink(src, dst, dry_run=False):
-    if os.path.exists(dst):
-        if os.path.islink(dst) and os.readlink(dst) == src:
-            return  # Already correct
+def iter_links(targets, script_path=None, source_root=None, effective_source_root=None, only_genre=None, only_year=None, order_by=None):
+    """
+    Yield (target_dir, src, dest_dir, dest_link) for every file to link into every (target_dir, layout)
+    target, from a single pass over the database. Skipped files are filtered out by the query.
+    """
+    layouts = [(target_dir, Layout(layout)) for target_dir, layout in targets]
+    details = any(layout.needs_details for _, layout in layouts)
+    for absolute_path, relative_path, title, year, tmdb_id, *extra in iter_build_rows(genre=only_genre, year=only_year, order_by=order_by, details=details):
+        # Use effective_source_root if provided, else fall back to source_root logic
+        if script_path and effective_source_root:
+            src = os.path.join(effective_source_root, relative_path)
+        elif script_path and source_root:
+            src = os.path.join(source_root, relative_path)
         else:
-            console.print(f"[yellow]Collision: {dst} exists. Skipping.[/yellow]")
-            return
+            src = absolute_path
+        film = FilmFields(tmdb_id, title, year, *extra)
+        # The link is named like its folder (with the extension of the original file)
+        ext = os.path.splitext(os.path.basename(src))[1]
+        for target_dir, layout in layouts:
+            for path in layout.paths(film):
+                dest_link = os.path.join(target_dir, path + ext)
+                yield target_dir, src, os.path.dirname(dest_link), dest_link
+
+def reconcile_structure(targets, dry_run=False, verify=False, only_genre=None, only_year=None, workers=FS_WORKERS):
+    """
+    Bring each (target_dir, layout) target in line with the database: create missing links, retarget
+    links whose file was re-matched, remove links of files that are now skipped or gone. Targets whose
+    library and options did not change since their last build are left alone, unless verify is set.
+    """
+    version = get_library_version()
+    todo = []
+    for target_dir, layout in targets:
+        target_dir = os.path.abspath(target_dir)
+        options = json.dumps({"mode": layout, "genre": only_genre, "year": only_year}, sort_keys=True)
+        if not verify and not dry_run and get_build_state(target_dir) == (options, version) and os.path.isdir(target_dir):
+            console.print(f"[green]{target_dir} is up to date.[/green]")
+            continue
+        todo.append((target_dir, layout, options))
+    if not todo:
+        return
+    desired = {target_dir: {} for target_dir, _, _ in todo}
+    duplicates = {target_dir: [] for target_dir, _, _ in todo}
+    with perf.span("build: read database"):
+        for target_dir, src, _, dest_link in iter_links([(t, layout) for t, layout, _ in todo], only_genre=only_genre, only_year=only_year):
+            if desired[target_dir].setdefault(dest_link, src) != src:
+                duplicates[target_dir].append(dest_link)  # Two files of one film want the same link: first one wins
+    for target_dir, layout, options in todo:
+        if len(todo) > 1:
+            console.print(f"[bold]{target_dir}[/bold] ({layout})")
+        _reconcile_target(target_dir, options, version, desired[target_dir], duplicates[target_dir], dry_run, workers)
+
+def _reconcile_target(target_dir, options, version, desired, duplicates, dry_run, workers=FS_WORKERS):
+    links, others, dirs = scan_target_tree(target_dir)
+    manifest = get_build_manifest(target_dir)
+    plan = plan_build(desired, links, others, manifest)
+    plan["collisions"].extend(duplicates)
+    print_plan_summary(plan, dry_run=dry_run)
     if dry_run:
-        console.print(f"[cyan]Would link:[/cyan] {dst} -> {src}")
-    else:
-        os.symlink(src, dst)
-        console.print(f"[green]Linked:[/green] {dst} -> {src}")
+        return
+    with perf.span("build: apply"):
+        errors = apply_plan(plan, target_dir, dirs, workers=workers)
+    failed = {path for path, _ in errors}
+    created = {link: src for link, src in {**plan["create"], **plan["retarget"]}.items() if link not in failed}
+    # Links already correct on disk are adopted into the manifest too
+    created.update({link: src for link, src in desired.items() if links.get(link) == src})
+    removed = [link for link in plan["remove"] if link not in failed] + plan["forget"]
+    # A build with errors is not recorded as complete, so the next run retries
+    save_build(target_dir, options, None if errors else version, created, removed)
+    print_error_summary(errors)
 
-def sanitize_folder_name(name):
-    # Remove or replace problematic characters for Kodi and filesystems
-    name = name.replace(':', '')  # Remove colons
-    name = name.replace('?', '')  # Remove question marks
-    name = name.replace('/', '-') # Replace slashes with dash
-    name = name.replace('"', '') # Remove double quotes
-    name = name.replace('|', '')  # Remove pipes
-    name = name.replace('<', '')  # Remove less than
-    name = name.replace('>', '')  # Remove greater than
-    name = name.replace('*', '')  # Remove asterisks
-    name = name.replace('\\', '') # Remove backslashes
-    name = re.sub(r'\s+', ' ', name)  # Collapse multiple spaces
-    name = name.strip()
-    return name
+SCRIPT_FORMATS = ("ln", "xargs", "tar")
+# Parallel ln processes started by an xargs-format script
+XARGS_PARALLEL = 8
+WRITE_BUFFER = 1 << 20
 
-def build_structure(target_dir: str, mode: Literal["title", "year"] = "title", dry_run: bool = False, script_path: str = None, source_root: str = None, effective_source_root: str = None):
-    def bash_escape(path):
-        # Escape single quotes for bash: ' -> '\''
-        return "'" + path.replace("'", "'\\''") + "'"
+def bash_escape(path):
+    # Escape single quotes for bash: ' -> '\''
+    return "'" + path.replace("'", "'\\''") + "'"
 
-    movies = get_all_movies()
-    ln_commands = []
-    mkdirs = set()
-    for movie in movies:
-        if movie.get("skip", False):
+def iter_script_links(targets, script_path, source_root, effective_source_root, only_genre, only_year, duplicates=None):
+    """
+    Like iter_links, but rows arrive grouped by folder and each new folder is flagged (about) once.
+    When two files want the same link the first one wins, as in reconcile_structure; the others are
+    appended to duplicates.
+    """
+    last_dir = {}
+    seen = set()
+    order_by = "year" if targets[0][1] == "year" else "title"
+    for target_dir, src, dest_dir, dest_link in iter_links(targets, script_path, source_root, effective_source_root, only_genre, only_year, order_by):
+        if dest_link in seen:
+            if duplicates is not None:
+                duplicates.append(dest_link)
             continue
-        # Use effective_source_root if provided, else fall back to source_root logic
-        if script_path and effective_source_root:
-            src = os.path.join(effective_source_root, movie["relative_path"])
-        elif script_path and source_root:
-            src = os.path.join(source_root, movie["relative_path"])
-        else:
-            src = movie["absolute_path"]
-        title = movie["title"]
-        year = movie["year"]
-        if mode == "title":
-            folder = sanitize_folder_name(f"{title} ({year})" if year else title)
-        elif mode == "year":
-            folder = str(year) if year else "Unknown"
-        else:
-            folder = sanitize_folder_name(title)
-        dest_dir = os.path.join(target_dir, folder)
-        # Use sanitized folder name as the symlink name (with extension from original file)
-        ext = os.path.splitext(os.path.basename(src))[1]
-        dest_link = os.path.join(dest_dir, f"{folder}{ext}")
-        if script_path:
-            mkdirs.add(dest_dir)
-            ln_commands.append(f"ln -s {bash_escape(src)} {bash_escape(dest_link)}")
-        else:
-            os.makedirs(dest_dir, exist_ok=True)
-            safe_symlink(src, dest_link, dry_run=dry_run)
-    if script_path:
-        with open(script_path, 'w') as f:
-            f.write('#!/bin/bash\n')
-            for d in sorted(mkdirs):
-                f.write(f"mkdir -p {bash_escape(d)}\n")
-            for cmd in ln_commands:
-                f.write(cmd + '\n')
-        console.print(f"[green]Bash script with mkdir and ln -s commands written to {script_path}[/green]")
+        seen.add(dest_link)
+        yield src, dest_dir, dest_link, dest_dir != last_dir.get(target_dir)
+        last_dir[target_dir] = dest_dir
+
+@perf.timed("build: write script")
+def write_ln_script(links, script_path):
+    """One mkdir per folder, written just before its links, as the rows arrive."""
+    count = 0
+    with open(script_path, 'w', buffering=WRITE_BUFFER) as f:
+        f.write('#!/bin/bash\n')
+        for src, dest_dir, dest_link, new_dir in links:
+            if new_dir:
+                f.write(f"mkdir -p {bash_escape(dest_dir)}\n")
+            f.write(f"ln -s {bash_escape(src)} {bash_escape(dest_link)}\n")
+            count += 1
+    return count
+
+@perf.timed("build: write script")
+def write_xargs_script(links, script_path):
+    """
+    NUL-separated folder and link lists next to the script, fed to a handful of xargs processes
+    instead of one process per link. Safe for any character in a path except NUL.
+    """
+    count = 0
+    with open(f"{script_path}.dirs", 'wb', buffering=WRITE_BUFFER) as dirs, open(f"{script_path}.links", 'wb', buffering=WRITE_BUFFER) as pairs:
+        for src, dest_dir, dest_link, new_dir in links:
+            if new_dir:
+                dirs.write(os.fsencode(dest_dir) + b"\0")
+            pairs.write(os.fsencode(src) + b"\0" + os.fsencode(dest_link) + b"\0")
+            count += 1
+    name = os.path.basename(script_path)
+    with open(script_path, 'w') as f:
+        f.write('#!/bin/bash\n')
+        f.write('set -e\n')
+        # The lists are found next to the script; relative link paths still resolve against the caller's directory
+        f.write('here="$(dirname "$0")"\n')
+        # -r: an empty list runs nothing, instead of a bare mkdir/ln that fails and stops the script
+        f.write(f"xargs -0 -r mkdir -p < \"$here\"/{bash_escape(name + '.dirs')}\n")
+        f.write(f"xargs -0 -r -n 2 -P {XARGS_PARALLEL} ln -s < \"$here\"/{bash_escape(name + '.links')}\n")
+    return count
+
+@perf.timed("build: write script")
+def write_tar_manifest(links, archive_path):
+    """A tar archive of the folders and symlinks; `tar -xf ARCHIVE -C /` recreates them in one process."""
+    count = 0
+    with tarfile.open(archive_path, 'w', bufsize=WRITE_BUFFER, format=tarfile.PAX_FORMAT) as tar:
+        now = time.time()
+        for src, dest_dir, dest_link, new_dir in links:
+            if new_dir:
+                info = tarfile.TarInfo(dest_dir.lstrip("/"))
+                info.type, info.mode, info.mtime = tarfile.DIRTYPE, 0o755, now
+                tar.addfile(info)
+            info = tarfile.TarInfo(dest_link.lstrip("/"))
+            info.type, info.linkname, info.mode, info.mtime = tarfile.SYMTYPE, src, 0o777, now
+            tar.addfile(info)
+            count += 1
+    return count
+
+def build_structure(target_dir: str, mode: str = "title", dry_run: bool = False, script_path: str = None, source_root: str = None, effective_source_root: str = None, only_genre: str = None, only_year: int = None, verify: bool = False, script_format: str = "ln", extra_targets: Optional[List[Tuple[str, str]]] = None, workers: int = FS_WORKERS):
+    """
+    Link the library into target_dir using layout `mode` (a name from layouts.LAYOUTS or a path template),
+    plus any extra (target_dir, layout) targets, all from one pass over the database.
+    """
+    targets = [(target_dir, mode)] + list(extra_targets or [])
+    try:
+        for _, layout in targets:
+            Layout(layout)
+    except ValueError as e:
+        console.print(f"[red]{e}[/red]")
+        return
+    if len({os.path.abspath(t) for t, _ in targets}) < len(targets):
+        console.print("[red]Each layout needs its own target directory.[/red]")
+        return
+    if not script_path:
+        reconcile_structure(targets, dry_run=dry_run, verify=verify, only_genre=only_genre, only_year=only_year, workers=workers)
+        return
+    if script_format not in SCRIPT_FORMATS:
+        console.print(f"[red]Unknown script format '{script_format}'. Use one of: {', '.join(SCRIPT_FORMATS)}.[/red]")
+        return
+    duplicates = []
+    links = iter_script_links(targets, script_path, source_root, effective_source_root, only_genre, only_year, duplicates)
+    if script_format == "ln":
+        count = write_ln_script(links, script_path)
+        console.print(f"[green]Bash script with mkdir and ln -s commands for {count} files written to {script_path}[/green]")
+    elif script_format == "xargs":
+        count = write_xargs_script(links, script_path)
+        console.print(f"[green]Bash script for {count} files written to {script_path} (keep {script_path}.dirs and {script_path}.links next to it)[/green]")
+    else:
+        count = write_tar_manifest(links, script_path)
+        # Member names are stored without the leading "/", so extract relative to the root
+        extract_dir = "/" if os.path.isabs(target_dir) else "."
+        console.print(f"[green]Tar manifest of {count} symlinks written to {script_path}. Recreate them with: tar -xf {script_path} -C {extract_dir}[/green]")
+    for link in duplicates[:DRY_RUN_EXAMPLES]:
+        console.print(f"[yellow]Collision: {link} is already linked to another file. Skipping.[/yellow]")
+    if len(duplicates) > DRY_RUN_EXAMPLES:
+        console.print(f"[yellow]... and {len(duplicates) - DRY_RUN_EXAMPLES} more collisions[/yellow]")
@@ -0,0 +1,90 @@
+import json
+import threading
+import time
+from typing import Any, Dict, Optional
+from urllib.parse import urlencode
+from db import transaction, query
+import perf
+
+# Responses older than this are refetched (seconds)
+CACHE_TTL = 30 * 24 * 3600
+# Least recently used entries are evicted above this many rows
+CACHE_MAX_ENTRIES = 50000
+
+# When offline, only cached responses are served and the network is never used
+offline = False
+
+stats = {"hits": 0, "misses": 0, "evictions": 0}
+# Lookups also run on the prefetch and fetch workers
+_stats_lock = threading.Lock()
+
+def configure(ttl: Optional[int] = None, max_entries: Optional[int] = None, offline_mode: Optional[bool] = None):
+    global CACHE_TTL, CACHE_MAX_ENTRIES, offline
+    if ttl is not None:
+        CACHE_TTL = ttl
+    if max_entries is not None:
+        CACHE_MAX_ENTRIES = max_entries
+    if offline_mode is not None:
+        offline = offline_mode
+
+def init_cache():
+    with transaction() as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS tmdb_cache (
+                key TEXT PRIMARY KEY,
+                response TEXT,
+                fetched_at REAL,
+                last_access REAL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_tmdb_cache_last_access ON tmdb_cache (last_access)')
+
+def make_key(endpoint: str, params: Optional[Dict[str, Any]] = None) -> str:
+    # The bearer token is deliberately not part of the key: responses are the same for every token
+    if not params:
+        return endpoint
+    return f"{endpoint}?{urlencode(sorted((k, str(v)) for k, v in params.items()))}"
+
+def cache_get(key: str) -> Optional[Any]:
+    rows = query('SELECT response, fetched_at FROM tmdb_cache WHERE key = ?', (key,))
+    now = time.time()
+    # Offline mode serves stale entries too: something is better than nothing
+    if not rows or (not offline and now - rows[0][1] > CACHE_TTL):
+        with _stats_lock:
+            stats["misses"] += 1
+        perf.count("cache misses")
+        return None
+    with transaction() as conn:
+        conn.execute('UPDATE tmdb_cache SET last_access = ? WHERE key = ?', (now, key))
+    with _stats_lock:
+        stats["hits"] += 1
+    perf.count("cache hits")
+    return json.loads(rows[0][0])
+
+def cache_put(key: str, value: Any):
+    now = time.time()
+    with transaction() as conn:
+        conn.execute('''
+            INSERT OR REPLACE INTO tmdb_cache (key, response, fetched_at, last_access)
+            VALUES (?, ?, ?, ?)
+        ''', (key, json.dumps(value, separators=(",", ":")), now, now))
+        excess = conn.execute('SELECT COUNT(*) FROM tmdb_cache').fetchone()[0] - CACHE_MAX_ENTRIES
+        if excess > 0:
+            conn.execute('''
+                DELETE FROM tmdb_cache WHERE key IN (
+                    SELECT key FROM tmdb_cache ORDER BY last_access LIMIT ?
+                )
+            ''', (excess,))
+            with _stats_lock:
+                stats["evictions"] += excess
+
+def clear_cache():
+    with transaction() as conn:
+        conn.execute('DELETE FROM tmdb_cache')
+
+def cache_summary() -> str:
+    with _stats_lock:
+        hits, misses, evictions = stats["hits"], stats["misses"], stats["evictions"]
+    total = hits + misses
+    ratio = (hits / total * 100) if total else 0.0
+    return f"TMDb cache: {hits} hits, {misses} misses ({ratio:.0f}% hit rate), {evictions} evicted"
@@ -1,80 +1,798 @@
+import atexit
+import json
+import os
 import sqlite3
-from typing import Optional, Dict, Any, List
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List, Iterable, Iterator, Tuple
+import perf
 
 DB_FILE = "movie_organiser.db"
 
+# Version 1: films/files/genres replace the single movies table (see migrate_movies_table)
+# Version 2: scan_queue replaces pending_matches (see migrate_pending_matches)
+# Version 3: scan_queue keeps the identity (size, mtime, inode, device) a file was found with
+SCHEMA_VERSION = 3
+
+# Columns of the old movies table, still the shape of add_movie/update_movie/get_all_movies
+FILE_COLUMNS = ("relative_path", "tmdb_id", "skip", "size", "mtime", "inode", "device")
+FILM_COLUMNS = ("title", "year", "genres", "metadata")
+MOVIE_COLUMNS = ("absolute_path",) + FILE_COLUMNS + FILM_COLUMNS
+
+# States of a file in the scan queue, in the order a scan moves it through them
+QUEUE_DISCOVERED = "discovered"
+QUEUE_FETCHED = "candidates-fetched"
+QUEUE_PENDING = "pending-decision"
+QUEUE_MATCHED = "matched"
+QUEUE_IGNORED = "ignored"
+QUEUE_STATES = (QUEUE_DISCOVERED, QUEUE_FETCHED, QUEUE_PENDING, QUEUE_MATCHED, QUEUE_IGNORED)
+
+# One connection for the whole process, shared by every thread. All access goes
+# through _lock; transaction() nests, and only the outermost level commits.
+_conn = None
+_conn_file = None
+_lock = threading.RLock()
+_depth = 0
+
+def get_connection() -> sqlite3.Connection:
+    global _conn, _conn_file
+    with _lock:
+        if _conn is not None and _conn_file != DB_FILE:
+            close_db()
+        if _conn is None:
+            # isolation_level=None: no implicit transactions, transaction() issues BEGIN/COMMIT itself
+            _conn = sqlite3.connect(DB_FILE, check_same_thread=False, isolation_level=None)
+            _conn.execute('PRAGMA journal_mode=WAL')
+            _conn.execute('PRAGMA synchronous=NORMAL')  # Durable at checkpoints, no fsync per commit
+            _conn.execute('PRAGMA temp_store=MEMORY')
+            _conn.execute('PRAGMA cache_size=-16000')  # 16 MB page cache
+            _conn.execute('PRAGMA busy_timeout=5000')
+            _conn.execute('PRAGMA foreign_keys=ON')
+            _conn_file = DB_FILE
+        return _conn
+
+def close_db():
+    global _conn, _conn_file
+    with _lock:
+        if _conn is not None:
+            _conn.close()
+        _conn = None
+        _conn_file = None
+
+atexit.register(close_db)
+
+@contextmanager
+def transaction():
+    """
+    Run several statements in one transaction:
+
+        with transaction() as conn:
+            conn.execute(...)
+
+    Nested uses join the outer transaction. Other threads wait until it is committed.
+    """
+    global _depth
+    with _lock:
+        conn = get_connection()
+        if _depth == 0:
+            started = time.perf_counter()
+            conn.execute('BEGIN')
+        _depth += 1
+        try:
+            yield conn
+        except BaseException:
+            _depth -= 1
+            if _depth == 0:
+                conn.execute('ROLLBACK')
+            raise
+        _depth -= 1
+        if _depth == 0:
+            conn.execute('COMMIT')
+            if perf.enabled:
+                perf.record("db write", started, time.perf_counter())
+
+def query(sql: str, params: Iterable[Any] = ()) -> List[tuple]:
+    with _lock:
+        return get_connection().execute(sql, tuple(params)).fetchall()
+
+def pack_metadata(metadata: Optional[str]) -> Optional[bytes]:
+    """TMDb JSON as stored in films.metadata: minified and zlib-compressed."""
+    if not metadata:
+        return None
+    try:
+        metadata = json.dumps(json.loads(metadata), separators=(",", ":"))
+    except ValueError:
+        pass  # Not JSON: store as given
+    return zlib.compress(metadata.encode("utf-8"))
+
+def unpack_metadata(blob) -> Optional[str]:
+    if blob is None:
+        return None
+    if isinstance(blob, str):
+        return blob
+    return zlib.decompress(blob).decode("utf-8")
+
+def split_genres(genres: Optional[str]) -> List[str]:
+    return [g.strip() for g in (genres or "").split(",") if g.strip()]
+
 def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS movies (
-            absolute_path TEXT PRIMARY KEY,
-            relative_path TEXT,
-            tmdb_id INTEGER,
-            title TEXT,
-            year INTEGER,
-            genres TEXT,
-            metadata TEXT,
-            skip INTEGER DEFAULT 0
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS films (
+                tmdb_id INTEGER PRIMARY KEY,
+                title TEXT,
+                year INTEGER,
+                metadata BLOB,
+                fetched_at REAL
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS files (
+                absolute_path TEXT PRIMARY KEY,
+                relative_path TEXT,
+                tmdb_id INTEGER REFERENCES films (tmdb_id),
+                skip INTEGER DEFAULT 0,
+                size INTEGER,
+                mtime REAL,
+                inode INTEGER,
+                device INTEGER
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS genres (
+                id INTEGER PRIMARY KEY,
+                name TEXT UNIQUE
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS film_genres (
+                tmdb_id INTEGER REFERENCES films (tmdb_id),
+                genre_id INTEGER REFERENCES genres (id),
+                position INTEGER,
+                PRIMARY KEY (tmdb_id, genre_id)
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_files_tmdb_id ON files (tmdb_id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_files_skip ON files (skip)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_films_year ON films (year)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_film_genres_genre ON film_genres (genre_id)')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS scanned_dirs (
+                path TEXT PRIMARY KEY,
+                mtime REAL
+            )
+        ''')
+        # Every file a scan has found, and how far it got: the checkpoint an interrupted scan resumes from.
+        # candidates: packed {"results", "details"} once fetched; ranked: packed [{"score", "movie"}] awaiting a decision.
+        # Both are dropped once the file is matched or ignored; the row stays so the file is never queued again.
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS scan_queue (
+                absolute_path TEXT PRIMARY KEY,
+                relative_path TEXT,
+                state TEXT NOT NULL,
+                title_guess TEXT,
+                year_guess INTEGER,
+                candidates BLOB,
+                ranked BLOB,
+                best_score REAL,
+                error TEXT,
+                updated_at REAL,
+                size INTEGER,
+                mtime REAL,
+                inode INTEGER,
+                device INTEGER
+            )
+        ''')
+        queue_columns = {row[1] for row in conn.execute('PRAGMA table_info(scan_queue)')}
+        for column, kind in (("size", "INTEGER"), ("mtime", "REAL"), ("inode", "INTEGER"), ("device", "INTEGER")):
+            if column not in queue_columns:
+                conn.execute(f'ALTER TABLE scan_queue ADD COLUMN {column} {kind}')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_scan_queue_state ON scan_queue (state, absolute_path)')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS build_manifest (
+                target_dir TEXT,
+                link_path TEXT,
+                source TEXT,
+                PRIMARY KEY (target_dir, link_path)
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS build_state (
+                target_dir TEXT PRIMARY KEY,
+                options TEXT,
+                library_version INTEGER
+            )
+        ''')
+        # Content hashes for duplicate detection, valid while size and mtime are unchanged
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS file_hashes (
+                path TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime REAL,
+                partial_hash TEXT,
+                full_hash TEXT
+            )
+        ''')
+        # What probe.py read from the container headers, valid while size and mtime are unchanged.
+        # Rows with only size and mtime mark files whose format could not be read.
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS media_info (
+                absolute_path TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime REAL,
+                duration REAL,
+                width INTEGER,
+                height INTEGER,
+                video_codec TEXT,
+                audio_languages TEXT
+            )
+        ''')
+        # Bumped by triggers on every change to what a build reads, so an unchanged library is detected in O(1)
+        conn.execute('CREATE TABLE IF NOT EXISTS library_version (version INTEGER)')
+        if conn.execute('SELECT COUNT(*) FROM library_version').fetchone()[0] == 0:
+            conn.execute('INSERT INTO library_version (version) VALUES (0)')
+        for table in ("files", "films", "film_genres"):
+            for event in ("INSERT", "UPDATE", "DELETE"):
+                conn.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS bump_library_version_{table}_{event.lower()}
+                    AFTER {event} ON {table}
+                    BEGIN UPDATE library_version SET version = version + 1; END
+                ''')
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'movies'").fetchone():
+            migrate_movies_table(conn)
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'pending_matches'").fetchone():
+            migrate_pending_matches(conn)
+        conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+def migrate_movies_table(conn: sqlite3.Connection):
+    """Move rows of the old single `movies` table (one row per file, genres comma-joined) to films/files/genres."""
+    existing = {row[1] for row in conn.execute('PRAGMA table_info(movies)')}
+    identity = [c if c in existing else 'NULL' for c in ("size", "mtime", "inode", "device")]
+    rows = conn.execute(f'''
+        SELECT absolute_path, relative_path, tmdb_id, title, year, genres, metadata, skip, {", ".join(identity)}
+        FROM movies
+    ''').fetchall()
+    add_movies(rows)
+    conn.execute('DROP TABLE movies')
+
+def migrate_pending_matches(conn: sqlite3.Connection):
+    """Move the files scan --auto left for review from the old pending_matches table into scan_queue."""
+    rows = conn.execute('SELECT absolute_path, relative_path, title_guess, year_guess, candidates, best_score FROM pending_matches').fetchall()
+    save_queue_items(
+        (path, rel, QUEUE_PENDING, title, year, None, ranked, score, None)
+        for path, rel, title, year, ranked, score in rows
+    )
+    conn.execute('DROP TABLE pending_matches')
+
+def _upsert_films(conn: sqlite3.Connection, films: Dict[int, Tuple[str, int, str, str]]):
+    """films: tmdb_id -> (title, year, genres, metadata). Genres are only replaced when given."""
+    now = time.time()
+    conn.executemany('''
+        INSERT INTO films (tmdb_id, title, year, metadata, fetched_at) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (tmdb_id) DO UPDATE SET
+            title = excluded.title,
+            year = excluded.year,
+            metadata = COALESCE(excluded.metadata, films.metadata),
+            fetched_at = CASE WHEN excluded.metadata IS NULL THEN films.fetched_at ELSE excluded.fetched_at END
+    ''', [(tmdb_id, title, year, pack_metadata(metadata), now if metadata else None) for tmdb_id, (title, year, _, metadata) in films.items()])
+    with_genres = {tmdb_id: split_genres(f[2]) for tmdb_id, f in films.items() if split_genres(f[2])}
+    if not with_genres:
+        return
+    names = {g for genres in with_genres.values() for g in genres}
+    conn.executemany('INSERT OR IGNORE INTO genres (name) VALUES (?)', [(n,) for n in names])
+    genre_ids = dict(conn.execute(
+        f"SELECT name, id FROM genres WHERE name IN ({', '.join('?' * len(names))})", tuple(names)
+    ).fetchall())
+    conn.executemany('DELETE FROM film_genres WHERE tmdb_id = ?', [(t,) for t in with_genres])
+    conn.executemany(
+        'INSERT OR IGNORE INTO film_genres (tmdb_id, genre_id, position) VALUES (?, ?, ?)',
+        [(tmdb_id, genre_ids[g], pos) for tmdb_id, genres in with_genres.items() for pos, g in enumerate(genres)]
+    )
+
+def update_films(films: Dict[int, Tuple[str, int, str, str]]):
+    """Replace the details of existing films: tmdb_id -> (title, year, genres, metadata), in one transaction."""
+    with transaction() as conn:
+        _upsert_films(conn, films)
+
+def get_films_to_refresh(fetched_before: Optional[float] = None) -> List[Tuple[int, str]]:
+    """
+    (tmdb_id, reason) of linked films with no metadata or (with fetched_before) fetched before that
+    timestamp. Each film is listed once however many files it has. Films without genres are not listed:
+    TMDb has none for some films, so an empty genre list is not a sign of missing details.
+    """
+    sql = '''
+        SELECT m.tmdb_id, CASE WHEN m.metadata IS NULL THEN 'missing' ELSE 'stale' END
+        FROM films m
+        WHERE EXISTS (SELECT 1 FROM files f WHERE f.tmdb_id = m.tmdb_id)
+          AND (m.metadata IS NULL OR COALESCE(m.fetched_at, 0) < ?)
+        ORDER BY m.tmdb_id
+    '''
+    return query(sql, (fetched_before if fetched_before is not None else float("-inf"),))
+
+def iter_film_metadata() -> Iterator[Tuple[int, Optional[str]]]:
+    """(tmdb_id, metadata JSON) of every linked film, streamed."""
+    for tmdb_id, blob in iter_query('''
+        SELECT m.tmdb_id, m.metadata FROM films m
+        WHERE m.metadata IS NOT NULL AND EXISTS (SELECT 1 FROM files f WHERE f.tmdb_id = m.tmdb_id)
+    '''):
+        yield tmdb_id, unpack_metadata(blob)
 
 def add_movie(absolute_path: str, relative_path: str, tmdb_id: int, title: str, year: int, genres: str, metadata: str, skip: int = 0):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('''
-        INSERT OR REPLACE INTO movies (absolute_path, relative_path, tmdb_id, title, year, genres, metadata, skip)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (absolute_path, relative_path, tmdb_id, title, year, genres, metadata, skip))
-    conn.commit()
-    conn.close()
+    add_movies([(absolute_path, relative_path, tmdb_id, title, year, genres, metadata, skip)])
+
+def add_movies(rows: Iterable[Tuple]):
+    """
+    Bulk add_movie: rows are (absolute_path, relative_path, tmdb_id, title, year, genres, metadata, skip)
+    tuples, optionally followed by (size, mtime, inode, device).
+    """
+    rows = list(rows)
+    films: Dict[int, Tuple[str, int, str, str]] = {}
+    for r in rows:
+        if r[2] is None:
+            continue
+        # Several files of one film: do not let a row without genres/metadata blank out another's
+        previous = films.get(r[2], (None, None, "", None))
+        films[r[2]] = (r[3], r[4], r[5] or previous[2], r[6] or previous[3])
+    with transaction() as conn:
+        _upsert_films(conn, films)
+        conn.executemany('''
+            INSERT INTO files (absolute_path, relative_path, tmdb_id, skip, size, mtime, inode, device)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (absolute_path) DO UPDATE SET
+                relative_path = excluded.relative_path,
+                tmdb_id = excluded.tmdb_id,
+                skip = excluded.skip,
+                size = COALESCE(excluded.size, files.size),
+                mtime = COALESCE(excluded.mtime, files.mtime),
+                inode = COALESCE(excluded.inode, files.inode),
+                device = COALESCE(excluded.device, files.device)
+        ''', [(r[0], r[1], r[2], r[7] or 0, *(tuple(r[8:12]) + (None,) * (12 - max(len(r), 8)))) for r in rows])
+        # A file matched from the scan queue gets the identity it was found with, so later scans can tell it moved
+        conn.executemany('''
+            UPDATE files SET (size, mtime, inode, device) = (
+                SELECT size, mtime, inode, device FROM scan_queue WHERE absolute_path = ?1
+            )
+            WHERE absolute_path = ?1 AND size IS NULL
+                AND EXISTS (SELECT 1 FROM scan_queue WHERE absolute_path = ?1 AND size IS NOT NULL)
+        ''', [(r[0],) for r in rows if len(r) < 9 or r[8] is None])
+
+MOVIE_SELECT = '''
+    SELECT f.absolute_path, f.relative_path, f.tmdb_id, m.title, m.year,
+           (SELECT group_concat(name, ', ') FROM (
+                SELECT g.name FROM film_genres fg JOIN genres g ON g.id = fg.genre_id
+                WHERE fg.tmdb_id = f.tmdb_id ORDER BY fg.position)),
+           m.metadata, f.skip
+    FROM files f LEFT JOIN films m ON m.tmdb_id = f.tmdb_id
+'''
+
+def _movie_dict(row) -> Dict[str, Any]:
+    return {
+        "absolute_path": row[0],
+        "relative_path": row[1],
+        "tmdb_id": row[2],
+        "title": row[3],
+        "year": row[4],
+        "genres": row[5] or "",
+        "metadata": unpack_metadata(row[6]),
+        "skip": bool(row[7])
+    }
 
 def get_all_movies() -> List[Dict[str, Any]]:
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('SELECT absolute_path, relative_path, tmdb_id, title, year, genres, metadata, skip FROM movies')
-    rows = c.fetchall()
-    conn.close()
+    return [_movie_dict(row) for row in query(MOVIE_SELECT)]
+
+def get_movie(absolute_path: str) -> Optional[Dict[str, Any]]:
+    rows = query(MOVIE_SELECT + ' WHERE f.absolute_path = ?', (absolute_path,))
+    return _movie_dict(rows[0]) if rows else None
+
+def get_duplicate_groups() -> List[Tuple[int, str, List[Dict[str, Any]]]]:
+    """(tmdb_id, title, [movie, ...]) for every film with more than one file, via the tmdb_id index."""
+    rows = query(MOVIE_SELECT + '''
+        WHERE f.tmdb_id IN (SELECT tmdb_id FROM files WHERE tmdb_id IS NOT NULL GROUP BY tmdb_id HAVING COUNT(*) > 1)
+        ORDER BY f.tmdb_id, f.absolute_path
+    ''')
+    groups: Dict[int, List[Dict[str, Any]]] = {}
+    for row in rows:
+        groups.setdefault(row[2], []).append(_movie_dict(row))
+    return [(tmdb_id, group[0]["title"], group) for tmdb_id, group in groups.items()]
+
+def get_duplicate_file_groups() -> List[Tuple[int, str, List[Tuple[str, Optional[int], Optional[float], int]]]]:
+    """
+    Lean get_duplicate_groups for policies: (tmdb_id, title, [(absolute_path, size, mtime, skip), ...]),
+    read in one ordered pass over the tmdb_id index without touching metadata.
+    """
+    rows = query('''
+        SELECT f.tmdb_id, m.title, f.absolute_path, f.size, f.mtime, f.skip
+        FROM files f LEFT JOIN films m ON m.tmdb_id = f.tmdb_id
+        WHERE f.tmdb_id IN (SELECT tmdb_id FROM files WHERE tmdb_id IS NOT NULL GROUP BY tmdb_id HAVING COUNT(*) > 1)
+        ORDER BY f.tmdb_id, f.absolute_path
+    ''')
+    groups: Dict[int, Tuple[str, list]] = {}
+    for tmdb_id, title, *file in rows:
+        groups.setdefault(tmdb_id, (title, []))[1].append(tuple(file))
+    return [(tmdb_id, title, files) for tmdb_id, (title, files) in groups.items()]
+
+def iter_query(sql: str, params: Iterable[Any] = (), batch_size: int = 1000) -> Iterator[tuple]:
+    """
+    Stream the rows of a SELECT in batches instead of materialising them all.
+    Other threads cannot use the database until the iterator is exhausted or closed.
+    """
+    with _lock:
+        cursor = get_connection().execute(sql, tuple(params))
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cursor.close()
+
+def iter_build_rows(genre: Optional[str] = None, year: Optional[int] = None, order_by: Optional[str] = None, details: bool = False) -> Iterator[tuple]:
+    """
+    (absolute_path, relative_path, title, year, tmdb_id) of matched, non-skipped files, optionally filtered,
+    streamed from the database. With details, each row also carries the film's genres and packed metadata.
+    order_by "title" or "year" keeps rows of one folder together.
+    """
+    columns = 'f.absolute_path, f.relative_path, m.title, m.year, f.tmdb_id'
+    if details:
+        columns += """,
+            (SELECT group_concat(name, ', ') FROM (
+                SELECT g.name FROM film_genres fg JOIN genres g ON g.id = fg.genre_id
+                WHERE fg.tmdb_id = f.tmdb_id ORDER BY fg.position)),
+            m.metadata"""
+    sql = f'''
+        SELECT {columns}
+        FROM files f JOIN films m ON m.tmdb_id = f.tmdb_id
+        WHERE f.skip = 0
+    '''
+    params: List[Any] = []
+    if year is not None:
+        sql += ' AND m.year = ?'
+        params.append(year)
+    if genre is not None:
+        sql += ''' AND f.tmdb_id IN (
+            SELECT fg.tmdb_id FROM film_genres fg JOIN genres g ON g.id = fg.genre_id WHERE g.name = ? COLLATE NOCASE)'''
+        params.append(genre)
+    if order_by == "title":
+        sql += ' ORDER BY m.title, m.year'
+    elif order_by == "year":
+        sql += ' ORDER BY m.year, m.title'
+    yield from iter_query(sql, params)
+
+def get_file_index() -> Dict[str, Tuple[Optional[int], Optional[float], Optional[int], Optional[int]]]:
+    """absolute_path -> (size, mtime, inode, device) for every recorded file, without loading metadata."""
+    return {row[0]: row[1:] for row in query('SELECT absolute_path, size, mtime, inode, device FROM files')}
+
+def move_movie(old_absolute_path: str, absolute_path: str, relative_path: str):
+    with transaction() as conn:
+        conn.execute(
+            'UPDATE files SET absolute_path = ?, relative_path = ? WHERE absolute_path = ?',
+            (absolute_path, relative_path, old_absolute_path)
+        )
+        conn.execute(
+            'UPDATE OR REPLACE scan_queue SET absolute_path = ?, relative_path = ? WHERE absolute_path = ?',
+            (absolute_path, relative_path, old_absolute_path)
+        )
+
+def get_scanned_dirs() -> Dict[str, float]:
+    return dict(query('SELECT path, mtime FROM scanned_dirs'))
+
+def set_scanned_dirs(dirs: Iterable[Tuple[str, float]]):
+    """Record (path, mtime) of directories whose video files are all recorded."""
+    with transaction() as conn:
+        conn.executemany('INSERT OR REPLACE INTO scanned_dirs (path, mtime) VALUES (?, ?)', dirs)
+
+def reset_db():
+    with transaction() as conn:
+        for table in ("film_genres", "genres", "files", "films", "movies", "pending_matches", "scan_queue", "scanned_dirs",
+                      "build_manifest", "build_state", "library_version", "file_hashes",
+                      "media_info"):
+            conn.execute(f'DROP TABLE IF EXISTS {table}')
+        init_db()
+
+def get_file_hashes(paths: Iterable[str]) -> Dict[str, Tuple[int, float, Optional[str], Optional[str]]]:
+    """path -> (size, mtime, partial_hash, full_hash) of the cached hashes of paths."""
+    paths = list(paths)
+    hashes = {}
+    # Chunked to stay under SQLite's variable limit
+    for i in range(0, len(paths), 500):
+        chunk = paths[i:i + 500]
+        hashes.update((row[0], row[1:]) for row in query(
+            f"SELECT path, size, mtime, partial_hash, full_hash FROM file_hashes WHERE path IN ({', '.join('?' * len(chunk))})", chunk
+        ))
+    return hashes
+
+def save_file_hashes(rows: Iterable[Tuple[str, int, float, Optional[str], Optional[str]]]):
+    """Cache (path, size, mtime, partial_hash, full_hash) rows; a missing full hash keeps one already known for the same size and mtime."""
+    with transaction() as conn:
+        conn.executemany('''
+            INSERT INTO file_hashes (path, size, mtime, partial_hash, full_hash) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (path) DO UPDATE SET
+                full_hash = CASE WHEN file_hashes.size = excluded.size AND file_hashes.mtime = excluded.mtime
+                                 THEN COALESCE(excluded.full_hash, file_hashes.full_hash) ELSE excluded.full_hash END,
+                size = excluded.size,
+                mtime = excluded.mtime,
+                partial_hash = excluded.partial_hash
+        ''', rows)
+
+REVIEW_COLUMNS = 'f.absolute_path, f.tmdb_id, m.title, f.skip, COALESCE(f.size, mi.size), mi.duration, mi.width, mi.height, mi.video_codec'
+REVIEW_FROM = 'files f LEFT JOIN films m ON m.tmdb_id = f.tmdb_id LEFT JOIN media_info mi ON mi.absolute_path = f.absolute_path'
+
+def _review_filter(search: Optional[str], unmatched: bool, skipped: bool) -> Tuple[str, List[Any]]:
+    clauses, params = ['1'], []
+    if search:
+        # Plain substring match; LIKE is case-insensitive for ASCII
+        clauses.append("(m.title LIKE ? ESCAPE '\\' OR f.absolute_path LIKE ? ESCAPE '\\')")
+        pattern = "%" + search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        params += [pattern, pattern]
+    if unmatched:
+        clauses.append('f.tmdb_id IS NULL')
+    if skipped:
+        clauses.append('f.skip = 1')
+    return ' AND '.join(clauses), params
+
+def get_review_page(after: Optional[str] = None, limit: int = 50, search: Optional[str] = None,
+                    unmatched: bool = False, skipped: bool = False) -> List[tuple]:
+    """
+    One page of (absolute_path, tmdb_id, title, skip, size, duration, width, height, video_codec) ordered by path,
+    starting after `after`.
+    Keyset paging on the primary key, so every page costs the same however deep it is.
+    """
+    where, params = _review_filter(search, unmatched, skipped)
+    if after is not None:
+        where += ' AND f.absolute_path > ?'
+        params.append(after)
+    return query(f'''
+        SELECT {REVIEW_COLUMNS} FROM {REVIEW_FROM}
+        WHERE {where} ORDER BY f.absolute_path LIMIT ?
+    ''', params + [limit])
+
+def count_review_rows(search: Optional[str] = None, unmatched: bool = False, skipped: bool = False) -> int:
+    where, params = _review_filter(search, unmatched, skipped)
+    return query(f'SELECT COUNT(*) FROM files f LEFT JOIN films m ON m.tmdb_id = f.tmdb_id WHERE {where}', params)[0][0]
+
+def get_review_row(absolute_path: str) -> Optional[tuple]:
+    rows = query(f'SELECT {REVIEW_COLUMNS} FROM {REVIEW_FROM} WHERE f.absolute_path = ?', (absolute_path,))
+    return rows[0] if rows else None
+
+def set_skip_flag_where(skip: bool, search: Optional[str] = None, unmatched: bool = False, skipped: bool = False) -> int:
+    """Set the skip flag of every file matching a review filter in one statement. Returns the number changed."""
+    where, params = _review_filter(search, unmatched, skipped)
+    with transaction() as conn:
+        return conn.execute(f'''
+            UPDATE files SET skip = ? WHERE skip != ? AND absolute_path IN (
+                SELECT f.absolute_path FROM files f LEFT JOIN films m ON m.tmdb_id = f.tmdb_id WHERE {where})
+        ''', [int(skip), int(skip)] + params).rowcount
+
+def get_media_info(paths: Iterable[str]) -> Dict[str, Tuple]:
+    """absolute_path -> (size, mtime, duration, width, height, video_codec, audio_languages) of probed files."""
+    paths = list(paths)
+    info = {}
+    for i in range(0, len(paths), 500):
+        chunk = paths[i:i + 500]
+        info.update((row[0], row[1:]) for row in query(
+            f"""SELECT absolute_path, size, mtime, duration, width, height, video_codec, audio_languages
+                FROM media_info WHERE absolute_path IN ({', '.join('?' * len(chunk))})""", chunk
+        ))
+    return info
+
+def save_media_info(rows: Iterable[Tuple[str, int, float, Any]]):
+    """Record (absolute_path, size, mtime, probe.MediaInfo or None) rows."""
+    with transaction() as conn:
+        conn.executemany(
+            'INSERT OR REPLACE INTO media_info VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            [
+                (path, size, mtime, *(
+                    (info.duration, info.width, info.height, info.video_codec, ", ".join(info.audio_languages))
+                    if info else (None, None, None, None, None)
+                ))
+                for path, size, mtime, info in rows
+            ]
+        )
+
+def get_files_by_path(paths: Iterable[str]) -> Dict[str, Tuple[Optional[int], Optional[str], int]]:
+    """absolute_path -> (tmdb_id, title, skip) for the paths recorded in the database."""
+    paths = list(paths)
+    files = {}
+    for i in range(0, len(paths), 500):
+        chunk = paths[i:i + 500]
+        files.update((row[0], row[1:]) for row in query(
+            f"""SELECT f.absolute_path, f.tmdb_id, m.title, f.skip FROM files f LEFT JOIN films m ON m.tmdb_id = f.tmdb_id
+                WHERE f.absolute_path IN ({', '.join('?' * len(chunk))})""", chunk
+        ))
+    return files
+
+def get_all_file_paths() -> List[str]:
+    return [row[0] for row in query('SELECT absolute_path FROM files')]
+
+def set_skip_flag(absolute_path: str, skip: bool):
+    set_skip_flags([(absolute_path, skip)])
+
+def set_skip_flags(flags: Iterable[Tuple[str, bool]]):
+    """Bulk set_skip_flag: flags are (absolute_path, skip) pairs, applied in one transaction."""
+    with transaction() as conn:
+        conn.executemany(
+            'UPDATE files SET skip = ? WHERE absolute_path = ?',
+            ((1 if skip else 0, absolute_path) for absolute_path, skip in flags)
+        )
+
+def update_movie(absolute_path: str, **kwargs):
+    update_movies([(absolute_path, kwargs)])
+
+def update_movies(updates: Iterable[Tuple[str, Dict[str, Any]]]):
+    """
+    Bulk update_movie: updates are (absolute_path, {column: value}) pairs, applied in one transaction.
+    Film columns (title, year, genres, metadata) update the file's film, after any tmdb_id change.
+    A tmdb_id without film columns gets an empty films row if it has none yet.
+    """
+    file_updates: Dict[Tuple[str, ...], List[list]] = {}
+    film_updates = []
+    new_ids = set()
+    for absolute_path, fields in updates:
+        for k in fields:
+            if k not in MOVIE_COLUMNS:
+                raise ValueError(f"Unknown movies column: {k}")
+        file_fields = tuple(k for k in fields if k in FILE_COLUMNS)
+        if file_fields:
+            # executemany needs one statement per distinct set of columns
+            file_updates.setdefault(file_fields, []).append([fields[k] for k in file_fields] + [absolute_path])
+        if any(k in FILM_COLUMNS for k in fields):
+            film_updates.append((absolute_path, fields))
+        elif fields.get("tmdb_id") is not None:
+            new_ids.add(fields["tmdb_id"])
+    with transaction() as conn:
+        # files.tmdb_id references films, so the film must exist before the file points at it
+        conn.executemany('INSERT OR IGNORE INTO films (tmdb_id) VALUES (?)', [(i,) for i in new_ids])
+        for absolute_path, fields in film_updates:
+            tmdb_id = fields.get("tmdb_id")
+            if tmdb_id is None:
+                row = conn.execute('SELECT tmdb_id FROM files WHERE absolute_path = ?', (absolute_path,)).fetchone()
+                tmdb_id = row[0] if row else None
+            if tmdb_id is None:
+                continue  # Film columns of an unmatched file: nothing to attach them to
+            current = conn.execute('SELECT title, year, metadata FROM films WHERE tmdb_id = ?', (tmdb_id,)).fetchone() or (None, None, None)
+            _upsert_films(conn, {tmdb_id: (
+                fields.get("title", current[0]),
+                fields.get("year", current[1]),
+                fields.get("genres", ""),
+                fields["metadata"] if "metadata" in fields else unpack_metadata(current[2]),
+            )})
+        for keys, values in file_updates.items():
+            conn.executemany(f"UPDATE files SET {', '.join(f'{k}=?' for k in keys)} WHERE absolute_path=?", values)
+
+def get_library_version() -> int:
+    return query('SELECT version FROM library_version')[0][0]
+
+def get_build_state(target_dir: str) -> Optional[Tuple[str, int]]:
+    """(options, library_version) of the last build into target_dir, or None."""
+    rows = query('SELECT options, library_version FROM build_state WHERE target_dir = ?', (target_dir,))
+    return rows[0] if rows else None
+
+def get_build_manifest(target_dir: str) -> Dict[str, str]:
+    """link path -> source of every link the last build created in target_dir."""
+    return dict(query('SELECT link_path, source FROM build_manifest WHERE target_dir = ?', (target_dir,)))
+
+def save_build(target_dir: str, options: str, library_version: int, created: Dict[str, str], removed: Iterable[str]):
+    """Apply a build's changes to the manifest of target_dir and remember what it was built from."""
+    with transaction() as conn:
+        conn.executemany('DELETE FROM build_manifest WHERE target_dir = ? AND link_path = ?', ((target_dir, p) for p in removed))
+        conn.executemany(
+            'INSERT OR REPLACE INTO build_manifest (target_dir, link_path, source) VALUES (?, ?, ?)',
+            ((target_dir, link, source) for link, source in created.items())
+        )
+        conn.execute(
+            'INSERT OR REPLACE INTO build_state (target_dir, options, library_version) VALUES (?, ?, ?)',
+            (target_dir, options, library_version)
+        )
+
+def queue_files(rows: Iterable[Tuple]):
+    """
+    Queue newly found files as discovered: rows are (absolute_path, relative_path) tuples, optionally
+    followed by (size, mtime, inode, device). Files already queued keep their state.
+    """
+    now = time.time()
+    with transaction() as conn:
+        conn.executemany('''
+            INSERT OR IGNORE INTO scan_queue (absolute_path, relative_path, state, updated_at, size, mtime, inode, device)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', ((r[0], r[1], QUEUE_DISCOVERED, now, *(tuple(r[2:6]) + (None,) * (6 - max(len(r), 2)))) for r in rows))
+
+def save_queue_items(rows: Iterable[Tuple]):
+    """
+    Record scan progress: rows are (absolute_path, relative_path, state, title_guess, year_guess, candidates,
+    ranked, best_score, error) tuples, candidates and ranked as JSON text (or None).
+    """
+    now = time.time()
+    with transaction() as conn:
+        # An upsert, not INSERT OR REPLACE, so the identity recorded by queue_files survives
+        conn.executemany('''
+            INSERT INTO scan_queue
+                (absolute_path, relative_path, state, title_guess, year_guess, candidates, ranked, best_score, error, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (absolute_path) DO UPDATE SET
+                relative_path = excluded.relative_path, state = excluded.state, title_guess = excluded.title_guess,
+                year_guess = excluded.year_guess, candidates = excluded.candidates, ranked = excluded.ranked,
+                best_score = excluded.best_score, error = excluded.error, updated_at = excluded.updated_at
+        ''', (
+            (path, rel, state, title, year, pack_metadata(candidates), pack_metadata(ranked), score, error, now)
+            for path, rel, state, title, year, candidates, ranked, score, error in rows
+        ))
+
+def set_queue_state(absolute_path: str, state: str):
+    set_queue_states([(absolute_path, state)])
+
+def set_queue_states(states: Iterable[Tuple[str, str]]):
+    """(absolute_path, state) pairs. Candidates are dropped once a file is decided (matched or ignored)."""
+    now = time.time()
+    with transaction() as conn:
+        conn.executemany('''
+            UPDATE scan_queue SET state = ?1, updated_at = ?2,
+                candidates = CASE WHEN ?1 IN (?4, ?5) THEN NULL ELSE candidates END,
+                ranked = CASE WHEN ?1 IN (?4, ?5) THEN NULL ELSE ranked END
+            WHERE absolute_path = ?3
+        ''', ((state, now, path, QUEUE_MATCHED, QUEUE_IGNORED) for path, state in states))
+
+def forget_queued(paths: Iterable[str]):
+    with transaction() as conn:
+        conn.executemany('DELETE FROM scan_queue WHERE absolute_path = ?', ((p,) for p in paths))
+
+def get_queued_paths() -> List[str]:
+    return [row[0] for row in query('SELECT absolute_path FROM scan_queue')]
+
+def _under(root: Optional[str]) -> Tuple[str, List[Any]]:
+    # Paths below root, by prefix: no LIKE, so "_" and "%" in folder names need no escaping
+    if not root:
+        return "1", []
+    prefix = os.path.join(os.path.abspath(root), "")
+    return "substr(absolute_path, 1, ?) = ?", [len(prefix), prefix]
+
+def get_queue_files(state: str, root: Optional[str] = None) -> List[Tuple[str, str]]:
+    """(absolute_path, relative_path) of queued files in state, below root if given, in path order."""
+    where, params = _under(root)
+    return query(f'SELECT absolute_path, relative_path FROM scan_queue WHERE state = ? AND {where} ORDER BY absolute_path',
+                 [state] + params)
+
+def get_queue_page(state: str, root: Optional[str] = None, after: Optional[str] = None, limit: int = 200) -> List[Dict[str, Any]]:
+    """Up to limit queued files in state after the path `after` (keyset paging), with their candidates unpacked."""
+    where, params = _under(root)
+    rows = query(f'''
+        SELECT absolute_path, relative_path, title_guess, year_guess, candidates, ranked, best_score, error
+        FROM scan_queue WHERE state = ? AND {where} AND absolute_path > ?
+        ORDER BY absolute_path LIMIT ?
+    ''', [state] + params + [after or "", limit])
     return [
         {
             "absolute_path": row[0],
             "relative_path": row[1],
-            "tmdb_id": row[2],
-            "title": row[3],
-            "year": row[4],
-            "genres": row[5],
-            "metadata": row[6],
-            "skip": bool(row[7])
+            "title_guess": row[2],
+            "year_guess": row[3],
+            "candidates": unpack_metadata(row[4]),
+            "ranked": unpack_metadata(row[5]),
+            "best_score": row[6],
+            "error": row[7],
         }
         for row in rows
     ]
 
-def reset_db():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('DROP TABLE IF EXISTS movies')
-    conn.commit()
-    conn.close()
-    init_db()
+def count_queue(root: Optional[str] = None) -> Dict[str, int]:
+    """state -> number of queued files (below root if given)."""
+    where, params = _under(root)
+    return dict(query(f'SELECT state, COUNT(*) FROM scan_queue WHERE {where} GROUP BY state', params))
 
-def set_skip_flag(absolute_path: str, skip: bool):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('UPDATE movies SET skip = ? WHERE absolute_path = ?', (1 if skip else 0, absolute_path))
-    conn.commit()
-    conn.close()
-
-def update_movie(absolute_path: str, **kwargs):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    fields = []
-    values = []
-    for k, v in kwargs.items():
-        fields.append(f"{k}=?")
-        values.append(v)
-    values.append(absolute_path)
-    c.execute(f"UPDATE movies SET {', '.join(fields)} WHERE absolute_path=?", values)
-    conn.commit()
-    conn.close()
+def get_pending_matches() -> List[Dict[str, Any]]:
+    """Files scan --auto could not match confidently; "candidates" is the ranked [{"score", "movie"}] JSON."""
+    rows = query('SELECT absolute_path, relative_path, title_guess, year_guess, ranked, best_score FROM scan_queue WHERE state = ? ORDER BY absolute_path',
+                 (QUEUE_PENDING,))
+    return [
+        {
+            "absolute_path": row[0],
+            "relative_path": row[1],
+            "title_guess": row[2],
+            "year_guess": row[3],
+            "candidates": unpack_metadata(row[4]),
+            "best_score": row[5]
+        }
+        for row in rows
+    ]
@@ -1,5 +1,11 @@
 import os
-from db import get_all_movies, set_skip_flag
+import time
+from typing import Callable, List, Optional, Tuple
+from db import get_duplicate_file_groups, set_skip_flags, get_all_file_paths, get_files_by_path, get_media_info
+from filehash import find_duplicate_files, HASH_WORKERS
+from filename_parser import parse_filename
+from probe import resolution_label, format_media
+from walker import walk_video_dirs
 from rich.console import Console
 from rich.prompt import Prompt
 from rich.table import Table
@@ -11,30 +17,114 @@ def human_readable_size(size):
         size /= 1024
     return f"{size:.1f} PB"
 
+# Best first; anything else ranks below these
+RESOLUTION_ORDER = ["2160p", "1080p", "1080i", "720p", "576p", "480p"]
+POLICY_NAMES = ("keep-largest", "keep-newest", "prefer-resolution[=2160p,1080p,...]", "prefer-codec=x265,x264,...", "prefer-path=PREFIX")
+
+# A policy turns a file (absolute_path, size, mtime, skip) and its probe row (or None) into a sort key:
+# the file with the highest key is kept
+Policy = Callable[[tuple, Optional[tuple]], object]
+
+def _preference(values: List[str], value) -> int:
+    return len(values) - values.index(value) if value in values else 0
+
+def parse_policy(spec: str) -> Policy:
+    """'keep-largest', 'prefer-codec=x265,x264', ... -> sort key. Raises ValueError for an unknown policy."""
+    name, _, arg = spec.partition("=")
+    values = [v.strip().lower() for v in arg.split(",") if v.strip()]
+    if name == "keep-largest":
+        return lambda f, info: f[1] if f[1] is not None else _stat(f[0]).st_size
+    if name == "keep-newest":
+        return lambda f, info: f[2] if f[2] is not None else _stat(f[0]).st_mtime
+    if name == "prefer-resolution":
+        order = values or RESOLUTION_ORDER
+        return lambda f, info: _preference(order, _resolution(f[0], info))
+    if name == "prefer-codec" and values:
+        return lambda f, info: _preference(values, _codec(f[0], info))
+    if name == "prefer-path" and arg:
+        prefix = os.path.join(os.path.abspath(arg), "")
+        return lambda f, info: f[0].startswith(prefix)
+    raise ValueError(f"Unknown dedup policy '{spec}'. Use: {', '.join(POLICY_NAMES)}")
+
+def _resolution(path: str, info: Optional[tuple]) -> Optional[str]:
+    # What the headers say beats what the file name claims
+    return (info and resolution_label(info[3], info[4])) or parse_filename(path).resolution
+
+def _codec(path: str, info: Optional[tuple]) -> Optional[str]:
+    return (info and info[5]) or parse_filename(path).codec
+
+class _Missing:
+    st_size = -1
+    st_mtime = float("-inf")
+
+def _stat(path: str):
+    # Only for rows recorded before sizes were stored; a missing file never wins
+    try:
+        return os.stat(path)
+    except OSError:
+        return _Missing
+
+def plan_dedup(policies: List[Policy]) -> List[Tuple[int, str, str, List[str]]]:
+    """
+    Apply policies (first one decides, later ones break ties, then the path) to every film with several files.
+    Returns [(tmdb_id, title, kept path, [other paths])].
+    """
+    plan = []
+    groups = get_duplicate_file_groups()
+    media = get_media_info(f[0] for _, _, files in groups for f in files)
+    for tmdb_id, title, files in groups:
+        keep = max(files, key=lambda f: (tuple(p(f, media.get(f[0])) for p in policies), f[3] == 0, f[0]))
+        plan.append((tmdb_id, title, keep[0], [f[0] for f in files if f is not keep]))
+    return plan
+
+def dedup_with_policies(specs: List[str], dry_run: bool = False):
+    """Non-interactive dedup: every film keeps the one file the policies prefer, all changes in one transaction."""
+    console = Console()
+    try:
+        policies = [parse_policy(spec) for spec in specs]
+    except ValueError as e:
+        console.print(f"[red]{e}[/red]")
+        return
+    plan = plan_dedup(policies)
+    if not plan:
+        console.print("[green]No films with more than one file.[/green]")
+        return
+    table = Table(title="Dedup plan (dry run)" if dry_run else "Dedup", show_header=True, header_style="bold magenta")
+    table.add_column("TMDb ID")
+    table.add_column("Title")
+    table.add_column("Keep")
+    table.add_column("Skip")
+    for tmdb_id, title, keep, others in plan:
+        table.add_row(str(tmdb_id), title or "", os.path.basename(keep), "\n".join(os.path.basename(p) for p in others))
+    console.print(table)
+    skipped = sum(len(others) for _, _, _, others in plan)
+    if dry_run:
+        console.print(f"[cyan]Would keep {len(plan)} files and skip {skipped}.[/cyan]")
+        return
+    set_skip_flags(
+        [(keep, False) for _, _, keep, _ in plan] + [(p, True) for _, _, _, others in plan for p in others]
+    )
+    console.print(f"[green]Kept {len(plan)} files and marked {skipped} to be skipped.[/green]")
+
 def dedup():
     console = Console()
-    movies = get_all_movies()
-    # Group by tmdb_id
-    from collections import defaultdict
-    tmdb_groups = defaultdict(list)
-    for m in movies:
-        if m['tmdb_id']:
-            tmdb_groups[m['tmdb_id']].append(m)
-    for tmdb_id, group in tmdb_groups.items():
-        if len(group) <= 1:
-            continue
-        console.print(f"\n[bold yellow]Duplicates for TMDb ID {tmdb_id} ({group[0]['title']})[/bold yellow]")
+    # Grouped by tmdb_id in SQL, only groups with more than one file: (absolute_path, size, mtime, skip)
+    groups = get_duplicate_file_groups()
+    media = get_media_info(f[0] for _, _, group in groups for f in group)
+    for tmdb_id, title, group in groups:
+        console.print(f"\n[bold yellow]Duplicates for TMDb ID {tmdb_id} ({title})[/bold yellow]")
         table = Table(show_header=True, header_style="bold magenta")
         table.add_column("#")
         table.add_column("File name")
         table.add_column("Size")
-        for idx, m in enumerate(group):
-            try:
-                size = os.path.getsize(m['absolute_path'])
-                size_str = human_readable_size(size)
-            except Exception:
-                size_str = "?"
-            table.add_row(str(idx+1), os.path.basename(m['absolute_path']), size_str)
+        table.add_column("Media")
+        for idx, (path, size, _, _) in enumerate(group):
+            info = media.get(path)
+            # The size is recorded when a file is scanned; only rows from before that are statted
+            if size is None:
+                size = _stat(path).st_size
+            size_str = human_readable_size(size) if size >= 0 else "?"
+            table.add_row(str(idx+1), os.path.basename(path), size_str, format_media(*info[2:6]) if info else "")
         console.print(table)
         choice = Prompt.ask(f"Pick the file to keep (1-{len(group)})", default="1")
         try:
@@ -44,6 +134,52 @@ def dedup():
         except Exception:
             console.print("[red]Invalid choice, skipping group.[/red]")
             continue
-        for idx, m in enumerate(group):
-            set_skip_flag(m['absolute_path'], skip=(idx != keep_idx))
+        set_skip_flags((f[0], idx != keep_idx) for idx, f in enumerate(group))
         console.print(f"[green]Marked all but one file to be skipped for TMDb ID {tmdb_id}.[/green]")
+
+def dedup_content(dirs=None, full=False, workers=HASH_WORKERS, mark_skip=False):
+    """
+    Report files with identical content, whatever film they are matched to (if any).
+    Looks at every file in the database plus the video files under dirs. With mark_skip, all but one
+    recorded file of each group is flagged to be skipped (files outside the database are only reported).
+    """
+    console = Console()
+    paths = set(get_all_file_paths())
+    for root in dirs or []:
+        for _, _, _, entries in walk_video_dirs(os.path.abspath(root)):
+            paths.update(entry.path for entry in entries)
+    start = time.perf_counter()
+    groups, stats = find_duplicate_files(
+        sorted(paths), full=full, workers=workers,
+        progress=lambda stage, n: console.print(f"[cyan]Hashing {n} files ({stage})...[/cyan]") if n else None
+    )
+    elapsed = time.perf_counter() - start
+    known = get_files_by_path(p for _, group in groups for p in group)
+    flags = []
+    wasted = 0
+    for size, group in groups:
+        # Keep a file that is already in use: matched and not skipped, else the first one
+        keep = next((p for p in group if p in known and known[p][0] is not None and not known[p][2]), group[0])
+        wasted += size * (len(group) - 1)
+        table = Table(title=f"{len(group)} identical files, {human_readable_size(size)} each", show_header=True, header_style="bold magenta")
+        table.add_column("File")
+        table.add_column("TMDb ID")
+        table.add_column("Title")
+        table.add_column("Skip")
+        for p in group:
+            tmdb_id, title, skip = known.get(p, (None, None, None))
+            status = "keep" if p == keep else ("yes" if skip else "no" if skip is not None else "not in DB")
+            table.add_row(p, str(tmdb_id or ""), title or "", status)
+            if p != keep and p in known:
+                flags.append((p, True))
+        console.print(table)
+    console.print(
+        f"[bold]{len(groups)} duplicate groups, {human_readable_size(wasted)} reclaimable.[/bold] "
+        f"{stats['files']} files checked in {elapsed:.1f}s: {stats['hashed']} partial hashes computed, "
+        f"{stats['cached']} from cache, {stats['full_hashed']} full hashes, {stats['errors']} unreadable."
+    )
+    if not full and groups:
+        console.print("[yellow]Groups are based on partial hashes; use --full to confirm them byte for byte.[/yellow]")
+    if mark_skip and flags:
+        set_skip_flags(flags)
+        console.print(f"[green]Marked {len(flags)} duplicate files to be skipped.[/green]")
@@ -0,0 +1,122 @@
+import hashlib
+import mmap
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from db import get_file_hashes, save_file_hashes
+import perf
+
+# Bytes read from the head, the middle and the tail of a file for its partial hash
+SAMPLE_SIZE = 64 * 1024
+FULL_HASH_CHUNK = 4 * 1024 * 1024
+# Hashing is I/O bound and hashlib releases the GIL on large buffers, so threads scale fine
+HASH_WORKERS = 8
+
+@perf.timed("hash: partial")
+def partial_hash(path: str, size: int) -> str:
+    """blake2b of the size and three SAMPLE_SIZE windows (head, middle, tail). Small files are hashed whole."""
+    h = hashlib.blake2b(str(size).encode(), digest_size=16)
+    perf.count("bytes hashed", min(size, 3 * SAMPLE_SIZE))
+    with open(path, "rb") as f:
+        if size <= 3 * SAMPLE_SIZE:
+            h.update(f.read())
+            return h.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            for offset in (0, size // 2 - SAMPLE_SIZE // 2, size - SAMPLE_SIZE):
+                h.update(m[offset:offset + SAMPLE_SIZE])
+    return h.hexdigest()
+
+@perf.timed("hash: full")
+def full_hash(path: str) -> str:
+    h = hashlib.blake2b(digest_size=32)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(FULL_HASH_CHUNK), b""):
+            h.update(chunk)
+            perf.count("bytes hashed", len(chunk))
+    return h.hexdigest()
+
+def _stat(path: str) -> Optional[Tuple[str, int, float]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return path, st.st_size, st.st_mtime
+
+def _group(items, key) -> List[list]:
+    groups: Dict = {}
+    for item in items:
+        groups.setdefault(key(item), []).append(item)
+    return [g for g in groups.values() if len(g) > 1]
+
+def find_duplicate_files(paths: Iterable[str], full: bool = False, workers: int = HASH_WORKERS,
+                         progress: Optional[Callable[[str, int], None]] = None) -> Tuple[List[Tuple[int, List[str]]], dict]:
+    """
+    Group files with identical content: by size, then by partial hash, then (with full) by full hash.
+    Only files that still have a partner after a stage are read in the next, and hashes are cached in the
+    database by path, size and mtime. Returns ([(size, [path, ...])], stats).
+    progress(stage, count) is called when a stage starts.
+    """
+    stats = {"files": 0, "size_groups": 0, "hashed": 0, "cached": 0, "full_hashed": 0, "errors": 0}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Stage 1: size. Stats run on the pool too: on a network mount each one is a round trip.
+        stat_rows = [r for r in pool.map(_stat, paths) if r is not None]
+        stats["files"] = len(stat_rows)
+        # Empty files are all "identical" and not worth reporting
+        by_size = _group((r for r in stat_rows if r[1] > 0), key=lambda r: r[1])
+        stats["size_groups"] = len(by_size)
+        candidates = [r for group in by_size for r in group]
+
+        # Stage 2: partial hash, reused from the cache while size and mtime match
+        cached = get_file_hashes(r[0] for r in candidates)
+        hashes: Dict[str, List] = {}
+        to_hash = []
+        for path, size, mtime in candidates:
+            c = cached.get(path)
+            if c and c[0] == size and c[1] == mtime and c[2]:
+                hashes[path] = [size, mtime, c[2], c[3]]
+                stats["cached"] += 1
+            else:
+                to_hash.append((path, size, mtime))
+        if progress:
+            progress("partial", len(to_hash))
+
+        def do_partial(row):
+            path, size, mtime = row
+            try:
+                return row, partial_hash(path, size)
+            except (OSError, ValueError):
+                return row, None
+
+        for (path, size, mtime), digest in pool.map(do_partial, to_hash):
+            if digest is None:
+                stats["errors"] += 1
+                continue
+            hashes[path] = [size, mtime, digest, None]
+            stats["hashed"] += 1
+        groups = _group(hashes.items(), key=lambda kv: (kv[1][0], kv[1][2]))
+
+        # Stage 3: full hash of what is left; files small enough for a whole-file partial hash need none
+        if full:
+            need_full = [path for group in groups for path, h in group if h[3] is None and h[0] > 3 * SAMPLE_SIZE]
+            if progress:
+                progress("full", len(need_full))
+
+            def do_full(path):
+                try:
+                    return path, full_hash(path)
+                except OSError:
+                    return path, None
+
+            for path, digest in pool.map(do_full, need_full):
+                if digest is None:
+                    stats["errors"] += 1
+                    hashes.pop(path)
+                    continue
+                hashes[path][3] = digest
+                stats["full_hashed"] += 1
+            groups = _group(
+                ((path, h) for group in groups for path, h in group if path in hashes),
+                key=lambda kv: (kv[1][0], kv[1][3] or kv[1][2])
+            )
+    save_file_hashes((path, *h) for path, h in hashes.items())
+    return [(group[0][1][0], sorted(path for path, _ in group)) for group in groups], stats
@@ -0,0 +1,201 @@
+import os
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, NamedTuple, Optional
+
+# Release tags by category. Multi-word tags are written with spaces and match any separator.
+DEFAULT_TAG_VOCABULARY: Dict[str, Iterable[str]] = {
+    "resolution": ["2160p", "1080p", "1080i", "720p", "576p", "480p", "4k", "uhd"],
+    "codec": ["x264", "x265", "h264", "h265", "h 264", "h 265", "hevc", "avc", "xvid", "divx", "av1", "vp9"],
+    "source": ["bluray", "blu ray", "bdrip", "brrip", "bdremux", "remux", "webrip", "web dl", "webdl", "web",
+               "dvdrip", "dvd", "hdrip", "hdtv", "dvdscr", "cam", "telesync"],
+    "audio": ["ac3", "dts", "dts hd", "aac", "dd5 1", "ddp5 1", "truehd", "atmos", "flac", "mp3", "5 1", "7 1"],
+    "edition": ["extended", "directors cut", "director's cut", "director s cut", "unrated", "uncut", "remastered", "theatrical",
+                "criterion", "imax", "special edition", "ultimate edition"],
+    "language": ["ita", "eng", "spa", "fre", "ger", "multi", "dual", "sub", "subs", "subbed", "dubbed"],
+    "other": ["hdr", "hdr10", "dv", "10bit", "proper", "repack", "limited", "internal", "sample",
+              "trilogia", "fanart", "poster", "thumb"],
+}
+
+# Tags that are also ordinary words ("Charlotte's Web", "The Cam Man", "Dual"). They only count as tags once
+# the title is clearly over: after a year, another tag or a bracket.
+AMBIGUOUS_TAGS = {"web", "cam", "dvd", "sub", "subs", "dual", "multi", "limited", "extended", "proper",
+                  "internal", "sample", "uncut", "theatrical", "remastered", "criterion", "imax", "dubbed"}
+# ...except these, which also mark a whole file when they lead a name that goes on with words ("Sample.The.Matrix.1999")
+LEADING_TAGS = {"sample", "sub", "subs"}
+
+# Spellings folded together so callers (e.g. dedup policies) can compare values
+CANONICAL_TAGS = {
+    "4k": "2160p", "uhd": "2160p",
+    "h264": "x264", "h 264": "x264", "avc": "x264",
+    "h265": "x265", "h 265": "x265", "hevc": "x265",
+    "blu ray": "bluray", "bdremux": "remux", "brrip": "bdrip", "webdl": "web dl",
+    "director s cut": "directors cut", "director's cut": "directors cut",
+}
+
+_BRACKETS = re.compile(r"[\[\(\{]([^\]\)\}]*)[\]\)\}]")
+_SEPARATORS = re.compile(r"[\s._\-]+")
+# The runs between separators, so splitting needs no pass to drop empty strings
+_TOKENS = re.compile(r"[^\s._\-]+")
+# "-GROUP" at the very end of the name, e.g. Movie.2010.1080p.BluRay.x264-SPARKS
+_RELEASE_GROUP = re.compile(r"-([A-Za-z0-9]+)$")
+
+class ParsedFilename(NamedTuple):
+    title: str
+    year: Optional[int]
+    resolution: Optional[str] = None
+    codec: Optional[str] = None
+    source: Optional[str] = None
+    audio: Optional[str] = None
+    edition: Optional[str] = None
+    release_group: Optional[str] = None
+
+_tags: Dict[tuple, str] = {}
+# First word of each tag -> longest tag starting with it, so most tokens cost one dict lookup
+_first_words: Dict[str, int] = {}
+# One-word tags -> (category, canonical tag, 1, ambiguous): the common case, answered without building a key
+_single_words: Dict[str, tuple] = {}
+
+def set_tag_vocabulary(vocabulary: Dict[str, Iterable[str]]):
+    """Replace the tag vocabulary (same shape as DEFAULT_TAG_VOCABULARY) and drop cached parses."""
+    global _tags, _first_words, _single_words
+    _tags, _first_words, _single_words = {}, {}, {}
+    for category, words in vocabulary.items():
+        for word in words:
+            key = tuple(_SEPARATORS.split(word.lower()))
+            _tags[key] = category
+            _first_words[key[0]] = max(_first_words.get(key[0], 0), len(key))
+    for key, category in _tags.items():
+        if len(key) == 1:
+            _single_words[key[0]] = (category, CANONICAL_TAGS.get(key[0], key[0]), 1, key[0] in AMBIGUOUS_TAGS)
+    parse_filename.cache_clear()
+
+def add_tags(category: str, words: Iterable[str]):
+    """Extend the current vocabulary, e.g. add_tags("language", ["fra", "deu"])."""
+    vocabulary: Dict[str, list] = {}
+    for key, cat in _tags.items():
+        vocabulary.setdefault(cat, []).append(" ".join(key))
+    vocabulary.setdefault(category, []).extend(words)
+    set_tag_vocabulary(vocabulary)
+
+def _match_tag(lowered, i):
+    """(category, canonical tag, number of tokens, ambiguous) for the longest tag starting at lowered[i], or None."""
+    longest = _first_words.get(lowered[i])
+    if not longest:
+        return None
+    if longest == 1:
+        return _single_words[lowered[i]]
+    for n in range(min(longest, len(lowered) - i), 0, -1):
+        key = tuple(lowered[i:i + n])
+        category = _tags.get(key)
+        if category:
+            tag = " ".join(key)
+            return category, CANONICAL_TAGS.get(tag, tag), n, tag in AMBIGUOUS_TAGS
+    return None
+
+def _is_year(token: str) -> bool:
+    return len(token) == 4 and token[:2] in ("19", "20") and token.isdigit() and token.isascii()
+
+def _classify(tokens, lowered, found: dict, tags_from: int = 0):
+    """
+    Record tags found in tokens (lowered: the same tokens in lower case). Ambiguous tags count from
+    index tags_from on, or after a year or another tag (see AMBIGUOUS_TAGS).
+    Returns (index after any leading tags, index of the first tag after that, year candidate indexes).
+    """
+    start, first_tag, years, i, count = 0, None, [], 0, len(tokens)
+    first_words = _first_words
+    while i < count:
+        # Most tokens start no tag: one dict lookup and on to the year test
+        match = _match_tag(lowered, i) if lowered[i] in first_words else None
+        if match and match[3] and i < tags_from and not years and first_tag is None:
+            # "Sample.The.Matrix", but not "Sub.2009" or "Multi.Angle.Heist"
+            following = i + match[2]
+            if (i != start or lowered[i] not in LEADING_TAGS or following >= count
+                    or _is_year(tokens[following]) or lowered[following] in first_words):
+                match = None
+        if match:
+            category, tag, n, _ = match
+            found.setdefault(category, tag)
+            if i == start:
+                start = i + n  # "Sample.The.Matrix...", "Subs Amelie..."
+            elif first_tag is None:
+                first_tag = i
+            i += n
+            continue
+        token = tokens[i]
+        if len(token) == 4 and token[:2] in ("19", "20") and token.isdigit() and token.isascii():
+            years.append(i)
+        i += 1
+    return start, first_tag, years
+
+@lru_cache(maxsize=8192)
+def parse_filename(filename: str) -> ParsedFilename:
+    """
+    Split a release-style file name into title, year and release tags.
+
+    The year is chosen by position: a bracketed year wins, otherwise the last year before the
+    first release tag (or the first one among the tags), never the first title token (so "2001 A Space Odyssey 1968" is 1968 and
+    "1917.mkv" has no year). The title is everything before the year or the first tag.
+    """
+    name = os.path.splitext(os.path.basename(filename))[0]
+    found = {}
+
+    # Bracketed parts never belong to the title, but may carry the year or tags
+    bracket_year = None
+    # Tokens before the first bracket: ambiguous tags past it are tags ("Title (2001) Extended")
+    tags_from = len(name)
+    if "[" in name or "(" in name or "{" in name:
+        first = _BRACKETS.search(name)
+        if first:
+            tags_from = len(_TOKENS.findall(name, 0, first.start()))
+        for content in _BRACKETS.findall(name):
+            tokens = _TOKENS.findall(content)
+            _, _, years = _classify(tokens, [t.lower() for t in tokens], found)
+            if years:
+                bracket_year = int(tokens[years[-1]])
+        name = _BRACKETS.sub(" ", name)
+
+    group = _RELEASE_GROUP.search(name.strip()) if "-" in name else None
+    tokens = _TOKENS.findall(name)
+    lowered = [t.lower() for t in tokens]
+    start, first_tag, years = _classify(tokens, lowered, found, tags_from)
+    # Only a release name (something tagged before it) has a group: keeps "Spider-Man" intact.
+    # A year is never a group ("Movie-1999"), and dropping it would leave its index dangling.
+    if (group and (first_tag is not None or years) and tokens and tokens[-1] == group.group(1)
+            and _match_tag(lowered, len(tokens) - 1) is None and years[-1:] != [len(tokens) - 1]):
+        found["release_group"] = group.group(1)
+        tokens = tokens[:-1]
+
+    end = first_tag if first_tag is not None else len(tokens)
+    year_index = None
+    for i in years:
+        if start < i < end:
+            year_index = i
+    if year_index is None and first_tag is not None:
+        # "Alien Director's Cut 1979": a year among the tags still beats no year
+        year_index = next((i for i in years if i > end), None)
+    if bracket_year is not None:
+        year = bracket_year
+        if year_index is not None and int(tokens[year_index]) == bracket_year:
+            end = year_index  # "Movie 2010 (2010)"
+    elif year_index is not None:
+        year = int(tokens[year_index])
+        end = min(end, year_index)
+    else:
+        year = None
+    title = " ".join(tokens[start:end]).strip()
+    if not title and tokens:
+        # Nothing but tags (or the year) in the name: better a poor title than none
+        title = " ".join(tokens)
+    return ParsedFilename(
+        title=title,
+        year=year,
+        resolution=found.get("resolution"),
+        codec=found.get("codec"),
+        source=found.get("source"),
+        audio=found.get("audio"),
+        edition=found.get("edition"),
+        release_group=found.get("release_group"),
+    )
+
+set_tag_vocabulary(DEFAULT_TAG_VOCABULARY)
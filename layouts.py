@@ -0,0 +1,124 @@
+import json
+import re
+import string
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from db import unpack_metadata, split_genres
+from matching import find_director
+
+# Layout name -> path template of each link, without the file extension.
+# Every "/"-separated part becomes one sanitized folder (the last one is the link name).
+LAYOUTS = {
+    "title": "{title} ({year})/{title} ({year})",
+    "year": "{year}/{title} ({year})",
+    "decade": "{decade}/{title} ({year})/{title} ({year})",
+    "genre": "{genre}/{title} ({year})/{title} ({year})",
+    "director": "{director}/{title} ({year})/{title} ({year})",
+    "collection": "{collection}/{title} ({year})/{title} ({year})",
+}
+
+FIELDS = ("title", "original_title", "year", "decade", "genre", "director", "collection")
+# Fields that come from the stored TMDb details rather than the films table
+DETAIL_FIELDS = {"original_title", "director", "collection"}
+# A film without a value for one of these is left out of the layout rather than put under "Unknown"
+GROUPING_FIELDS = {"genre", "director", "collection"}
+UNKNOWN = "Unknown"
+
+@lru_cache(maxsize=65536)
+def sanitize_folder_name(name):
+    # Remove or replace problematic characters for Kodi and filesystems
+    name = name.replace(':', '')  # Remove colons
+    name = name.replace('?', '')  # Remove question marks
+    name = name.replace('/', '-') # Replace slashes with dash
+    name = name.replace('"', '') # Remove double quotes
+    name = name.replace('|', '')  # Remove pipes
+    name = name.replace('<', '')  # Remove less than
+    name = name.replace('>', '')  # Remove greater than
+    name = name.replace('*', '')  # Remove asterisks
+    name = name.replace('\\', '') # Remove backslashes
+    name = re.sub(r'\s+', ' ', name)  # Collapse multiple spaces
+    name = name.strip()
+    return name
+
+class Layout:
+    """A parsed path template. paths() turns one film into the link paths (relative, no extension) it gets."""
+    def __init__(self, spec: str):
+        self.name = spec
+        template = LAYOUTS.get(spec, spec)
+        self.parts = [p for p in template.split("/") if p]
+        self.fields = {f for part in self.parts for _, f, _, _ in string.Formatter().parse(part) if f}
+        unknown = self.fields - set(FIELDS)
+        # The link name must tell films apart, otherwise every film would collide in one folder
+        named = self.parts and {"title", "original_title"} & {f for _, f, _, _ in string.Formatter().parse(self.parts[-1]) if f}
+        if unknown or not named:
+            raise ValueError(f"Unknown layout '{spec}'. Use one of {', '.join(LAYOUTS)} or a template with {', '.join('{' + f + '}' for f in FIELDS)} ending in the title")
+        self.needs_details = bool(self.fields & (DETAIL_FIELDS | {"genre"}))
+        self._cache: Dict[Optional[int], List[str]] = {}
+
+    def _render(self, values: Dict[str, str]) -> str:
+        folders = []
+        for part in self.parts:
+            text = part.format(**values)
+            # "Title ()" when the year is unknown -> "Title"
+            folders.append(sanitize_folder_name(text.replace("()", "")) or UNKNOWN)
+        return "/".join(folders)
+
+    def paths(self, film: "FilmFields") -> List[str]:
+        """Cached per film, so folder names are built and sanitized once per pass however many files it has."""
+        key = film.tmdb_id if film.tmdb_id is not None else (film.title, film.year)
+        paths = self._cache.get(key)
+        if paths is None:
+            paths = self._cache[key] = self._expand(film)
+        return paths
+
+    def _expand(self, film: "FilmFields") -> List[str]:
+        values = film.values(self.fields)
+        if any(not values.get(f) for f in self.fields & GROUPING_FIELDS):
+            return []
+        # One link per genre: a film shows up under each of its genres
+        genres = values.pop("genre", None) or [None]
+        return [self._render({**values, "genre": g}) if g else self._render(values) for g in genres]
+
+class FilmFields:
+    """The template values of one film, with the TMDb details decoded lazily."""
+    def __init__(self, tmdb_id: Optional[int], title: str, year: Optional[int], genres: Optional[str] = None, metadata=None):
+        self.tmdb_id = tmdb_id
+        self.title = title or ""
+        self.year = year or None
+        self.genres = genres
+        self.metadata = metadata
+        self._details = None
+
+    def details(self) -> dict:
+        if self._details is None:
+            try:
+                self._details = json.loads(unpack_metadata(self.metadata) or "{}")
+            except ValueError:
+                self._details = {}
+        return self._details
+
+    def values(self, fields) -> Dict:
+        values = {
+            "title": self.title,
+            "year": str(self.year) if self.year else "",
+            "decade": f"{self.year // 10 * 10}s" if self.year else "",
+        }
+        if "genre" in fields:
+            values["genre"] = split_genres(self.genres)
+        if fields & DETAIL_FIELDS:
+            details = self.details()
+            values["original_title"] = details.get("original_title") or self.title
+            values["director"] = find_director(details)
+            values["collection"] = (details.get("belongs_to_collection") or {}).get("name", "")
+        return values
+
+def parse_targets(specs: List[str]) -> List[Tuple[str, str]]:
+    """["genre=/mnt/Genres", ...] -> [(target_dir, layout)]; raises ValueError for a malformed spec."""
+    targets = []
+    for spec in specs:
+        layout, sep, target = spec.partition("=")
+        if not sep or not layout or not target:
+            raise ValueError(f"Expected LAYOUT=TARGET, got '{spec}'")
+        Layout(layout)
+        targets.append((target, layout))
+    return targets
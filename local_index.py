@@ -0,0 +1,206 @@
+import gzip
+import json
+import os
+import sqlite3
+import threading
+from datetime import date, timedelta
+from typing import Iterator, List, Optional, Tuple
+import requests
+from db import transaction, query
+from matching import normalize_title
+import perf
+
+# TMDb publishes one export per day, around 08:00 UTC; gzip, one JSON object per line:
+# {"adult":false,"id":603,"original_title":"The Matrix","popularity":80.1,"video":false}
+EXPORT_URL = "http://files.tmdb.org/p/exports/movie_ids_{date}.json.gz"
+LOAD_BATCH_SIZE = 10000
+# Rows considered per query before ordering; more than enough for a title search
+MATCH_LIMIT = 200
+
+# Searches go to the local index first when this is set and the index has been built
+enabled = True
+
+stats = {"hits": 0, "misses": 0}
+# Searches run on the scan workers too
+_stats_lock = threading.Lock()
+
+def init_index():
+    with transaction() as conn:
+        # title is filled in from the details (localised title, release year) as films are fetched
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS tmdb_index (
+                id INTEGER PRIMARY KEY,
+                original_title TEXT,
+                title TEXT,
+                norm_title TEXT,
+                year INTEGER,
+                popularity REAL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_tmdb_index_norm_title ON tmdb_index (norm_title)')
+        conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS tmdb_index_fts USING fts5(
+                original_title, title, content='tmdb_index', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        ''')
+
+def export_url(day: Optional[date] = None) -> str:
+    # Today's file may not be published yet, so default to yesterday's
+    day = day or date.today() - timedelta(days=1)
+    return EXPORT_URL.format(date=day.strftime("%m_%d_%Y"))
+
+def download_export(dest_dir: str = ".", day: Optional[date] = None) -> str:
+    """Download a daily export (a few tens of MB) to dest_dir and return its path."""
+    url = export_url(day)
+    path = os.path.join(dest_dir, os.path.basename(url))
+    with requests.get(url, stream=True, timeout=(5, 60)) as response:
+        response.raise_for_status()
+        with open(path + ".part", "wb") as f:
+            for chunk in response.iter_content(1 << 20):
+                f.write(chunk)
+    os.replace(path + ".part", path)
+    return path
+
+def iter_export(path: str, include_adult: bool = False) -> Iterator[Tuple[int, str, float]]:
+    """(id, original_title, popularity) of every film in an export file (gzip or plain JSON lines)."""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            try:
+                movie = json.loads(line)
+            except ValueError:
+                continue
+            if movie.get("video") or (movie.get("adult") and not include_adult) or not movie.get("original_title"):
+                continue
+            yield movie["id"], movie["original_title"], movie.get("popularity") or 0.0
+
+def load_export(path: str, include_adult: bool = False) -> int:
+    """
+    Replace the index with the films of an export file. Titles and years already learnt from
+    fetched details are kept for films still in the export. Returns the number of films indexed.
+    """
+    global _available
+    init_index()
+    count = 0
+    with transaction() as conn:
+        conn.execute('CREATE TEMP TABLE IF NOT EXISTS export_ids (id INTEGER PRIMARY KEY)')
+        conn.execute('DELETE FROM export_ids')
+        batch = []
+        for row in iter_export(path, include_adult):
+            batch.append(row)
+            if len(batch) >= LOAD_BATCH_SIZE:
+                count += _load_batch(conn, batch)
+                batch = []
+        count += _load_batch(conn, batch)
+        conn.execute('DELETE FROM tmdb_index WHERE id NOT IN (SELECT id FROM export_ids)')
+        conn.execute('DROP TABLE export_ids')
+        # One bulk rebuild is much faster than keeping the full-text index in step row by row
+        conn.execute("INSERT INTO tmdb_index_fts (tmdb_index_fts) VALUES ('rebuild')")
+    _available = None
+    return count
+
+def _load_batch(conn, batch) -> int:
+    conn.executemany('INSERT OR IGNORE INTO export_ids (id) VALUES (?)', [(r[0],) for r in batch])
+    conn.executemany('''
+        INSERT INTO tmdb_index (id, original_title, norm_title, popularity) VALUES (?, ?, ?, ?)
+        ON CONFLICT (id) DO UPDATE SET
+            original_title = excluded.original_title,
+            popularity = excluded.popularity,
+            norm_title = CASE WHEN tmdb_index.title IS NULL THEN excluded.norm_title ELSE tmdb_index.norm_title END
+    ''', [(i, title, normalize_title(title), popularity) for i, title, popularity in batch])
+    return len(batch)
+
+def index_size() -> int:
+    try:
+        return query('SELECT COUNT(*) FROM tmdb_index')[0][0]
+    except sqlite3.OperationalError:
+        return 0  # Not built
+
+_available = None
+
+def available() -> bool:
+    """True when searches should use the index: enabled and built. Checked once per process."""
+    global _available
+    if _available is None:
+        _available = index_size() > 0
+    return enabled and _available
+
+def _fts_query(text: str) -> Optional[str]:
+    words = normalize_title(text).split()
+    if not words:
+        return None
+    # Every word must appear; quoting keeps FTS operators in titles ("AND", "NOT", "-") literal
+    return " ".join(f'"{w}"' for w in words)
+
+@perf.timed("local index search")
+def search_local(text: str, year: Optional[int] = None, limit: int = 20) -> List[dict]:
+    """
+    Search-result-shaped dicts (id, title, original_title, release_date, popularity) for films whose
+    title contains every word of text. An exact title match ranks first, then films of the given year,
+    then popularity. The export has no release dates, so release_date is empty; "year" holds the year
+    when the film's details were fetched before, and "source" is "local index".
+    """
+    fts = _fts_query(text)
+    if fts is None:
+        return []
+    norm = normalize_title(text)
+    # Exact titles come from the plain index, so an obscure "Love" is not lost among popular "Love Actually"s
+    rows = query('''
+        SELECT id, original_title, title, year, popularity, norm_title FROM tmdb_index WHERE norm_title = ?
+        UNION
+        SELECT * FROM (
+            SELECT i.id, i.original_title, i.title, i.year, i.popularity, i.norm_title
+            FROM tmdb_index_fts JOIN tmdb_index i ON i.id = tmdb_index_fts.rowid
+            WHERE tmdb_index_fts MATCH ?
+            ORDER BY i.popularity DESC
+            LIMIT ?
+        )
+    ''', (norm, fts, MATCH_LIMIT))
+    rows.sort(key=lambda r: (r[5] == norm or normalize_title(r[1]) == norm, year is not None and r[3] == year, r[4] or 0), reverse=True)
+    return [
+        {
+            "id": i,
+            "title": title or original_title,
+            "original_title": original_title,
+            "release_date": "",
+            "year": film_year,
+            "popularity": popularity,
+            "source": "local index",
+        }
+        for i, original_title, title, film_year, popularity, _ in rows[:limit]
+    ]
+
+def has_exact_title(results: List[dict], text: str) -> bool:
+    """True when one of the results is titled exactly text (normalised): the only local answer trusted without TMDb."""
+    norm = normalize_title(text)
+    return any(normalize_title(r["title"]) == norm or normalize_title(r["original_title"]) == norm for r in results)
+
+def note_search(answered: bool):
+    """Count a search the index answered, or one that went on to TMDb."""
+    with _stats_lock:
+        stats["hits" if answered else "misses"] += 1
+    perf.count("local index hits" if answered else "local index misses")
+
+def note_details(movie: dict):
+    """Learn a film's localised title and release year from its details, so later searches find and rank it better."""
+    if not movie or not movie.get("id") or not available():
+        return
+    title = movie.get("title")
+    year = int((movie.get("release_date") or "")[:4] or 0) or None
+    with transaction() as conn:
+        old = conn.execute('SELECT original_title, title FROM tmdb_index WHERE id = ?', (movie["id"],)).fetchone()
+        if old is None or (old[1] == title and title):
+            conn.execute('UPDATE tmdb_index SET year = ? WHERE id = ? AND year IS NOT ?', (year, movie["id"], year))
+            return
+        # External-content FTS: the old row must be deleted with its old values before the new ones are indexed
+        conn.execute("INSERT INTO tmdb_index_fts (tmdb_index_fts, rowid, original_title, title) VALUES ('delete', ?, ?, ?)",
+                     (movie["id"], old[0], old[1]))
+        conn.execute('UPDATE tmdb_index SET title = ?, norm_title = ?, year = ? WHERE id = ?',
+                     (title, normalize_title(title or old[0]), year, movie["id"]))
+        conn.execute('INSERT INTO tmdb_index_fts (rowid, original_title, title) VALUES (?, ?, ?)', (movie["id"], old[0], title))
+
+def index_summary() -> str:
+    with _stats_lock:
+        hits, misses = stats["hits"], stats["misses"]
+    return f"Local index: {hits} searches answered, {misses} sent to TMDb"
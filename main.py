@@ -1,32 +1,146 @@
 import typer
-from db import init_db, reset_db
-from scan import scan_directory
+from typing import List
+import time
+from db import init_db, reset_db, get_all_file_paths
+from cache import init_cache, clear_cache, configure as configure_cache
+from scan import scan_directory, auto_scan_directory, discover_files, print_queue_summary
 from build import build_structure
-from dedup import dedup
-from review import review_database
+from layouts import parse_targets
+from dedup import dedup, dedup_content, dedup_with_policies
+from review import review_database, review_pending
+from probe import probe_files
+from refresh import refresh_metadata
+from local_index import load_export, download_export, export_url
+import local_index
+import perf
 
 app = typer.Typer(help="Movie Organiser CLI")
 
+PROFILE_FORMATS = ("json", "chrome")
+SCAN_STAGES = ("discover", "fetch", "all")
+
+@app.callback()
+def main(
+    ctx: typer.Context,
+    profile: bool = typer.Option(False, help="Time each stage (walk, parsing, HTTP per endpoint, DB writes, probing, hashing, symlinks) and print a summary when the command ends"),
+    profile_output: str = typer.Option(None, help="Also write the profile to this file (implies --profile)"),
+    profile_format: str = typer.Option("json", help="Format of --profile-output: 'json' (totals per stage and counters) or 'chrome' (every span, for chrome://tracing or ui.perfetto.dev)"),
+    quiet: bool = typer.Option(False, "--quiet", "-q", help="Do not print a line per file; summaries and errors are still shown")
+):
+    """Movie Organiser CLI. Global options go before the command, e.g. main.py --profile --quiet scan DIR."""
+    perf.quiet = quiet
+    if profile_format not in PROFILE_FORMATS:
+        typer.echo(f"Unknown profile format '{profile_format}'. Use one of: {', '.join(PROFILE_FORMATS)}.")
+        raise typer.Exit(1)
+    if not (profile or profile_output):
+        return
+    perf.enable(keep_trace=profile_output is not None and profile_format == "chrome")
+
+    def report():
+        perf.print_report()
+        if profile_output and profile_format == "chrome":
+            perf.write_chrome_trace(profile_output)
+        elif profile_output:
+            perf.write_json(profile_output, command=ctx.invoked_subcommand)
+        if profile_output:
+            typer.echo(f"Profile written to {profile_output}")
+
+    ctx.call_on_close(report)
+
 @app.command()
 def scan(
     source_dir: str = typer.Argument(..., help="Directory to scan for movie files"),
-    tmdb_bearer_token: str = typer.Option(..., prompt=True, hide_input=True, help="TMDb V4 Bearer Token")
+    tmdb_bearer_token: str = typer.Option(None, hide_input=True, help="TMDb V4 Bearer Token (asked for unless --offline)"),
+    offline: bool = typer.Option(False, help="Serve TMDb responses from the local cache only, never use the network"),
+    cache_ttl_days: int = typer.Option(30, help="Refetch cached TMDb responses older than this many days"),
+    cache_max_entries: int = typer.Option(50000, help="Maximum number of cached TMDb responses (least recently used are evicted)"),
+    prefetch_depth: int = typer.Option(8, help="Number of upcoming files resolved in the background ahead of the prompt"),
+    workers: int = typer.Option(None, help="Number of background workers resolving files (default: 2 interactive, 8 with --auto)"),
+    auto: bool = typer.Option(False, help="Match without prompting; low-confidence files are queued for 'review --pending'"),
+    threshold: float = typer.Option(0.8, help="Minimum confidence (0-1) for --auto to accept a match"),
+    include: List[str] = typer.Option(None, help="Only scan files matching this glob (name or relative path); repeatable"),
+    exclude: List[str] = typer.Option(None, help="Skip files and directories matching this glob (name or relative path); repeatable"),
+    max_depth: int = typer.Option(None, help="Maximum directory depth below source_dir (0 = top level only)"),
+    local_search: bool = typer.Option(True, help="Search the local title index (see index-tmdb) before TMDb, when it has been built"),
+    stage: str = typer.Option("all", help="'discover': only queue new files; 'fetch': also fetch TMDb candidates of queued files, unattended; 'all': then decide (prompt, or --auto)")
 ):
-    """Scan directory and build movie database using TMDb v4 API (Bearer token)."""
+    """
+    Scan directory and build movie database using TMDb v4 API (Bearer token).
+    Progress is kept in a queue in the database: an interrupted scan picks up where it stopped.
+    """
+    if stage not in SCAN_STAGES:
+        typer.echo(f"Unknown stage '{stage}'. Use one of: {', '.join(SCAN_STAGES)}.")
+        raise typer.Exit(1)
+    # An offline scan only reads the cache, and discovering files needs no TMDb at all
+    if offline or stage == "discover":
+        tmdb_bearer_token = tmdb_bearer_token or ""
+    elif not tmdb_bearer_token:
+        tmdb_bearer_token = typer.prompt("Tmdb bearer token", hide_input=True)
     init_db()
-    scan_directory(source_dir, tmdb_bearer_token)
+    init_cache()
+    configure_cache(ttl=cache_ttl_days * 24 * 3600, max_entries=cache_max_entries, offline_mode=offline)
+    local_index.enabled = local_search
+    if stage == "discover":
+        discover_files(source_dir, include=include, exclude=exclude, max_depth=max_depth)
+        print_queue_summary(source_dir)
+    elif stage == "fetch":
+        auto_scan_directory(source_dir, tmdb_bearer_token, workers=workers or 8, include=include, exclude=exclude, max_depth=max_depth, decide=False)
+    elif auto:
+        auto_scan_directory(source_dir, tmdb_bearer_token, threshold=threshold, workers=workers or 8, include=include, exclude=exclude, max_depth=max_depth)
+    else:
+        scan_directory(source_dir, tmdb_bearer_token, prefetch_depth=prefetch_depth, workers=workers or 2, include=include, exclude=exclude, max_depth=max_depth)
 
 @app.command()
 def build(
     target_dir: str = typer.Argument(..., help="Directory to create symlinked structure"),
-    mode: str = typer.Option("title", help="Folder structure: 'title' or 'year'"),
+    mode: str = typer.Option("title", help="Layout: title, year, decade, genre, director, collection, or a template such as '{decade}/{genre}/{title} ({year})'"),
     dry_run: bool = typer.Option(False, help="Preview changes without making them"),
     script: str = typer.Option(None, help="Path to bash script to write ln -s commands instead of executing them"),
     source_root: str = typer.Option(None, help="Source root to prepend to relative paths in script mode (for remote/mounted filesystems)"),
-    effective_source_root: str = typer.Option(None, help="Effective source root for script (for remote/mounted filesystems)")
+    effective_source_root: str = typer.Option(None, help="Effective source root for script (for remote/mounted filesystems)"),
+    genre: str = typer.Option(None, help="Only link films of this genre"),
+    year: int = typer.Option(None, help="Only link films released this year"),
+    verify: bool = typer.Option(False, help="Re-check the target tree even if nothing changed since the last build"),
+    script_format: str = typer.Option("ln", help="With --script: 'ln' (one command per link), 'xargs' (batched, NUL-separated lists next to the script) or 'tar' (symlink archive to extract on the remote host)"),
+    layout: List[str] = typer.Option(None, help="Also build LAYOUT=TARGET in the same pass, e.g. --layout genre=/mnt/Genres (repeatable)"),
+    workers: int = typer.Option(16, help="Directories created and linked in parallel (raise it for network shares)")
 ):
     """Build symlinked movie structure from database or generate a bash script."""
-    build_structure(target_dir, mode=mode, dry_run=dry_run, script_path=script, source_root=source_root, effective_source_root=effective_source_root)
+    try:
+        extra_targets = parse_targets(layout or [])
+    except ValueError as e:
+        typer.echo(str(e))
+        raise typer.Exit(1)
+    init_db()
+    build_structure(target_dir, mode=mode, dry_run=dry_run, script_path=script, source_root=source_root, effective_source_root=effective_source_root, only_genre=genre, only_year=year, verify=verify, script_format=script_format, extra_targets=extra_targets, workers=workers)
+
+@app.command()
+def probe(
+    workers: int = typer.Option(8, help="Files probed in parallel"),
+    force: bool = typer.Option(False, help="Probe every file again, even if unchanged since its last probe")
+):
+    """Read duration, resolution, codec and audio languages from the headers of every recorded file."""
+    init_db()
+    start = time.perf_counter()
+    counts = probe_files(get_all_file_paths(), force=force, workers=workers)
+    elapsed = time.perf_counter() - start
+    typer.echo(
+        f"{counts['probed']} probed, {counts['unchanged']} unchanged, {counts['unknown']} unreadable format, "
+        f"{counts['missing']} missing in {elapsed:.1f}s"
+    )
+
+@app.command()
+def refresh(
+    tmdb_bearer_token: str = typer.Option(..., prompt=True, hide_input=True, help="TMDb V4 Bearer Token"),
+    max_age_days: float = typer.Option(None, help="Also refresh films whose details are older than this many days"),
+    all_films: bool = typer.Option(False, "--all", help="Refresh every linked film"),
+    workers: int = typer.Option(8, help="Concurrent TMDb requests (the client's rate limit still applies)"),
+    dry_run: bool = typer.Option(False, help="Only count the films that would be refreshed")
+):
+    """Refetch TMDb details of films whose stored metadata is missing, incomplete or stale."""
+    init_db()
+    init_cache()
+    refresh_metadata(tmdb_bearer_token, max_age_days=max_age_days, refresh_all=all_films, workers=workers, dry_run=dry_run)
 
 @app.command()
 def reset():
@@ -35,14 +149,66 @@ def reset():
     typer.echo("Database reset.")
 
 @app.command()
-def dedup_files():
-    """Interactively deduplicate files with the same TMDb ID."""
-    dedup()
+def dedup_files(
+    policy: List[str] = typer.Option(None, help="Decide without prompting: keep-largest, keep-newest, prefer-resolution[=2160p,1080p], prefer-codec=x265,x264 or prefer-path=PREFIX. Repeat to break ties"),
+    dry_run: bool = typer.Option(False, help="With --policy: show what would be kept and skipped without changing anything")
+):
+    """Deduplicate files with the same TMDb ID, interactively or by policy."""
+    init_db()
+    if policy:
+        dedup_with_policies(policy, dry_run=dry_run)
+    else:
+        dedup()
 
 @app.command()
-def review():
+def find_duplicates(
+    dirs: List[str] = typer.Argument(None, help="Also check the video files under these directories (default: database files only)"),
+    full: bool = typer.Option(False, help="Confirm candidate groups with a hash of the whole file"),
+    workers: int = typer.Option(8, help="Files hashed in parallel"),
+    skip: bool = typer.Option(False, help="Mark all but one file of each group to be skipped")
+):
+    """Find files with identical content, even when matched to different films or not matched at all."""
+    init_db()
+    dedup_content(dirs, full=full, workers=workers, mark_skip=skip)
+
+@app.command()
+def review(
+    offline: bool = typer.Option(False, help="Serve TMDb responses from the local cache only, never use the network"),
+    pending: bool = typer.Option(False, help="Work through files that 'scan --auto' could not match confidently"),
+    search: str = typer.Option(None, help="Only show files whose title or path contains this text"),
+    unmatched: bool = typer.Option(False, help="Only show files without a TMDb match"),
+    ignored: bool = typer.Option(False, help="Only show ignored (skipped) files"),
+    page_size: int = typer.Option(25, help="Files per page")
+):
     """Review and edit movie database entries."""
-    review_database()
+    init_db()
+    init_cache()
+    configure_cache(offline_mode=offline)
+    if pending:
+        review_pending()
+    else:
+        review_database(search=search, unmatched=unmatched, skipped=ignored, page_size=page_size)
+
+@app.command()
+def index_tmdb(
+    export: str = typer.Argument(None, help="TMDb daily movie ID export (movie_ids_MM_DD_YYYY.json.gz); downloaded if omitted"),
+    include_adult: bool = typer.Option(False, help="Index adult titles too")
+):
+    """Build the local title index that scans search before asking TMDb."""
+    init_db()
+    if export is None:
+        typer.echo(f"Downloading {export_url()}...")
+        export = download_export()
+    start = time.perf_counter()
+    count = load_export(export, include_adult=include_adult)
+    typer.echo(f"Indexed {count} films in {time.perf_counter() - start:.1f}s.")
+
+@app.command()
+def clear_tmdb_cache():
+    """Remove all cached TMDb responses."""
+    init_cache()
+    clear_cache()
+    typer.echo("TMDb cache cleared.")
 
 if __name__ == "__main__":
     app()
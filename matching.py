@@ -0,0 +1,91 @@
+import math
+import re
+import unicodedata
+from difflib import SequenceMatcher
+from typing import List, Optional, Tuple
+
+# Candidates scoring at least this much are accepted without asking
+AUTO_MATCH_THRESHOLD = 0.8
+# ...as long as the runner-up is not this close behind
+AUTO_MATCH_MARGIN = 0.05
+
+# Relative weight of each signal, summing to 1
+WEIGHTS = {
+    "title": 0.6,
+    "year": 0.25,
+    "runtime": 0.1,
+    "popularity": 0.05,
+}
+
+def normalize_title(title: str) -> str:
+    # Fold accents, drop punctuation and a leading article so "The Matrix" == "matrix"
+    title = unicodedata.normalize("NFKD", title or "").encode("ascii", "ignore").decode("ascii")
+    title = re.sub(r"[^a-z0-9]+", " ", title.lower()).strip()
+    title = re.sub(r"^(the|a|an|il|la|lo|le|gli|i) ", "", title)
+    return title
+
+def title_similarity(guess: str, title: str) -> float:
+    a, b = normalize_title(guess), normalize_title(title)
+    if not a or not b:
+        return 0.0
+    return SequenceMatcher(None, a, b).ratio()
+
+def release_year(movie: dict) -> str:
+    """The film's year as text: from release_date, else the local index's "year"; "" when unknown."""
+    return (movie.get("release_date") or "")[:4] or str(movie.get("year") or "")
+
+def year_score(year_guess: Optional[int], release_date: str) -> float:
+    year = int((release_date or "")[:4] or 0)
+    if not year_guess or not year:
+        return 0.5  # No information either way
+    diff = abs(year - year_guess)
+    # Festival vs. theatrical release dates are often a year apart
+    return {0: 1.0, 1: 0.6}.get(diff, 0.0)
+
+def runtime_score(duration: Optional[float], runtime_minutes: Optional[int]) -> float:
+    if not duration or not runtime_minutes:
+        return 0.5
+    diff_minutes = abs(duration / 60 - runtime_minutes)
+    return max(0.0, 1 - diff_minutes / 20)
+
+def popularity_score(popularity: Optional[float]) -> float:
+    # log scale: obscure titles ~0, blockbusters (popularity ~100+) ~1
+    return min(1.0, math.log10(1 + (popularity or 0)) / 2)
+
+def find_director(details) -> str:
+    if details and 'credits' in details:
+        for crew in details['credits'].get('crew', []):
+            if crew.get('job') == 'Director':
+                return crew.get('name')
+    return ''
+
+def score_candidate(title_guess: str, year_guess: Optional[int], candidate: dict, details: Optional[dict] = None, duration: Optional[float] = None) -> float:
+    """
+    Confidence (0-1) that a TMDb candidate is the film guessed from a filename.
+    duration is the file duration in seconds, when known.
+    """
+    movie = details or candidate
+    title = max(
+        title_similarity(title_guess, movie.get("title", "")),
+        title_similarity(title_guess, movie.get("original_title", "")),
+    )
+    return (
+        WEIGHTS["title"] * title
+        + WEIGHTS["year"] * year_score(year_guess, release_year(movie))
+        + WEIGHTS["runtime"] * runtime_score(duration, movie.get("runtime"))
+        + WEIGHTS["popularity"] * popularity_score(movie.get("popularity"))
+    )
+
+def rank_candidates(title_guess: str, year_guess: Optional[int], candidates: list, candidate_details: list, duration: Optional[float] = None) -> List[Tuple[float, dict]]:
+    """Returns (score, movie) pairs, best first. movie is the full details when they were fetched."""
+    ranked = [
+        (score_candidate(title_guess, year_guess, c, d, duration), d or c)
+        for c, d in zip(candidates, candidate_details)
+    ]
+    ranked.sort(key=lambda pair: pair[0], reverse=True)
+    return ranked
+
+def is_confident(ranked: List[Tuple[float, dict]], threshold: float = AUTO_MATCH_THRESHOLD) -> bool:
+    if not ranked or ranked[0][0] < threshold:
+        return False
+    return len(ranked) == 1 or ranked[0][0] - ranked[1][0] >= AUTO_MATCH_MARGIN
@@ -0,0 +1,153 @@
+import json
+import threading
+import time
+from contextlib import nullcontext
+from functools import wraps
+from typing import Dict, List
+from rich.console import Console
+from rich.table import Table
+
+# Set by --profile. While off, span() and count() cost one global lookup.
+enabled = False
+# Keep every span, not just the totals, for a Chrome trace
+keep_events = False
+# Set by --quiet: no line per file, only summaries and errors
+quiet = False
+
+# Spans kept for a trace; past this the totals are still counted but the trace is cut short
+MAX_EVENTS = 1_000_000
+
+console = Console()
+
+_lock = threading.Lock()
+_spans: Dict[str, List[float]] = {}   # name -> [calls, total seconds, max seconds]
+_counters: Dict[str, int] = {}
+_events: List[tuple] = []             # (name, start, end, thread id)
+_threads: Dict[int, str] = {}
+_start = time.perf_counter()
+
+def enable(keep_trace: bool = False):
+    """Turn profiling on and reset everything recorded so far."""
+    global enabled, keep_events, _start
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+        _events.clear()
+        _threads.clear()
+        enabled = True
+        keep_events = keep_trace
+        _start = time.perf_counter()
+
+def record(name: str, start: float, end: float):
+    """Add one timed span (perf_counter values) to the totals, and to the trace if one is kept."""
+    elapsed = end - start
+    with _lock:
+        s = _spans.get(name)
+        if s is None:
+            s = _spans[name] = [0, 0.0, 0.0]
+        s[0] += 1
+        s[1] += elapsed
+        if elapsed > s[2]:
+            s[2] = elapsed
+        if keep_events and len(_events) < MAX_EVENTS:
+            tid = threading.get_ident()
+            _events.append((name, start, end, tid))
+            if tid not in _threads:
+                _threads[tid] = threading.current_thread().name
+
+def count(name: str, n: int = 1):
+    """Add n to a counter (calls, cache hits, bytes...)."""
+    if not enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, self.start, time.perf_counter())
+        return False
+
+_null = nullcontext()
+
+def span(name: str):
+    """
+    Time a block:
+
+        with perf.span("db write"):
+            ...
+    """
+    return _Span(name) if enabled else _null
+
+def timed(name: str):
+    """Decorator form of span()."""
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return fn(*args, **kwargs)
+            t = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record(name, t, time.perf_counter())
+        return wrapper
+    return decorate
+
+def elapsed() -> float:
+    return time.perf_counter() - _start
+
+def summary() -> dict:
+    wall = elapsed()
+    with _lock:
+        spans = {
+            name: {"calls": int(calls), "total": total, "mean": total / calls, "max": peak}
+            for name, (calls, total, peak) in sorted(_spans.items(), key=lambda kv: kv[1][1], reverse=True)
+        }
+        counters = dict(sorted(_counters.items()))
+    return {"wall": wall, "spans": spans, "counters": counters}
+
+def print_report():
+    data = summary()
+    wall = data["wall"]
+    table = Table(title=f"Profile ({wall:.2f}s wall clock)")
+    table.add_column("Stage")
+    table.add_column("Calls", justify="right")
+    table.add_column("Total (s)", justify="right")
+    table.add_column("Mean (ms)", justify="right")
+    table.add_column("Max (ms)", justify="right")
+    table.add_column("% of wall", justify="right")
+    for name, s in data["spans"].items():
+        # Spans on worker threads overlap, so the percentages can add up to more than 100
+        table.add_row(name, str(s["calls"]), f"{s['total']:.3f}", f"{s['mean'] * 1000:.2f}", f"{s['max'] * 1000:.2f}",
+                      f"{s['total'] / wall * 100:.0f}%" if wall > 0 else "-")
+    console.print(table)
+    if data["counters"]:
+        console.print("[bold]Counters:[/bold] " + ", ".join(f"{name} {value:,}" for name, value in data["counters"].items()))
+
+def write_json(path: str, command: str = None):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"command": command, **summary()}, f, indent=2)
+
+def write_chrome_trace(path: str):
+    """Every span as a complete event ("ph": "X", microseconds), for chrome://tracing or ui.perfetto.dev."""
+    with _lock:
+        events = list(_events)
+        threads = dict(_threads)
+    trace = [{"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": name}} for tid, name in threads.items()]
+    trace.extend(
+        {"name": name, "ph": "X", "pid": 1, "tid": tid, "ts": (s - _start) * 1e6, "dur": (e - s) * 1e6}
+        for name, s, e, tid in events
+    )
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f, separators=(",", ":"))
+    if len(events) >= MAX_EVENTS:
+        console.print(f"[yellow]Trace cut short after {MAX_EVENTS:,} spans; the totals cover the whole run.[/yellow]")
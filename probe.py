@@ -0,0 +1,341 @@
+import mmap
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, NamedTuple, Optional, Tuple
+from db import get_media_info, save_media_info
+import perf
+
+# Header parsing is cheap; the time goes into (network) reads, so threads are the right pool
+PROBE_WORKERS = 8
+# Largest moov atom or AVI hdrl list read into memory
+MAX_HEADER_SIZE = 64 * 1024 * 1024
+
+class MediaInfo(NamedTuple):
+    duration: Optional[float]  # Seconds
+    width: Optional[int]
+    height: Optional[int]
+    video_codec: Optional[str]
+    audio_languages: Tuple[str, ...] = ()
+
+# Codec names folded into filename_parser's spellings, so tags and probes compare
+CODECS = {
+    "V_MPEG4/ISO/AVC": "x264", "avc1": "x264", "avc3": "x264", "H264": "x264", "X264": "x264", "AVC1": "x264",
+    "V_MPEGH/ISO/HEVC": "x265", "hvc1": "x265", "hev1": "x265", "HEVC": "x265", "H265": "x265", "X265": "x265",
+    "V_AV1": "av1", "av01": "av1", "AV01": "av1",
+    "V_VP9": "vp9", "vp09": "vp9", "VP90": "vp9",
+    "XVID": "xvid", "DIVX": "divx", "DX50": "divx", "DIV3": "divx",
+    "V_MPEG4/ISO/ASP": "mpeg4", "V_MPEG4/ISO/SP": "mpeg4", "mp4v": "mpeg4", "FMP4": "mpeg4",
+    "V_MPEG2": "mpeg2", "MPG2": "mpeg2",
+}
+
+def canonical_codec(codec: Optional[str]) -> Optional[str]:
+    if not codec:
+        return None
+    codec = codec.strip("\0 ")
+    return CODECS.get(codec, CODECS.get(codec.upper(), codec.lower()))
+
+def resolution_label(width: Optional[int], height: Optional[int]) -> Optional[str]:
+    """filename_parser-style resolution tag. Width counts too, so a 1920x800 scope encode is still 1080p."""
+    if not width or not height:
+        return None
+    for label, min_width, min_height in (("2160p", 3200, 1800), ("1080p", 1800, 1000), ("720p", 1200, 700), ("576p", 1000, 560)):
+        if width >= min_width or height >= min_height:
+            return label
+    return "480p"
+
+# --- Matroska (EBML) ---
+
+EBML_SEGMENT = 0x18538067
+EBML_INFO = 0x1549A966
+EBML_TRACKS = 0x1654AE6B
+EBML_CLUSTER = 0x1F43B675
+EBML_TIMESTAMP_SCALE = 0x2AD7B1
+EBML_DURATION = 0x4489
+EBML_TRACK_ENTRY = 0xAE
+EBML_TRACK_TYPE = 0x83
+EBML_CODEC_ID = 0x86
+EBML_LANGUAGE = 0x22B59C
+EBML_LANGUAGE_BCP47 = 0x22B59D
+EBML_VIDEO = 0xE0
+EBML_PIXEL_WIDTH = 0xB0
+EBML_PIXEL_HEIGHT = 0xBA
+
+def _vint(buf, pos: int, keep_marker: bool) -> Tuple[int, int, bool]:
+    """(value, position after it, all value bits set) of the EBML variable-length integer at pos."""
+    first = buf[pos]
+    if not first:
+        raise ValueError("invalid EBML integer")
+    length = 9 - first.bit_length()
+    value = first if keep_marker else first & (0xFF >> length)
+    for b in buf[pos + 1:pos + length]:
+        value = (value << 8) | b
+    unknown = not keep_marker and value == (1 << (7 * length)) - 1
+    return value, pos + length, unknown
+
+def _elements(buf, start: int, end: int):
+    """Yield (id, data start, data end) of the EBML elements in buf[start:end]."""
+    pos = start
+    while pos < end - 1:
+        element_id, pos, _ = _vint(buf, pos, keep_marker=True)
+        size, pos, unknown = _vint(buf, pos, keep_marker=False)
+        data_end = end if unknown else min(end, pos + size)
+        yield element_id, pos, data_end
+        pos = data_end
+
+def _uint(buf, start: int, end: int) -> int:
+    return int.from_bytes(buf[start:end], "big")
+
+def _matroska_track(buf, start: int, end: int) -> dict:
+    track = {"language": "eng"}  # The Matroska default
+    for element_id, s, e in _elements(buf, start, end):
+        if element_id == EBML_TRACK_TYPE:
+            track["type"] = _uint(buf, s, e)
+        elif element_id == EBML_CODEC_ID:
+            track["codec"] = bytes(buf[s:e]).decode("ascii", "ignore")
+        elif element_id == EBML_LANGUAGE:
+            track["language"] = bytes(buf[s:e]).decode("ascii", "ignore").strip("\0")
+        elif element_id == EBML_LANGUAGE_BCP47:
+            track["language_bcp47"] = bytes(buf[s:e]).decode("ascii", "ignore").strip("\0")
+        elif element_id == EBML_VIDEO:
+            for video_id, vs, ve in _elements(buf, s, e):
+                if video_id == EBML_PIXEL_WIDTH:
+                    track["width"] = _uint(buf, vs, ve)
+                elif video_id == EBML_PIXEL_HEIGHT:
+                    track["height"] = _uint(buf, vs, ve)
+    return track
+
+def probe_matroska(buf) -> Optional[MediaInfo]:
+    segment = next(((s, e) for element_id, s, e in _elements(buf, 0, len(buf)) if element_id == EBML_SEGMENT), None)
+    if segment is None:
+        return None
+    scale, duration, tracks = 1000000, None, []
+    for element_id, s, e in _elements(buf, *segment):
+        if element_id == EBML_INFO:
+            for info_id, i_s, i_e in _elements(buf, s, e):
+                if info_id == EBML_TIMESTAMP_SCALE:
+                    scale = _uint(buf, i_s, i_e)
+                elif info_id == EBML_DURATION:
+                    duration = struct.unpack(">f" if i_e - i_s == 4 else ">d", buf[i_s:i_e])[0]
+        elif element_id == EBML_TRACKS:
+            tracks = [_matroska_track(buf, ts, te) for track_id, ts, te in _elements(buf, s, e) if track_id == EBML_TRACK_ENTRY]
+        elif element_id == EBML_CLUSTER:
+            break  # Media data: the headers are behind us
+    video = next((t for t in tracks if t.get("type") == 1), {})
+    return MediaInfo(
+        duration=duration * scale / 1e9 if duration else None,
+        width=video.get("width"),
+        height=video.get("height"),
+        video_codec=canonical_codec(video.get("codec")),
+        audio_languages=tuple(t.get("language_bcp47") or t["language"] for t in tracks if t.get("type") == 2),
+    )
+
+# --- MP4 / QuickTime ---
+
+MP4_CONTAINERS = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+
+def _atoms(data, start: int, end: int):
+    """Yield (type, data start, data end) of the atoms in data[start:end]."""
+    pos = start
+    while pos + 8 <= end:
+        size, kind = struct.unpack(">I4s", data[pos:pos + 8])
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", data[pos + 8:pos + 16])[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            return
+        yield kind, pos + header, min(end, pos + size)
+        pos += size
+
+def _find_moov(f, file_size: int) -> Optional[bytes]:
+    # Walk the top-level atoms by their headers only: moov can sit after gigabytes of mdat
+    pos = 0
+    while pos + 8 <= file_size:
+        f.seek(pos)
+        header = f.read(16)
+        size, kind = struct.unpack(">I4s", header[:8])
+        header_size = 8
+        if size == 1:
+            size, header_size = struct.unpack(">Q", header[8:16])[0], 16
+        elif size == 0:
+            size = file_size - pos
+        if size < header_size:
+            return None
+        if kind == b"moov":
+            if size > MAX_HEADER_SIZE:
+                return None
+            f.seek(pos)
+            return f.read(size)
+        pos += size
+    return None
+
+def _mp4_language(code: int) -> str:
+    return "".join(chr(((code >> shift) & 0x1F) + 0x60) for shift in (10, 5, 0))
+
+def _mp4_tracks(data, start: int, end: int, tracks: list, track: Optional[dict] = None):
+    for kind, s, e in _atoms(data, start, end):
+        if kind == b"trak":
+            track = {}
+            tracks.append(track)
+            _mp4_tracks(data, s, e, tracks, track)
+        elif kind in MP4_CONTAINERS:
+            _mp4_tracks(data, s, e, tracks, track)
+        elif track is None:
+            continue
+        elif kind == b"tkhd" and e - s >= 8:
+            track["width"], track["height"] = (v >> 16 for v in struct.unpack(">II", data[e - 8:e]))
+        elif kind == b"mdhd":
+            # After version/flags, creation and modification times, timescale and duration (32 or 64 bit)
+            offset = s + (20 if data[s] == 0 else 32)
+            track["language"] = _mp4_language(struct.unpack(">H", data[offset:offset + 2])[0])
+        elif kind == b"hdlr":
+            track["handler"] = bytes(data[s + 8:s + 12])
+        elif kind == b"stsd" and e - s >= 16:
+            track["codec"] = bytes(data[s + 12:s + 16]).decode("ascii", "ignore")
+
+def probe_mp4(f, file_size: int) -> Optional[MediaInfo]:
+    moov = _find_moov(f, file_size)
+    if moov is None:
+        return None
+    duration, tracks = None, []
+    for kind, s, e in _atoms(moov, 8, len(moov)):
+        if kind == b"mvhd":
+            if moov[s] == 0:
+                timescale, length = struct.unpack(">II", moov[s + 12:s + 20])
+            else:
+                timescale, length = struct.unpack(">IQ", moov[s + 20:s + 32])
+            duration = length / timescale if timescale else None
+    _mp4_tracks(moov, 8, len(moov), tracks)
+    video = next((t for t in tracks if t.get("handler") == b"vide"), {})
+    return MediaInfo(
+        duration=duration,
+        width=video.get("width") or None,
+        height=video.get("height") or None,
+        video_codec=canonical_codec(video.get("codec")),
+        audio_languages=tuple(t["language"] for t in tracks if t.get("handler") == b"soun" and t.get("language") and t["language"] != "und"),
+    )
+
+# --- AVI (RIFF) ---
+
+def _chunks(data, start: int, end: int):
+    """Yield (fourcc, list type or None, data start, data end) of the RIFF chunks in data[start:end]."""
+    pos = start
+    while pos + 8 <= end:
+        fourcc, size = struct.unpack("<4sI", data[pos:pos + 8])
+        s, e = pos + 8, min(end, pos + 8 + size)
+        if fourcc == b"LIST":
+            yield fourcc, bytes(data[s:s + 4]), s + 4, e
+        else:
+            yield fourcc, None, s, e
+        pos = e + (size & 1)  # Chunks are word aligned
+
+def probe_avi(f) -> Optional[MediaInfo]:
+    head = f.read(24)
+    if head[8:12] != b"AVI " or head[12:16] != b"LIST" or head[20:24] != b"hdrl":
+        return None
+    size = struct.unpack("<I", head[16:20])[0]
+    if size > MAX_HEADER_SIZE:
+        return None
+    if size < 4:
+        return None  # Corrupt: a negative read would load the rest of the file
+    hdrl = head[12:] + f.read(size - 4)
+    duration = width = height = codec = None
+    for fourcc, list_type, s, e in _chunks(hdrl, 12, len(hdrl)):
+        if fourcc == b"avih" and e - s >= 40:
+            usec_per_frame, _, _, _, total_frames = struct.unpack("<5I", hdrl[s:s + 20])
+            width, height = struct.unpack("<II", hdrl[s + 32:s + 40])
+            duration = usec_per_frame * total_frames / 1e6 or None
+        elif list_type == b"strl":
+            stream = {c: (cs, ce) for c, _, cs, ce in _chunks(hdrl, s, e)}
+            if b"strh" not in stream:
+                continue
+            hs, he = stream[b"strh"]
+            if hdrl[hs:hs + 4] != b"vids" or codec:
+                continue
+            codec = bytes(hdrl[hs + 4:hs + 8]).decode("ascii", "ignore")
+            if b"strf" in stream and stream[b"strf"][1] - stream[b"strf"][0] >= 20:
+                fs = stream[b"strf"][0]
+                codec = bytes(hdrl[fs + 16:fs + 20]).decode("ascii", "ignore") or codec
+            if he - hs >= 36:
+                scale, rate, _, length = struct.unpack("<4I", hdrl[hs + 20:hs + 36])
+                if scale and rate and length:
+                    duration = length * scale / rate
+    # AVI carries no usable audio language information
+    return MediaInfo(duration=duration, width=width, height=height, video_codec=canonical_codec(codec))
+
+@perf.timed("probe")
+def probe_file(path: str) -> Optional[MediaInfo]:
+    """Read duration, resolution, codec and audio languages from the container headers. None if unknown."""
+    with open(path, "rb") as f:
+        file_size = os.fstat(f.fileno()).st_size
+        magic = f.read(12)
+        f.seek(0)
+        try:
+            if magic[:4] == b"\x1a\x45\xdf\xa3":
+                # mmap: only the pages holding the headers are actually read
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    return probe_matroska(m)
+            if magic[:4] == b"RIFF":
+                return probe_avi(f)
+            if magic[4:8] in (b"ftyp", b"moov", b"free", b"mdat", b"wide", b"skip"):
+                return probe_mp4(f, file_size)
+        except (ValueError, IndexError, struct.error):
+            return None  # Truncated or corrupt header
+    return None
+
+def probe_row(path: str) -> Optional[Tuple[str, int, float, Optional[MediaInfo]]]:
+    """(path, size, mtime, MediaInfo or None) as save_media_info records it; None if the file cannot be read."""
+    try:
+        st = os.stat(path)
+        return path, st.st_size, st.st_mtime, probe_file(path)
+    except OSError:
+        return None
+
+def format_media(duration: Optional[float], width: Optional[int], height: Optional[int], codec: Optional[str]) -> str:
+    """Short description for tables, e.g. "1080p x265 2h16m"."""
+    parts = [resolution_label(width, height), codec]
+    if duration:
+        minutes = int(duration // 60)
+        parts.append(f"{minutes // 60}h{minutes % 60:02d}m")
+    return " ".join(p for p in parts if p)
+
+def probe_files(paths: Iterable[str], force: bool = False, workers: int = PROBE_WORKERS,
+                progress: Optional[Callable[[str, Optional[MediaInfo]], None]] = None) -> Dict[str, int]:
+    """
+    Probe files on a thread pool and record the results. Files whose size and mtime match their
+    recorded probe are skipped unless force is set. Returns counts of probed, unchanged, unknown and missing files.
+    """
+    paths = list(paths)
+    recorded = {} if force else get_media_info(paths)
+    counts = {"probed": 0, "unchanged": 0, "unknown": 0, "missing": 0}
+
+    def work(path):
+        known = recorded.get(path)
+        if known:
+            try:
+                st = os.stat(path)
+            except OSError:
+                return path, "missing", None
+            if known[0] == st.st_size and known[1] == st.st_mtime:
+                return path, "unchanged", None
+        row = probe_row(path)
+        if row is None:
+            return path, "missing", None
+        return path, "probed" if row[3] else "unknown", row
+
+    rows = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for path, outcome, row in pool.map(work, paths):
+            counts[outcome] += 1
+            if row:
+                rows.append(row)
+                if progress:
+                    progress(path, row[3])
+            if len(rows) >= 500:
+                save_media_info(rows)
+                rows.clear()
+    save_media_info(rows)
+    return counts
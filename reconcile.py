@@ -0,0 +1,217 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Set, Tuple
+from rich.console import Console
+from rich.table import Table
+import perf
+
+console = Console()
+
+# Operations listed per kind in a dry run; the rest are only counted
+DRY_RUN_EXAMPLES = 10
+# Directories worked on in parallel by apply_plan. On a network share every call is a round trip,
+# so many in flight at once is what makes a large build fast.
+FS_WORKERS = 16
+# dir_fd-relative calls only resolve the last path component; not every platform has them (e.g. Windows)
+_DIR_FD = {os.mkdir, os.symlink, os.unlink, os.rename} <= os.supports_dir_fd
+
+@perf.timed("build: scan target tree")
+def scan_target_tree(target_dir: str) -> Tuple[Dict[str, str], Set[str], Set[str]]:
+    """
+    One pass over target_dir. Returns (symlinks: path -> link target, other file paths, directories).
+    Symlinked directories are reported as symlinks and not followed.
+    """
+    links: Dict[str, str] = {}
+    others: Set[str] = set()
+    dirs: Set[str] = set()
+    if not os.path.isdir(target_dir):
+        return links, others, dirs
+    stack = [target_dir]
+    while stack:
+        path = stack.pop()
+        dirs.add(path)
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    if entry.is_symlink():
+                        links[entry.path] = os.readlink(entry.path)
+                    elif entry.is_dir():
+                        stack.append(entry.path)
+                    else:
+                        others.add(entry.path)
+        except OSError:
+            continue
+    return links, others, dirs
+
+@perf.timed("build: plan")
+def plan_build(desired: Dict[str, str], links: Dict[str, str], others: Set[str], manifest: Dict[str, str]) -> dict:
+    """
+    Diff the links the database wants against what is on disk.
+    Only links recorded in the manifest (i.e. created by an earlier build) are ever retargeted or removed.
+    """
+    plan = {"create": {}, "retarget": {}, "remove": [], "collisions": [], "unchanged": 0, "forget": []}
+    for link, src in desired.items():
+        if link in others:
+            plan["collisions"].append(link)
+        elif link not in links:
+            plan["create"][link] = src
+        elif links[link] == src:
+            plan["unchanged"] += 1
+        elif link in manifest:
+            plan["retarget"][link] = src
+        else:
+            plan["collisions"].append(link)
+    for link in manifest:
+        if link in desired:
+            continue
+        if link in links:
+            plan["remove"].append(link)
+        else:
+            plan["forget"].append(link)  # Already gone from disk
+    return plan
+
+def _prune_empty_dirs(paths, target_dir: str):
+    # Deepest first, never above target_dir
+    for path in sorted(set(paths), key=len, reverse=True):
+        while path.startswith(target_dir + os.sep):
+            try:
+                os.rmdir(path)
+            except OSError:
+                break  # Not empty (or not ours to remove)
+            path = os.path.dirname(path)
+
+def _missing_dirs(links, target_dir: str, existing_dirs: Set[str]) -> List[List[str]]:
+    """Directories (ancestors included, each once) the links need below target_dir, grouped by depth, shallowest first."""
+    missing: Set[str] = set()
+    for d in {os.path.dirname(link) for link in links}:
+        while d not in existing_dirs and d not in missing and d.startswith(target_dir + os.sep):
+            missing.add(d)
+            d = os.path.dirname(d)
+    levels: Dict[int, List[str]] = {}
+    for d in missing:
+        levels.setdefault(d.count(os.sep), []).append(d)
+    return [sorted(levels[depth]) for depth in sorted(levels)]
+
+def _group_by_dir(ops) -> List[Tuple[str, List[tuple]]]:
+    """(kind, path, src) operations -> [(directory, [(kind, name, src)])], sorted by directory."""
+    groups: Dict[str, List[tuple]] = {}
+    for kind, path, src in ops:
+        directory, name = os.path.split(path)
+        groups.setdefault(directory, []).append((kind, name, src))
+    return sorted(groups.items())
+
+def _apply_in_dir(directory: str, ops: List[tuple]) -> List[Tuple[str, str]]:
+    """
+    Run the operations of one directory through a single descriptor, so each call resolves just the name
+    instead of the whole path again (a round trip per component on a network share). Returns [(path, error)].
+    """
+    errors = []
+    fd = None
+    try:
+        if _DIR_FD:
+            fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        for kind, name, src in ops:
+            path = os.path.join(directory, name)
+            target = name if fd is not None else path
+            try:
+                if kind == "mkdir":
+                    with perf.span("fs: mkdir"):
+                        try:
+                            os.mkdir(target, dir_fd=fd)
+                        except FileExistsError:
+                            if not os.path.isdir(path):
+                                raise
+                elif kind == "symlink":
+                    with perf.span("fs: symlink"):
+                        os.symlink(src, target, dir_fd=fd)
+                elif kind == "retarget":
+                    # Replace atomically: the old link stays valid until the new one is in place.
+                    # os.rename overwrites on POSIX, the only place dir_fd is used; os.replace elsewhere.
+                    tmp = f"{target}.movieorg-tmp"
+                    with perf.span("fs: retarget"):
+                        try:
+                            os.unlink(tmp, dir_fd=fd)  # Left behind by an interrupted retarget
+                        except FileNotFoundError:
+                            pass
+                        os.symlink(src, tmp, dir_fd=fd)
+                        if fd is not None:
+                            os.rename(tmp, target, src_dir_fd=fd, dst_dir_fd=fd)
+                        else:
+                            os.replace(tmp, target)
+                else:
+                    with perf.span("fs: unlink"):
+                        os.unlink(target, dir_fd=fd)
+            except OSError as e:
+                errors.append((path, e.strerror or str(e)))
+    except OSError as e:
+        # The directory itself could not be opened (e.g. its creation failed): every operation in it fails
+        errors.extend((os.path.join(directory, name), e.strerror or str(e)) for _, name, _ in ops)
+    finally:
+        if fd is not None:
+            os.close(fd)
+    return errors
+
+def apply_plan(plan: dict, target_dir: str, existing_dirs: Set[str], workers: int = FS_WORKERS) -> List[Tuple[str, str]]:
+    """
+    Apply a plan from plan_build. Returns [(path, error)] for operations that failed.
+    Directories are created first, level by level, then links are created, retargeted and removed;
+    both run on `workers` threads, one task per directory.
+    """
+    errors = []
+    if plan["create"]:
+        try:
+            os.makedirs(target_dir, exist_ok=True)
+        except OSError as e:
+            return [(target_dir, e.strerror or str(e))]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        # Siblings are independent once their parent exists, so each level is created in parallel
+        for level in _missing_dirs(plan["create"], target_dir, existing_dirs):
+            for result in pool.map(lambda group: _apply_in_dir(*group), _group_by_dir(("mkdir", d, None) for d in level)):
+                errors.extend(result)
+        ops = [("symlink", link, src) for link, src in plan["create"].items()]
+        ops += [("retarget", link, src) for link, src in plan["retarget"].items()]
+        ops += [("unlink", link, None) for link in plan["remove"]]
+        for result in pool.map(lambda group: _apply_in_dir(*group), _group_by_dir(ops)):
+            errors.extend(result)
+    _prune_empty_dirs((os.path.dirname(link) for link in plan["remove"]), target_dir)
+    return errors
+
+def print_error_summary(errors: List[Tuple[str, str]]):
+    """Failed operations grouped by reason, with a count and an example each, rather than a line per file."""
+    if not errors:
+        return
+    by_reason: Dict[str, List[str]] = {}
+    for path, error in errors:
+        by_reason.setdefault(error, []).append(path)
+    table = Table(title=f"{len(errors)} operations failed")
+    table.add_column("Reason")
+    table.add_column("Count", justify="right")
+    table.add_column("Example")
+    for reason, paths in sorted(by_reason.items(), key=lambda kv: len(kv[1]), reverse=True):
+        table.add_row(reason, str(len(paths)), paths[0], style="red")
+    console.print(table)
+
+def print_plan_summary(plan: dict, dry_run: bool = False):
+    table = Table(title="Build plan (dry run)" if dry_run else "Build")
+    table.add_column("Operation")
+    table.add_column("Links", justify="right")
+    table.add_row("create", str(len(plan["create"])))
+    table.add_row("retarget", str(len(plan["retarget"])))
+    table.add_row("remove", str(len(plan["remove"])))
+    table.add_row("unchanged", str(plan["unchanged"]))
+    table.add_row("collision (skipped)", str(len(plan["collisions"])))
+    console.print(table)
+    if dry_run:
+        for kind, color, ops in (
+            ("Would link", "cyan", [f"{link} -> {src}" for link, src in plan["create"].items()]),
+            ("Would retarget", "cyan", [f"{link} -> {src}" for link, src in plan["retarget"].items()]),
+            ("Would remove", "magenta", plan["remove"]),
+        ):
+            for op in ops[:DRY_RUN_EXAMPLES]:
+                console.print(f"[{color}]{kind}:[/{color}] {op}")
+            if len(ops) > DRY_RUN_EXAMPLES:
+                console.print(f"[{color}]... and {len(ops) - DRY_RUN_EXAMPLES} more[/{color}]")
+    for link in plan["collisions"][:DRY_RUN_EXAMPLES]:
+        console.print(f"[yellow]Collision: {link} exists. Skipping.[/yellow]")
+    if len(plan["collisions"]) > DRY_RUN_EXAMPLES:
+        console.print(f"[yellow]... and {len(plan['collisions']) - DRY_RUN_EXAMPLES} more collisions[/yellow]")
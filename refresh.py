@@ -0,0 +1,101 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Optional, Tuple
+from rich.console import Console
+from rich.progress import Progress, BarColumn, MofNCompleteColumn, TextColumn, TimeRemainingColumn
+from db import get_films_to_refresh, iter_film_metadata, update_films
+from scan import tmdb_v4_search_by_id, tmdb_movie_fields, print_tmdb_report
+from tmdb_client import TMDbError
+
+console = Console()
+
+# Films written per transaction
+REFRESH_BATCH_SIZE = 200
+REFRESH_WORKERS = 8
+# Keys only full movie details have: metadata stored from a search result lacks them. Their presence
+# records that the details were fetched; an empty value (a film with no genres on TMDb) is complete.
+DETAIL_KEYS = ("genres", "runtime", "credits")
+
+def films_to_refresh(max_age_days: Optional[float] = None, refresh_all: bool = False) -> Dict[int, str]:
+    """tmdb_id -> reason for every linked film whose stored details are missing, incomplete or too old."""
+    if refresh_all:
+        cutoff = float("inf")
+    elif max_age_days is not None:
+        cutoff = time.time() - max_age_days * 86400
+    else:
+        cutoff = None
+    films = dict(get_films_to_refresh(cutoff))
+    for tmdb_id, metadata in iter_film_metadata():
+        if tmdb_id in films:
+            continue
+        try:
+            details = json.loads(metadata)
+        except ValueError:
+            films[tmdb_id] = "unreadable"
+            continue
+        if not isinstance(details, dict) or any(k not in details for k in DETAIL_KEYS):
+            films[tmdb_id] = "incomplete"
+    return films
+
+def refresh_metadata(tmdb_bearer_token: str, max_age_days: Optional[float] = None, refresh_all: bool = False,
+                     workers: int = REFRESH_WORKERS, dry_run: bool = False):
+    """
+    Refetch the details of stale films concurrently (the shared client keeps the request rate in bounds)
+    and write them back in batches. Films TMDb no longer knows keep their current details.
+    """
+    films = films_to_refresh(max_age_days, refresh_all)
+    if not films:
+        console.print("[green]All film details are complete and up to date.[/green]")
+        return
+    reasons: Dict[str, int] = {}
+    for reason in films.values():
+        reasons[reason] = reasons.get(reason, 0) + 1
+    console.print(f"[bold]{len(films)} films to refresh:[/bold] " + ", ".join(f"{n} {r}" for r, n in sorted(reasons.items())))
+    if dry_run:
+        return
+
+    updated, not_found, failed = 0, 0, []
+    batch: Dict[int, Tuple[str, int, str, str]] = {}
+
+    def fetch(tmdb_id):
+        try:
+            return tmdb_id, tmdb_v4_search_by_id(tmdb_id, tmdb_bearer_token, fresh=True), None
+        except TMDbError as e:
+            return tmdb_id, None, str(e)
+
+    start = time.perf_counter()
+    with Progress(
+        TextColumn("Refreshing"), BarColumn(), MofNCompleteColumn(),
+        TextColumn("{task.fields[rate]:.1f} films/s"), TimeRemainingColumn(), console=console
+    ) as progress:
+        task = progress.add_task("refresh", total=len(films), rate=0.0)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # Writes stay on this thread, between results, so workers never wait on a transaction
+            for future in as_completed([pool.submit(fetch, tmdb_id) for tmdb_id in films]):
+                tmdb_id, movie, error = future.result()
+                if error:
+                    failed.append((tmdb_id, error))
+                elif movie is None:
+                    not_found += 1
+                else:
+                    _, title, year, genres, metadata = tmdb_movie_fields(movie)
+                    batch[tmdb_id] = (title, year, genres, metadata)
+                    updated += 1
+                if len(batch) >= REFRESH_BATCH_SIZE:
+                    update_films(batch)
+                    batch.clear()
+                elapsed = time.perf_counter() - start
+                done = updated + not_found + len(failed)
+                progress.update(task, completed=done, rate=done / elapsed if elapsed > 0 else 0.0)
+    update_films(batch)
+    elapsed = time.perf_counter() - start
+    console.print(
+        f"[bold]{len(films)} films in {elapsed:.1f}s ({len(films) / elapsed if elapsed > 0 else 0:.1f} films/s): "
+        f"{updated} updated, {not_found} not found on TMDb, {len(failed)} failed[/bold]"
+    )
+    for tmdb_id, error in failed[:10]:
+        console.print(f"[red]Failed: TMDb ID {tmdb_id}: {error}[/red]")
+    if len(failed) > 10:
+        console.print(f"[red]... and {len(failed) - 10} more failures[/red]")
+    print_tmdb_report(tmdb_bearer_token)
@@ -1,10 +1,20 @@
 import os
-import sqlite3
+import json
 from rich.console import Console
 from rich.table import Table
-from rich.prompt import Prompt, IntPrompt
-from db import DB_FILE, update_movie, set_skip_flag
-from scan import tmdb_search_and_select
+from rich.prompt import Prompt
+from db import (
+    transaction, update_movie, set_skip_flag, add_movie, get_pending_matches, set_queue_state, QUEUE_MATCHED,
+    get_review_page, count_review_rows, get_review_row, set_skip_flag_where,
+)
+from scan import tmdb_search_and_select, tmdb_movie_fields, ignore_file
+from probe import format_media
+from matching import release_year
+
+PAGE_SIZE = 25
+
+# absolute_path -> size, for rows recorded without one: each file is statted at most once per session
+_size_cache = {}
 
 def human_size(size):
     for unit in ['B','KB','MB','GB','TB']:
@@ -13,66 +23,148 @@ def human_size(size):
         size /= 1024
     return f"{size:.1f}PB"
 
-def review_database():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT absolute_path, tmdb_id, title, skip FROM movies ORDER BY absolute_path")
-    rows = c.fetchall()
-    conn.close()
+def file_size(abs_path, recorded_size):
+    if recorded_size is not None:
+        return recorded_size
+    if abs_path not in _size_cache:
+        try:
+            _size_cache[abs_path] = os.path.getsize(abs_path)
+        except OSError:
+            _size_cache[abs_path] = None
+    return _size_cache[abs_path]
+
+def describe_filter(search, unmatched, skipped):
+    parts = [f"search '{search}'"] if search else []
+    if unmatched:
+        parts.append("unmatched only")
+    if skipped:
+        parts.append("ignored only")
+    return ", ".join(parts) or "all files"
 
+def review_database(search=None, unmatched=False, skipped=False, page_size=PAGE_SIZE):
+    """
+    Paged review: one page is queried at a time (keyset on the path), and only the edited row is
+    re-read after a change. Filters narrow the list; bulk actions apply to everything they match.
+    """
     console = Console()
+    starts = [None]  # Path after which each visited page starts; the last one is the current page
+    rows = None
     while True:
-        table = Table(show_lines=True)
+        if rows is None:
+            total = count_review_rows(search, unmatched, skipped)
+            rows = get_review_page(starts[-1], page_size, search, unmatched, skipped)
+        table = Table(show_lines=True, title=f"Page {len(starts)} of {max(1, -(-total // page_size))} ({total} files, {describe_filter(search, unmatched, skipped)})")
         table.add_column("#", width=4, justify="right")
         table.add_column("Filename", width=40, overflow="fold")
         table.add_column("TMDb Title (ID)", width=32, overflow="fold")
         table.add_column("File Size", width=10)
+        table.add_column("Media", width=16)
         table.add_column("Ignored", width=8)
-
-        file_info = []
-        for idx, (abs_path, tmdb_id, title, skip) in enumerate(rows):
-            filename = os.path.basename(abs_path)
-            try:
-                size = os.path.getsize(abs_path)
-                size_str = human_size(size)
-            except Exception:
-                size_str = "N/A"
-            file_info.append((abs_path, tmdb_id, title, skip, size_str))
+        for idx, (abs_path, tmdb_id, title, skip, size, *media) in enumerate(rows):
+            size = file_size(abs_path, size)
             table.add_row(
                 str(idx+1),
-                filename[:40],
+                os.path.basename(abs_path)[:40],
                 f"{title} ({tmdb_id})" if tmdb_id else "",
-                size_str,
+                human_size(size) if size is not None else "N/A",
+                format_media(*media),
                 "true" if skip else "false"
             )
-
         console.print(table)
-        sel = IntPrompt.ask("Select a line to edit (0 to exit)", default=0)
-        if sel == 0:
+        command = Prompt.ask(
+            r"Line number to edit, \[n]ext/\[p]revious page, \[/] search, \[u]nmatched only, \[i]gnored only, \[c]lear filters, \[b]ulk action, \[q]uit",
+            default="n" if len(rows) == page_size else "q"
+        ).strip()
+        if command == "q":
             break
-        if not (1 <= sel <= len(file_info)):
+        elif command == "n":
+            if len(rows) == page_size:
+                starts.append(rows[-1][0])
+                rows = None
+            else:
+                console.print("[yellow]Last page.[/yellow]")
+        elif command == "p":
+            if len(starts) > 1:
+                starts.pop()
+                rows = None
+        elif command in ("/", "u", "i", "c"):
+            if command == "/":
+                search = Prompt.ask("Search title or path (empty for all)", default="") or None
+            elif command == "u":
+                unmatched = not unmatched
+            elif command == "i":
+                skipped = not skipped
+            else:
+                search, unmatched, skipped = None, False, False
+            starts, rows = [None], None
+        elif command == "b":
+            action = Prompt.ask(
+                f"For all {total} files matching ({describe_filter(search, unmatched, skipped)}): \\[i]gnore, \\[u]nignore, \\[c]ancel",
+                choices=["i", "u", "c"], default="c"
+            )
+            if action != "c":
+                changed = set_skip_flag_where(action == "i", search, unmatched, skipped)
+                console.print(f"[green]Ignore flag set to {action == 'i'} on {changed} files.[/green]")
+                starts, rows = [None], None
+        elif command.isdigit() and 1 <= int(command) <= len(rows):
+            sel = int(command)
+            abs_path, tmdb_id, title, skip = rows[sel-1][:4]
+            console.print(f"\nEditing: [bold]{abs_path}[/bold]")
+            action = Prompt.ask(
+                r"Action: \[s]earch TMDb again, \[t]oggle ignore, \[b]ack",
+                choices=["s", "t", "b"], default="b"
+            )
+            if action == "t":
+                set_skip_flag(abs_path, not skip)
+                console.print(f"[green]Ignore flag set to {not skip}.[/green]")
+            elif action == "s":
+                new_tmdb_id, new_title, new_year, new_genres, new_metadata = tmdb_search_and_select(os.path.basename(abs_path))
+                if new_tmdb_id:
+                    update_movie(abs_path, tmdb_id=new_tmdb_id, title=new_title, year=new_year, genres=new_genres, metadata=new_metadata)
+                    console.print("[green]Movie info updated.[/green]")
+            if action != "b":
+                # Refresh just this row; it stays on the page even if it no longer matches the filter
+                rows[sel-1] = get_review_row(abs_path) or rows[sel-1]
+        else:
             console.print("[red]Invalid selection.[/red]")
-            continue
 
-        abs_path, tmdb_id, title, skip, size_str = file_info[sel-1]
-        console.print(f"\nEditing: [bold]{abs_path}[/bold]")
+def review_pending():
+    """Work through the files that scan --auto could not match confidently."""
+    console = Console()
+    pending = get_pending_matches()
+    if not pending:
+        console.print("[green]No files pending review.[/green]")
+        return
+    for n, p in enumerate(pending, start=1):
+        abs_path, rel_path = p["absolute_path"], p["relative_path"]
+        ranked = json.loads(p["candidates"] or "[]")
+        console.print(f"\n[bold]({n}/{len(pending)}) File:[/bold] {abs_path}")
+        console.print(f"Guessed: [cyan]{p['title_guess']}[/cyan] ({p['year_guess'] or 'unknown year'})")
+        for idx, c in enumerate(ranked, start=1):
+            m = c["movie"]
+            console.print(f"{idx}. {m.get('title')} ({release_year(m)}) [ID: {m.get('id')}] score {c['score']:.2f}")
         action = Prompt.ask(
-            "Action: [s]earch TMDb again, [t]oggle ignore, [q]uit",
-            choices=["s", "t", "q"], default="q"
+            r"Pick a candidate number, \[s]earch TMDb, \[i]gnore file, \[n]ext, \[q]uit",
+            default="1" if ranked else "s"
         )
         if action == "q":
             break
-        elif action == "t":
-            set_skip_flag(abs_path, not skip)
-            console.print(f"[green]Ignore flag set to {not skip}.[/green]")
+        elif action == "n":
+            continue
+        elif action == "i":
+            ignore_file(abs_path, rel_path)
+            console.print("[yellow]File ignored.[/yellow]")
         elif action == "s":
-            new_tmdb_id, new_title, new_year, new_genres, new_metadata = tmdb_search_and_select(os.path.basename(abs_path))
-            if new_tmdb_id:
-                update_movie(abs_path, tmdb_id=new_tmdb_id, title=new_title, year=new_year, genres=new_genres, metadata=new_metadata)
-                console.print("[green]Movie info updated.[/green]")
-        # Refresh data
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        c.execute("SELECT absolute_path, tmdb_id, title, skip FROM movies ORDER BY absolute_path")
-        rows = c.fetchall()
-        conn.close()
\ No newline at end of file
+            tmdb_id, title, year, genres, metadata = tmdb_search_and_select(p["title_guess"])
+            if tmdb_id:
+                with transaction():
+                    add_movie(abs_path, rel_path, tmdb_id, title, year, genres, metadata)
+                    set_queue_state(abs_path, QUEUE_MATCHED)
+                console.print("[green]Added to database.[/green]")
+        elif action.isdigit() and 1 <= int(action) <= len(ranked):
+            with transaction():
+                add_movie(abs_path, rel_path, *tmdb_movie_fields(ranked[int(action)-1]["movie"]))
+                set_queue_state(abs_path, QUEUE_MATCHED)
+            console.print("[green]Added to database.[/green]")
+        else:
+            console.print("[red]Invalid choice, leaving file pending.[/red]")
@@ -1,47 +1,116 @@
 import os
-import re
 from typing import List, Tuple, Optional
-import requests
-from db import add_movie, get_all_movies
+from db import (
+    add_movie, add_movies, transaction, get_file_index, move_movie, update_movies, get_scanned_dirs,
+    set_scanned_dirs, save_media_info, get_media_info, queue_files, save_queue_items, set_queue_state,
+    forget_queued, get_queued_paths, get_queue_files, get_queue_page, count_queue, QUEUE_STATES,
+    QUEUE_DISCOVERED, QUEUE_FETCHED, QUEUE_PENDING, QUEUE_MATCHED, QUEUE_IGNORED,
+)
+from probe import probe_row, format_media, MediaInfo
+from matching import rank_candidates, is_confident, find_director, release_year, AUTO_MATCH_THRESHOLD
+from walker import walk_video_dirs
+from filename_parser import parse_filename
+import cache
+import local_index
+import perf
+from tmdb_client import get_client, TMDbError
 from rich.prompt import Prompt, Confirm
 from rich.console import Console
+from rich.table import Table
+import itertools
 import json
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-VIDEO_EXTENSIONS = (".mkv", ".mp4", ".avi")
+# Maximum number of concurrent TMDb requests when enriching search results
+MAX_CONNECTIONS = 4
+# Files resolved ahead of the interactive prompt, and the workers resolving them
+PREFETCH_DEPTH = 8
+PREFETCH_WORKERS = 2
+# Rows written per transaction by scan --auto
+WRITE_BATCH_SIZE = 200
 console = Console()
 
+def tmdb_get(endpoint: str, bearer_token: str, params: Optional[dict] = None, fresh: bool = False):
+    """
+    GET a TMDb endpoint (e.g. "/search/movie"), going through the on-disk response cache
+    and the shared rate-limited client. fresh skips the cached response (the new one is still cached).
+    Returns the decoded JSON, or None if not found or on a cache miss in offline mode.
+    Raises TMDbError if TMDb cannot answer.
+    """
+    key = cache.make_key(endpoint, params)
+    cached = None if fresh else cache.cache_get(key)
+    if cached is not None:
+        return cached
+    if cache.offline:
+        return None
+    data = get_client(bearer_token).get(endpoint, params)
+    if data is not None:
+        cache.cache_put(key, data)
+    return data
+
+def print_tmdb_report(bearer_token: str):
+    rows = get_client(bearer_token).latency_report() if not cache.offline else []
+    if rows:
+        table = Table(title="TMDb requests")
+        table.add_column("Endpoint")
+        table.add_column("Requests", justify="right")
+        table.add_column("Mean", justify="right")
+        table.add_column("Max", justify="right")
+        table.add_column("Retries", justify="right")
+        table.add_column("Errors", justify="right")
+        for name, count, mean, longest, retries, errors in rows:
+            table.add_row(name, str(count), f"{mean * 1000:.0f} ms", f"{longest * 1000:.0f} ms", str(retries), str(errors))
+        console.print(table)
+    console.print(f"[bold]{cache.cache_summary()}[/bold]")
+    if local_index.available():
+        console.print(f"[bold]{local_index.index_summary()}[/bold]")
+
 # --- V4 TMDb Search ---
-def tmdb_v4_search(query: str, bearer_token: str, language: str = "en-US", include_adult: bool = False, page: int = 1):
-    url = "https://api.themoviedb.org/3/search/movie"
-    headers = {
-        "Authorization": f"Bearer {bearer_token}",
-        "accept": "application/json"
-    }
+def tmdb_v4_search(query: str, bearer_token: str, language: str = "en-US", include_adult: bool = False, page: int = 1, year: Optional[int] = None):
+    # The local index answers most searches without a request. Only an exact title is trusted; anything
+    # else also goes to TMDb, so a loose local match cannot hide the right film.
+    local = None
+    if local_index.available() and page == 1:
+        local = local_index.search_local(query, year)
+        answered = cache.offline or local_index.has_exact_title(local, query)
+        local_index.note_search(answered)
+        if answered:
+            return local
     params = {
         "query": query,
         "include_adult": str(include_adult).lower(),
         "language": language,
         "page": page
     }
-    response = requests.get(url, headers=headers, params=params)
-    if response.status_code == 200:
-        return response.json().get("results", [])
-    else:
-        console.print(f"[red]TMDb API error: {response.status_code} {response.text}[/red]")
+    data = tmdb_get("/search/movie", bearer_token, params)
+    results = data.get("results", []) if data else []
+    return results or local or []
+
+def tmdb_v4_search_by_id(tmdb_id: str, bearer_token: str, fresh: bool = False):
+    # Credits are appended so the director comes with the details in a single round-trip
+    movie = tmdb_get(f"/movie/{tmdb_id}", bearer_token, {"append_to_response": "credits"}, fresh=fresh)
+    local_index.note_details(movie)
+    return movie
+
+def enrich_candidates(results, bearer_token: str) -> List[Optional[dict]]:
+    """
+    Fetch details (with credits) for every search result concurrently.
+    Returns the details in the same order as results, None where the fetch failed.
+    """
+    if not results:
         return []
 
-def tmdb_v4_search_by_id(tmdb_id: str, bearer_token: str):
-    url = f"https://api.themoviedb.org/3/movie/{tmdb_id}"
-    headers = {
-        "Authorization": f"Bearer {bearer_token}",
-        "accept": "application/json"
-    }
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        console.print(f"[red]TMDb API error: {response.status_code} {response.text}[/red]")
-        return None
+    def details(m):
+        try:
+            return tmdb_v4_search_by_id(m['id'], bearer_token)
+        except TMDbError:
+            return None  # The candidate is still usable without its details
+
+    with ThreadPoolExecutor(max_workers=min(MAX_CONNECTIONS, len(results))) as pool:
+        return list(pool.map(details, results))
 
 def tmdb_search_and_select(filename):
     """
@@ -50,23 +119,17 @@ def tmdb_search_and_select(filename):
     """
     from rich.console import Console
     from rich.prompt import Prompt
-    import requests
     import json
     console = Console()
-    bearer_token = Prompt.ask("Enter TMDb Bearer Token", password=True)
-    headers = {
-        "Authorization": f"Bearer {bearer_token}",
-        "accept": "application/json"
-    }
+    bearer_token = "" if cache.offline else Prompt.ask("Enter TMDb Bearer Token", password=True)
     cleaned_title = filename
     while True:
         query = Prompt.ask(f"Search TMDb for", default=cleaned_title)
-        url = f"https://api.themoviedb.org/3/search/movie?query={query}&include_adult=false&language=en-US&page=1"
-        resp = requests.get(url, headers=headers)
-        if resp.status_code != 200:
-            console.print(f"[red]TMDb API error: {resp.status_code}[/red]")
+        try:
+            results = tmdb_v4_search(query, bearer_token)
+        except TMDbError as e:
+            console.print(f"[red]{e}[/red]")
             return None, None, None, None, None
-        results = resp.json().get("results", [])
         if not results:
             console.print("[yellow]No results found. Try another search term or leave blank to cancel.[/yellow]")
             cleaned_title = Prompt.ask("New search term (blank to cancel)", default="")
@@ -75,166 +138,455 @@ def tmdb_search_and_select(filename):
             continue
         for idx, m in enumerate(results[:5]):
             title = m.get("title", "")
-            year = m.get("release_date", "")[:4]
+            year = release_year(m)
             console.print(f"{idx+1}. {title} ({year}) [ID: {m.get('id')}]")
         choice = Prompt.ask("Select match (1-5), or 0 to search again", default="1")
         if choice.isdigit() and 1 <= int(choice) <= min(5, len(results)):
             movie = results[int(choice)-1]
-            tmdb_id = movie.get("id")
-            title = movie.get("title")
-            year = int(movie.get("release_date", "0")[:4] or 0)
-            genres = ""  # Could fetch details for genres if needed
-            metadata = json.dumps(movie, default=str)
-            return tmdb_id, title, year, genres, metadata
+            # Search results carry no genres or credits: store the full details when TMDb has them
+            try:
+                movie = tmdb_v4_search_by_id(movie["id"], bearer_token) or movie
+            except TMDbError as e:
+                console.print(f"[yellow]Could not fetch details ({e}); storing the search result. 'refresh' will complete it.[/yellow]")
+            return tmdb_movie_fields(movie)
         elif choice == "0":
             cleaned_title = Prompt.ask("New search term", default=cleaned_title)
             continue
         else:
             return None, None, None, None, None
 
+@perf.timed("parse filename")
 def guess_title_year(filename: str) -> Tuple[str, Optional[int]]:
-    # Remove bracketed/parenthetical info and common tags
-    name = os.path.splitext(filename)[0]
-    name = re.sub(r"[\[\(].*?[\]\)]", "", name)  # Remove [brackets] and (parentheses)
-    name = re.sub(r"[._-]", " ", name)  # Replace separators with space
-    name = re.sub(r"\b(720p|1080p|2160p|x264|x265|h264|h265|bluray|bdrip|webrip|dvdrip|hdrip|subs?|ac3|dts|aac|ita|eng|spa|trilogia|fanart|poster|thumb)\b", "", name, flags=re.I)
-    name = re.sub(r"\s+", " ", name).strip()
-    # Try to extract year
-    match = re.search(r"(19|20)\d{2}", filename)
-    year = int(match.group(0)) if match else None
-    return name, year
-
-def scan_directory(source_dir: str, tmdb_bearer_token: str):
-    # Get already recorded files from the database
-    recorded_files = {movie['absolute_path'] for movie in get_all_movies()}
-    for root, _, files in os.walk(source_dir):
-        console.print(f"[yellow]Scanning directory: {root} with {len(files)} files...[/yellow]")
-        for file in files:
-            abs_path = os.path.abspath(os.path.join(root, file))
-            rel_path = os.path.relpath(abs_path, source_dir)
-            if abs_path in recorded_files:
-                console.print(f"[green]Skipping already recorded:[/green] {abs_path}")
+    parsed = parse_filename(filename)
+    return parsed.title, parsed.year
+
+def tmdb_movie_fields(movie: dict) -> Tuple[int, str, int, str, str]:
+    """(tmdb_id, title, year, genres, metadata) as stored in the movies table."""
+    genres = ", ".join([g['name'] for g in movie.get('genres', [])]) if 'genres' in movie else ''
+    metadata = json.dumps(movie, default=str)
+    return movie['id'], movie['title'], int(release_year(movie) or 0), genres, metadata
+
+def add_movie_from_tmdb(abs_path: str, rel_path: str, movie: dict):
+    with transaction():
+        add_movie(abs_path, rel_path, *tmdb_movie_fields(movie))
+        set_queue_state(abs_path, QUEUE_MATCHED)
+    console.print("[green]Added to database.[/green]")
+
+def ignore_file(abs_path: str, rel_path: str):
+    """Recorded as skipped, so later scans do not pick it up again; 'review --ignored' can bring it back."""
+    with transaction():
+        add_movie(abs_path, rel_path, None, None, None, "", None, skip=1)
+        set_queue_state(abs_path, QUEUE_IGNORED)
+
+def manual_mode(abs_path: str, rel_path: str, title_guess: str, tmdb_bearer_token: str) -> Tuple[bool, str]:
+    """
+    Manual search term / TMDb ID entry.
+    Returns (done, title_guess): done is True once the file was added or skipped.
+    """
+    console.print("[yellow]Manual mode:[/yellow]")
+    console.print("1. Propose a new search term")
+    console.print("2. Enter TMDb movie ID manually")
+    console.print("0. Skip this file")
+    manual_choice = Prompt.ask("Select option", default="1")
+    if manual_choice == "1":
+        return False, Prompt.ask("Enter new search term", default=title_guess)
+    elif manual_choice == "2":
+        tmdb_id = Prompt.ask("Enter TMDb movie ID", default="")
+        if not tmdb_id.isdigit():
+            console.print("[yellow]Invalid TMDb ID. Try again.")
+            return False, title_guess
+        try:
+            movie = tmdb_v4_search_by_id(tmdb_id, tmdb_bearer_token)
+        except TMDbError as e:
+            console.print(f"[red]{e}[/red]")
+            return False, title_guess
+        if not movie:
+            console.print("[yellow]Invalid TMDb ID. Try again.")
+            return False, title_guess
+        # Confirm
+        confirm = Confirm.ask(f"Use: {movie['title']} ({release_year(movie)}) [ID: {movie['id']}]?", default=True)
+        if not confirm:
+            return False, title_guess
+        add_movie_from_tmdb(abs_path, rel_path, movie)
+        return True, title_guess
+    elif manual_choice == "0":
+        ignore_file(abs_path, rel_path)
+        console.print("[yellow]Skipping file.[/yellow]")
+        return True, title_guess
+    return False, title_guess
+
+@perf.timed("tmdb: search and enrich")
+def fetch_candidates(title_guess: str, tmdb_bearer_token: str, year_guess: Optional[int] = None) -> Tuple[list, List[Optional[dict]]]:
+    """Search TMDb and enrich the top 3 results. Returns (candidates, candidate_details)."""
+    candidates = tmdb_v4_search(title_guess, tmdb_bearer_token, year=year_guess)[:3]
+    return candidates, enrich_candidates(candidates, tmdb_bearer_token)
+
+def resolve_file(abs_path: str, rel_path: str, file: str, tmdb_bearer_token: str) -> dict:
+    """
+    Guess the title of a file, probe its headers and fetch its TMDb candidates, ready to be shown to the
+    operator. If TMDb could not answer, "error" holds the reason and there are no candidates.
+    "media" is the probe row for save_media_info (None if the file could not be read).
+    "missing" is set, and nothing fetched, when the file is gone.
+    """
+    title_guess, year_guess = guess_title_year(file)
+    media = probe_row(abs_path)
+    if media is None and not os.path.exists(abs_path):
+        return {"absolute_path": abs_path, "relative_path": rel_path, "missing": True}
+    try:
+        candidates, candidate_details = fetch_candidates(title_guess, tmdb_bearer_token, year_guess)
+        error = None
+    except TMDbError as e:
+        candidates, candidate_details, error = [], [], str(e)
+    return {
+        "absolute_path": abs_path,
+        "relative_path": rel_path,
+        "title_guess": title_guess,
+        "year_guess": year_guess,
+        "candidates": candidates,
+        "candidate_details": candidate_details,
+        "error": error,
+        "media": media,
+        "missing": False,
+    }
+
+def item_duration(item: dict):
+    info = item["media"][3] if item.get("media") else None
+    return info.duration if info else None
+
+def prompt_for_match(item: dict, tmdb_bearer_token: str):
+    abs_path, rel_path = item["absolute_path"], item["relative_path"]
+    title_guess = item["title_guess"]
+    candidates, candidate_details = item["candidates"], item["candidate_details"]
+    console.print(f"\n[bold]File:[/bold] {abs_path}")
+    console.print(f"Guessed: [cyan]{title_guess}[/cyan] ({item['year_guess'] or 'unknown year'})")
+    info = item["media"][3] if item.get("media") else None
+    if info:
+        console.print(f"Media: {format_media(info.duration, info.width, info.height, info.video_codec)}")
+    error = item["error"]
+    while True:
+        if error:
+            # TMDb is unreachable or refusing us: that is not "no results", so do not drop into manual mode
+            console.print(f"[red]{error}[/red]")
+            if Prompt.ask("TMDb unavailable: [r]etry or [s]kip this file", choices=["r", "s"], default="r") == "s":
+                console.print("[yellow]Skipping file; it stays queued and the next scan tries again.[/yellow]")
+                break
+            done = False
+        elif candidates:
+            # Show top 3 results + option 0 for manual
+            for idx, (m, details) in enumerate(zip(candidates, candidate_details), start=1):
+                # Get production companies (first one or all)
+                prod = ''
+                if details and 'production_companies' in details and details['production_companies']:
+                    prod = details['production_companies'][0]['name']
+                director = find_director(details)
+                extra = f" | [magenta]{prod}[/magenta] | [green]{director}[/green]" if prod or director else ''
+                console.print(f"{idx}. {m['title']} ({release_year(m)}) [ID: {m['id']}] {extra}")
+            console.print("0. [Manual search or TMDb ID / Skip]")
+            choice = Prompt.ask("Select match (1-3), 0 for manual", default="1")
+            if choice == "0":
+                done, title_guess = manual_mode(abs_path, rel_path, title_guess, tmdb_bearer_token)
+            elif choice.isdigit() and 1 <= int(choice) <= len(candidates):
+                # Prefer the full details: search results carry no genres
+                movie = candidate_details[int(choice)-1] or candidates[int(choice)-1]
+                # Confirm
+                done = Confirm.ask(f"Use: {movie['title']} ({release_year(movie)}) [ID: {movie['id']}]?", default=True)
+                if done:
+                    add_movie_from_tmdb(abs_path, rel_path, movie)
+            else:
+                done = False
+        else:
+            # No results found, go to manual mode
+            console.print("[red]No TMDb results found.[/red]")
+            done, title_guess = manual_mode(abs_path, rel_path, title_guess, tmdb_bearer_token)
+        if done:
+            break
+        # Retry search (possibly with a new term)
+        try:
+            candidates, candidate_details = fetch_candidates(title_guess, tmdb_bearer_token)
+            error = None
+        except TMDbError as e:
+            error = str(e)
+
+def load_walk_state() -> dict:
+    """Compact in-memory view of what is already recorded, used and filled in by iter_new_video_files."""
+    index = get_file_index()
+    # Queued files carry on from their recorded state instead of being found again
+    for path in get_queued_paths():
+        index.setdefault(path, (None, None, None, None))
+    return {
+        "index": index,
+        "inodes": {(ident[3], ident[2]): path for path, ident in index.items() if ident[2] is not None},
+        "scanned_dirs": get_scanned_dirs(),
+        "visited_dirs": {},   # dir -> (mtime, [video paths]) for directories walked this run
+        "identities": {},     # path -> (size, mtime, inode, device) seen this run
+        "skipped_dirs": 0,
+        "moved": 0,
+        "lock": threading.Lock(),  # skipped_dirs is counted on the walker threads
+    }
+
+def iter_new_video_files(source_dir: str, walk_state: dict, include: Optional[List[str]] = None, exclude: Optional[List[str]] = None, max_depth: Optional[int] = None):
+    """
+    Yield (abs_path, rel_path, file) for video files not recorded yet.
+    Directories whose mtime has not changed since they were fully recorded are not looked into,
+    and recorded files that were moved or renamed (same inode) are re-pointed instead of yielded.
+    """
+    # Runs on the prefetch thread, so it must not print while the operator is at a prompt
+    index, inodes = walk_state["index"], walk_state["inodes"]
+
+    def unchanged(path, mtime):
+        if walk_state["scanned_dirs"].get(path) == mtime:
+            with walk_state["lock"]:
+                walk_state["skipped_dirs"] += 1
+            return True
+        return False
+
+    # A filtered walk sees only some of a directory's videos, so it must not mark the directory as fully recorded
+    complete = not include and not exclude
+    dirs = walk_video_dirs(source_dir, include=include, exclude=exclude, max_depth=max_depth, skip_dir=unchanged, stat_files=True)
+    for abs_root, rel_root, dir_mtime, entries in dirs:
+        if walk_state["scanned_dirs"].get(abs_root) == dir_mtime:
+            continue
+        videos = []
+        if complete:
+            walk_state["visited_dirs"][abs_root] = (dir_mtime, videos)
+        for entry in entries:
+            abs_path = entry.path
+            videos.append(abs_path)
+            st = entry.stat()
+            identity = (st.st_size, st.st_mtime, st.st_ino, st.st_dev)
+            walk_state["identities"][abs_path] = identity
+            if abs_path in index:
                 continue
-            if file.lower().endswith(VIDEO_EXTENSIONS):
-                console.print(f"[blue]Found video file:[/blue] {abs_path}")
-                title_guess, year_guess = guess_title_year(file)
-                console.print(f"\n[bold]File:[/bold] {abs_path}")
-                console.print(f"Guessed: [cyan]{title_guess}[/cyan] ({year_guess or 'unknown year'})")
-
-                # V4 Search
-                while True:
-                    results = tmdb_v4_search(title_guess, tmdb_bearer_token)
-                    if results:
-                        # Show top 3 results + option 0 for manual
-                        for idx, m in enumerate(results[:3], start=1):
-                            # Fetch extra details for each result (director, production)
-                            details = tmdb_v4_search_by_id(m['id'], tmdb_bearer_token)
-                            # Get production companies (first one or all)
-                            prod = ''
-                            if details and 'production_companies' in details and details['production_companies']:
-                                prod = details['production_companies'][0]['name']
-                            # Get director from credits if available
-                            director = ''
-                            if details and 'credits' in details and 'crew' in details['credits']:
-                                for crew in details['credits']['crew']:
-                                    if crew.get('job') == 'Director':
-                                        director = crew.get('name')
-                                        break
-                            # Fallback: try to fetch credits if not present
-                            if not director:
-                                # Try to fetch credits endpoint
-                                credits_url = f"https://api.themoviedb.org/3/movie/{m['id']}/credits"
-                                headers = {"Authorization": f"Bearer {tmdb_bearer_token}", "accept": "application/json"}
-                                credits_resp = requests.get(credits_url, headers=headers)
-                                if credits_resp.status_code == 200:
-                                    credits = credits_resp.json()
-                                    for crew in credits.get('crew', []):
-                                        if crew.get('job') == 'Director':
-                                            director = crew.get('name')
-                                            break
-                            extra = f" | [magenta]{prod}[/magenta] | [green]{director}[/green]" if prod or director else ''
-                            console.print(f"{idx}. {m['title']} ({m.get('release_date', '')[:4]}) [ID: {m['id']}] {extra}")
-                        console.print("0. [Manual search or TMDb ID / Skip]")
-                        choice = Prompt.ask("Select match (1-3), 0 for manual", default="1")
-                        if choice == "0":
-                            # Enter manual mode
-                            console.print("[yellow]Manual mode:[/yellow]")
-                            console.print("1. Propose a new search term")
-                            console.print("2. Enter TMDb movie ID manually")
-                            console.print("0. Skip this file")
-                            manual_choice = Prompt.ask("Select option", default="1")
-                            if manual_choice == "1":
-                                title_guess = Prompt.ask("Enter new search term", default=title_guess)
-                                continue  # Retry search with new term
-                            elif manual_choice == "2":
-                                tmdb_id = Prompt.ask("Enter TMDb movie ID", default="")
-                                if tmdb_id.isdigit():
-                                    movie = tmdb_v4_search_by_id(tmdb_id, tmdb_bearer_token)
-                                    if not movie:
-                                        console.print("[yellow]Invalid TMDb ID. Try again.")
-                                        continue
-                                    # Confirm
-                                    confirm = Confirm.ask(f"Use: {movie['title']} ({movie.get('release_date', '')[:4]}) [ID: {movie['id']}]?", default=True)
-                                    if not confirm:
-                                        continue
-                                    genres = ", ".join([g['name'] for g in movie.get('genres', [])]) if 'genres' in movie else ''
-                                    metadata = json.dumps(movie, default=str)
-                                    add_movie(abs_path, rel_path, movie['id'], movie['title'], int(movie.get('release_date', '0')[:4] or 0), genres, metadata)
-                                    console.print("[green]Added to database.[/green]")
-                                    break
-                                else:
-                                    console.print("[yellow]Invalid TMDb ID. Try again.")
-                                    continue
-                            elif manual_choice == "0":
-                                console.print("[yellow]Skipping file.[/yellow]")
-                                break
-                            else:
-                                continue
-                        elif choice.isdigit() and 1 <= int(choice) <= len(results[:3]):
-                            movie = results[int(choice)-1]
-                            # Confirm
-                            confirm = Confirm.ask(f"Use: {movie['title']} ({movie.get('release_date', '')[:4]}) [ID: {movie['id']}]?", default=True)
-                            if not confirm:
-                                continue
-                            genres = ", ".join([g['name'] for g in movie.get('genres', [])]) if 'genres' in movie else ''
-                            metadata = json.dumps(movie, default=str)
-                            add_movie(abs_path, rel_path, movie['id'], movie['title'], int(movie.get('release_date', '0')[:4] or 0), genres, metadata)
-                            console.print("[green]Added to database.[/green]")
-                            break
-                        else:
-                            continue
-                    else:
-                        # No results found, go to manual mode
-                        console.print("[red]No TMDb results found.[/red]")
-                        console.print("[yellow]Manual mode:[/yellow]")
-                        console.print("1. Propose a new search term")
-                        console.print("2. Enter TMDb movie ID manually")
-                        console.print("0. Skip this file")
-                        manual_choice = Prompt.ask("Select option", default="1")
-                        if manual_choice == "1":
-                            title_guess = Prompt.ask("Enter new search term", default=title_guess)
-                            continue  # Retry search with new term
-                        elif manual_choice == "2":
-                            tmdb_id = Prompt.ask("Enter TMDb movie ID", default="")
-                            if tmdb_id.isdigit():
-                                movie = tmdb_v4_search_by_id(tmdb_id, tmdb_bearer_token)
-                                if not movie:
-                                    console.print("[yellow]Invalid TMDb ID. Try again.")
-                                    continue
-                                # Confirm
-                                confirm = Confirm.ask(f"Use: {movie['title']} ({movie.get('release_date', '')[:4]}) [ID: {movie['id']}]?", default=True)
-                                if not confirm:
-                                    continue
-                                genres = ", ".join([g['name'] for g in movie.get('genres', [])]) if 'genres' in movie else ''
-                                metadata = json.dumps(movie, default=str)
-                                add_movie(abs_path, rel_path, movie['id'], movie['title'], int(movie.get('release_date', '0')[:4] or 0), genres, metadata)
-                                console.print("[green]Added to database.[/green]")
-                                break
-                            else:
-                                console.print("[yellow]Invalid TMDb ID. Try again.")
-                                continue
-                        elif manual_choice == "0":
-                            console.print("[yellow]Skipping file.[/yellow]")
-                            break
-                        else:
-                            continue
+            rel_path = os.path.join(rel_root, entry.name) if rel_root else entry.name
+            old_path = inodes.get((st.st_dev, st.st_ino))
+            if old_path and not os.path.exists(old_path) and index[old_path][0] == st.st_size:
+                move_movie(old_path, abs_path, rel_path)
+                index[abs_path] = index.pop(old_path)
+                inodes[(st.st_dev, st.st_ino)] = abs_path
+                walk_state["moved"] += 1
+                continue
+            yield abs_path, rel_path, entry.name
+
+def finish_walk(walk_state: dict):
+    """Store file identities of recorded files, and mark directories whose videos are all recorded."""
+    index = get_file_index()
+    for path in get_queued_paths():
+        index.setdefault(path, (None, None, None, None))
+    update_movies(
+        (path, dict(zip(("size", "mtime", "inode", "device"), identity)))
+        for path, identity in list(walk_state["identities"].items())
+        if path in index and index[path] != identity
+    )
+    set_scanned_dirs(
+        (path, mtime)
+        for path, (mtime, videos) in list(walk_state["visited_dirs"].items())
+        if all(v in index for v in videos)
+    )
+    console.print(f"[green]{walk_state['skipped_dirs']} unchanged directories skipped, {walk_state['moved']} moved files re-linked.[/green]")
+
+def prefetch_candidates(files, tmdb_bearer_token: str, depth: int = PREFETCH_DEPTH, workers: int = PREFETCH_WORKERS):
+    """
+    Resolve upcoming files on a background pool while the caller handles the current one.
+    Yields resolved items (see resolve_file) in walk order; at most `depth` are kept ready ahead.
+    """
+    ready = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    pool = ThreadPoolExecutor(max_workers=workers)
+    done_marker = object()
+    walk_error = []
+
+    def put(entry):
+        # Block while the queue is full, but give up once the consumer has gone away
+        while not stop.is_set():
+            try:
+                ready.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def producer():
+        try:
+            for abs_path, rel_path, file in files:
+                if not put(pool.submit(resolve_file, abs_path, rel_path, file, tmdb_bearer_token)):
+                    return
+        except Exception as e:
+            walk_error.append(e)
+        put(done_marker)
+
+    threading.Thread(target=producer, daemon=True).start()
+    try:
+        while True:
+            entry = ready.get()
+            if entry is done_marker:
+                break
+            yield entry.result()
+        if walk_error:
+            raise walk_error[0]
+    finally:
+        stop.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def discover_files(source_dir: str, include: Optional[List[str]] = None, exclude: Optional[List[str]] = None, max_depth: Optional[int] = None) -> int:
+    """Walk source_dir and queue the video files not recorded or queued yet. Returns the number queued."""
+    walk_state = load_walk_state()
+    found = 0
+    batch = []
+    try:
+        for abs_path, rel_path, _ in iter_new_video_files(source_dir, walk_state, include=include, exclude=exclude, max_depth=max_depth):
+            # The identity goes with the file, and into files once it is matched
+            batch.append((abs_path, rel_path, *walk_state["identities"][abs_path]))
+            if len(batch) >= WRITE_BATCH_SIZE:
+                queue_files(batch)
+                found += len(batch)
+                batch.clear()
+        queue_files(batch)
+        found += len(batch)
+    finally:
+        # Queued files count as recorded, so their directories are not walked again
+        finish_walk(walk_state)
+    return found
+
+def print_queue_summary(source_dir: str):
+    counts = count_queue(source_dir)
+    console.print("[bold]Scan queue:[/bold] " + ", ".join(f"{counts.get(state, 0)} {state}" for state in QUEUE_STATES))
+
+def _queued_media(path: str, info: Optional[tuple]):
+    if not info or all(v is None for v in info[2:6]):
+        return None
+    size, mtime, duration, width, height, codec, languages = info
+    return path, size, mtime, MediaInfo(duration, width, height, codec, tuple(l for l in (languages or "").split(", ") if l))
+
+def iter_queued_items(source_dir: str):
+    """
+    Items (see resolve_file) of the files below source_dir whose candidates an earlier run fetched,
+    rebuilt from the queue without a single request. Marked "queued", as they need not be saved again.
+    """
+    after = None
+    while True:
+        page = get_queue_page(QUEUE_FETCHED, source_dir, after)
+        if not page:
+            return
+        after = page[-1]["absolute_path"]
+        media = get_media_info(row["absolute_path"] for row in page)
+        for row in page:
+            fetched = json.loads(row["candidates"] or "{}")
+            yield {
+                "absolute_path": row["absolute_path"],
+                "relative_path": row["relative_path"],
+                "title_guess": row["title_guess"],
+                "year_guess": row["year_guess"],
+                "candidates": fetched.get("results", []),
+                "candidate_details": fetched.get("details", []),
+                "error": None,
+                "media": _queued_media(row["absolute_path"], media.get(row["absolute_path"])),
+                "missing": False,
+                "queued": True,
+            }
+
+def iter_fetched_files(source_dir: str, tmdb_bearer_token: str, depth: int, workers: int):
+    """Resolve the discovered files below source_dir on a background pool, yielding them in path order."""
+    files = ((path, rel_path, os.path.basename(path)) for path, rel_path in get_queue_files(QUEUE_DISCOVERED, source_dir))
+    return prefetch_candidates(files, tmdb_bearer_token, depth=depth, workers=workers)
+
+def queue_row(item: dict, state: str, ranked: Optional[List[Tuple[float, dict]]] = None) -> tuple:
+    """The save_queue_items row recording item (see resolve_file) in state."""
+    fetched = None
+    if state == QUEUE_FETCHED:
+        fetched = json.dumps({"results": item["candidates"], "details": item["candidate_details"]}, default=str)
+    ranked_json = json.dumps([{"score": score, "movie": movie} for score, movie in ranked], default=str) if ranked is not None else None
+    best_score = (ranked[0][0] if ranked else 0.0) if ranked is not None else None
+    return (item["absolute_path"], item["relative_path"], state, item["title_guess"], item["year_guess"],
+            fetched, ranked_json, best_score, item["error"])
+
+def scan_directory(source_dir: str, tmdb_bearer_token: str, prefetch_depth: int = PREFETCH_DEPTH, workers: int = PREFETCH_WORKERS, include: Optional[List[str]] = None, exclude: Optional[List[str]] = None, max_depth: Optional[int] = None):
+    """
+    Interactive scan. New files are queued first. Files whose candidates were fetched before (by an interrupted
+    scan or --stage fetch) are offered straight from the queue, then the rest are fetched in the background while
+    the operator decides. Every step is recorded as it happens, so an interrupted scan resumes where it stopped.
+    """
+    discover_files(source_dir, include=include, exclude=exclude, max_depth=max_depth)
+    print_queue_summary(source_dir)
+    fresh = iter_fetched_files(source_dir, tmdb_bearer_token, depth=prefetch_depth, workers=workers)
+    for item in itertools.chain(iter_queued_items(source_dir), fresh):
+        if item["missing"]:
+            forget_queued([item["absolute_path"]])
+            continue
+        if not perf.quiet:
+            console.print(f"[blue]Found video file:[/blue] {item['absolute_path']}")
+        if not item.get("queued"):
+            # Checkpoint before the prompt: the fetch is not repeated if the scan stops here
+            with transaction():
+                if item["media"]:
+                    save_media_info([item["media"]])
+                save_queue_items([queue_row(item, QUEUE_DISCOVERED if item["error"] else QUEUE_FETCHED)])
+        prompt_for_match(item, tmdb_bearer_token)
+    print_tmdb_report(tmdb_bearer_token)
+
+def auto_scan_directory(source_dir: str, tmdb_bearer_token: str, threshold: float = AUTO_MATCH_THRESHOLD, workers: int = 8, include: Optional[List[str]] = None, exclude: Optional[List[str]] = None, max_depth: Optional[int] = None, decide: bool = True):
+    """
+    Non-interactive scan: accept confident matches, queue the rest for review. With decide=False only
+    fetch the candidates, leaving every file for a later (interactive or --auto) scan to decide.
+    Files are resolved on `workers` threads; database writes stay on the calling thread.
+    """
+    discover_files(source_dir, include=include, exclude=exclude, max_depth=max_depth)
+    matched = pending = fetched = failed = 0
+    movie_rows, queue_rows, media_rows, missing = [], [], [], []
+
+    def flush():
+        # One transaction per batch, which is also the checkpoint an interrupted scan resumes from.
+        # The transaction must not be held while waiting on the workers, since they need the database for the TMDb cache.
+        with transaction():
+            add_movies(movie_rows)
+            save_queue_items(queue_rows)
+            save_media_info(media_rows)
+            forget_queued(missing)
+        movie_rows.clear()
+        queue_rows.clear()
+        media_rows.clear()
+        missing.clear()
+
+    start = time.perf_counter()
+    fresh = iter_fetched_files(source_dir, tmdb_bearer_token, depth=workers * 4, workers=workers)
+    items = itertools.chain(iter_queued_items(source_dir), fresh) if decide else fresh
+    for item in items:
+        if item["missing"]:
+            missing.append(item["absolute_path"])
+            continue
+        if item["error"]:
+            # Stays discovered, with the reason, so the next scan tries again
+            console.print(f"[red]Failed:[/red] {item['relative_path']}: {item['error']}")
+            queue_rows.append(queue_row(item, QUEUE_DISCOVERED))
+            failed += 1
+            continue
+        if item["media"] and not item.get("queued"):
+            media_rows.append(item["media"])
+        if not decide:
+            queue_rows.append(queue_row(item, QUEUE_FETCHED))
+            fetched += 1
+        else:
+            # The probed duration lets the TMDb runtime separate remakes and same-titled films
+            ranked = rank_candidates(item["title_guess"], item["year_guess"], item["candidates"], item["candidate_details"], item_duration(item))
+            if is_confident(ranked, threshold):
+                score, movie = ranked[0]
+                movie_rows.append((item["absolute_path"], item["relative_path"], *tmdb_movie_fields(movie), 0))
+                queue_rows.append(queue_row(item, QUEUE_MATCHED))
+                if not perf.quiet:
+                    console.print(f"[green]Matched ({score:.2f}):[/green] {item['relative_path']} -> {movie['title']} ({release_year(movie)})")
+                matched += 1
+            else:
+                best_score = ranked[0][0] if ranked else 0.0
+                queue_rows.append(queue_row(item, QUEUE_PENDING, ranked))
+                if not perf.quiet:
+                    console.print(f"[yellow]Pending ({best_score:.2f}):[/yellow] {item['relative_path']}")
+                pending += 1
+        if len(queue_rows) >= WRITE_BATCH_SIZE:
+            flush()
+    flush()
+    elapsed = time.perf_counter() - start
+    total = matched + pending + fetched + failed
+    rate = total / elapsed if elapsed > 0 else 0.0
+    outcome = f"{matched} matched, {pending} pending review" if decide else f"{fetched} fetched for a later decision"
+    console.print(f"[bold]{total} files in {elapsed:.1f}s ({rate:.1f} files/s): {outcome}, {failed} failed[/bold]")
+    print_queue_summary(source_dir)
+    print_tmdb_report(tmdb_bearer_token)
@@ -0,0 +1,44 @@
+import os
+import sys
+import pytest
+
+# The modules live at the top of the repository, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cache
+import db
+import local_index
+import tmdb_client
+import tmdb_stub
+
+@pytest.fixture
+def stub():
+    """Start a stub TMDb server; call it with start_stub_server's keyword arguments. Returns (base_url, state)."""
+    servers = []
+
+    def start(**kwargs):
+        server, url, state = tmdb_stub.start_stub_server(**kwargs)
+        servers.append(server)
+        return url, state
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """A fresh database file for the test."""
+    monkeypatch.setattr(db, "DB_FILE", str(tmp_path / "test.db"))
+    monkeypatch.setattr(local_index, "_available", None)
+    db.init_db()
+    cache.init_cache()
+    yield db
+    db.close_db()
+
+@pytest.fixture
+def tmdb(stub, monkeypatch):
+    """Point the TMDb client at a stub server with the default films. Returns the stub's state."""
+    url, state = stub()
+    monkeypatch.setattr(tmdb_client, "TMDB_API_URL", url)
+    return state
@@ -0,0 +1,80 @@
+import json
+import os
+import pytest
+from typer.testing import CliRunner
+import benchmark
+import db
+import local_index
+import perf
+from filename_parser import parse_filename
+
+@pytest.fixture(autouse=True)
+def suite_globals(monkeypatch, tmp_path):
+    # The suite switches these off for its run; keep them from leaking into other tests
+    monkeypatch.setattr(local_index, "enabled", local_index.enabled)
+    monkeypatch.setattr(perf, "quiet", perf.quiet)
+    monkeypatch.setattr(db, "DB_FILE", str(tmp_path / "unused.db"))
+
+def test_catalogue_and_library_are_reproducible(tmp_path):
+    # As the suite does: a film per file at most
+    catalogue = benchmark.make_catalogue(60, seed=3)
+    assert catalogue == benchmark.make_catalogue(60, seed=3)
+    assert len({m["id"] for m in catalogue}) == 60
+    listings = []
+    for name in ("a", "b"):
+        root = tmp_path / name
+        films = benchmark.make_library(str(root), catalogue, 60, depth=2, file_size=64, seed=3)
+        listings.append(sorted(os.path.relpath(os.path.join(d, f), root) for d, _, names in os.walk(root) for f in names))
+        assert all(os.path.getsize(root / p) == 64 for p in listings[-1])
+    assert listings[0] == listings[1]
+    # A file per film, plus second releases and copies for some, up to the number asked for
+    assert films < len(listings[0]) <= 60
+
+def test_release_names_parse_back():
+    movie = benchmark.make_catalogue(1)[0]
+    for style in range(len(benchmark.RELEASE_STYLES)):
+        parsed = parse_filename(benchmark.release_name(movie, style))
+        assert parsed.year == int(movie["release_date"][:4])
+
+def test_compare_results(tmp_path):
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text(json.dumps({"results": [
+        {"name": "fast", "seconds": 0.001}, {"name": "steady", "seconds": 1.0}, {"name": "slower", "seconds": 1.0},
+    ]}))
+    report = {"results": [
+        {"name": "fast", "seconds": 0.005},    # Too quick to hold to the tolerance
+        {"name": "steady", "seconds": 1.2},
+        {"name": "slower", "seconds": 1.5},
+        {"name": "new", "seconds": 9.0},       # No baseline to compare with
+    ]}
+    assert benchmark.compare_results(report, str(baseline), 0.25) == [("slower", 1.0, 1.5)]
+
+def test_suite_runs_every_stage(tmp_path):
+    output = tmp_path / "results.json"
+    result = CliRunner().invoke(benchmark.app, [
+        "suite", "--files", "30", "--latency", "0", "--file-size", "256", "--workers", "2",
+        "--library", str(tmp_path / "work"), "--output", str(output), "--json",
+    ])
+    assert result.exit_code == 0, result.output
+    report = json.loads(output.read_text())
+    names = [r["name"] for r in report["results"]]
+    for stage in benchmark.SUITE_STAGES:
+        assert any(name.startswith(f"{stage}:") for name in names)
+    assert all(r["seconds"] >= 0 for r in report["results"])
+    assert report["stub"]["requests"] > 0
+
+    # The same run against itself passes; against a much faster baseline it fails
+    baseline = tmp_path / "baseline.json"
+    fast = dict(report, results=[dict(r, seconds=r["seconds"] / 100) for r in report["results"]])
+    baseline.write_text(json.dumps(fast))
+    result = CliRunner().invoke(benchmark.app, [
+        "suite", "--files", "30", "--latency", "0", "--file-size", "256", "--workers", "2",
+        "--stage", "dedup", "--library", str(tmp_path / "work2"), "--compare", str(baseline), "--tolerance", "0",
+    ])
+    assert result.exit_code == 1
+    assert "Regression" in result.output
+
+def test_suite_rejects_unknown_stage():
+    result = CliRunner().invoke(benchmark.app, ["suite", "--stage", "nope"])
+    assert result.exit_code == 1
+    assert "Unknown stage" in result.output
@@ -0,0 +1,56 @@
+import os
+import subprocess
+import tarfile
+import pytest
+import db
+from build import build_structure
+
+@pytest.fixture
+def library(database, tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    for name in ("Heat.1995.1080p.mkv", "Heat.1995.720p.mkv", "The.Matrix.1999.mkv"):
+        (source / name).touch()
+    db.add_movie(str(source / "Heat.1995.1080p.mkv"), "Heat.1995.1080p.mkv", 949, "Heat", 1995, "Crime", "{}")
+    db.add_movie(str(source / "Heat.1995.720p.mkv"), "Heat.1995.720p.mkv", 949, "Heat", 1995, "Crime", "{}")
+    db.add_movie(str(source / "The.Matrix.1999.mkv"), "The.Matrix.1999.mkv", 603, "The Matrix", 1999, "Action", "{}")
+    return source
+
+def linked(target):
+    return sorted(os.path.relpath(os.path.join(root, name), target)
+                  for root, dirs, files in os.walk(target) for name in files + dirs if os.path.islink(os.path.join(root, name)))
+
+@pytest.mark.parametrize("script_format", ["ln", "xargs"])
+def test_script_skips_duplicate_links(library, tmp_path, script_format):
+    target = tmp_path / "target"
+    script = tmp_path / "build.sh"
+    build_structure(str(target), script_path=str(script), script_format=script_format)
+    subprocess.run(["bash", "-e", str(script)], check=True, cwd=tmp_path)
+    assert len(linked(target)) == 2
+
+def test_tar_skips_duplicate_links(library, tmp_path):
+    archive = tmp_path / "links.tar"
+    build_structure(str(tmp_path / "target"), script_path=str(archive), script_format="tar")
+    with tarfile.open(archive) as tar:
+        names = [m.name for m in tar.getmembers() if m.issym()]
+    assert len(names) == len(set(names)) == 2
+
+def test_reconcile_matches_scripts(library, tmp_path):
+    target = tmp_path / "target"
+    build_structure(str(target))
+    assert len(linked(target)) == 2
+
+def test_rematched_file_is_retargeted(library, tmp_path):
+    target = tmp_path / "target"
+    build_structure(str(target))
+    db.update_movie(str(library / "Heat.1995.1080p.mkv"), skip=1)
+    build_structure(str(target))
+    link = target / "Heat (1995)" / "Heat (1995).mkv"
+    assert os.readlink(link) == str(library / "Heat.1995.720p.mkv")
+    assert not any(name.endswith(".movieorg-tmp") for name in os.listdir(link.parent))
+
+@pytest.mark.parametrize("script_format", ["ln", "xargs"])
+def test_script_with_nothing_to_link_succeeds(database, tmp_path, script_format):
+    script = tmp_path / "build.sh"
+    build_structure(str(tmp_path / "target"), script_path=str(script), script_format=script_format)
+    subprocess.run(["bash", "-e", str(script)], check=True, cwd=tmp_path)
@@ -0,0 +1,62 @@
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import cache
+import db
+from scan import tmdb_get
+
+@pytest.fixture(autouse=True)
+def fresh_cache(database, monkeypatch):
+    monkeypatch.setattr(cache, "stats", {"hits": 0, "misses": 0, "evictions": 0})
+    monkeypatch.setattr(cache, "CACHE_TTL", 3600)
+    monkeypatch.setattr(cache, "CACHE_MAX_ENTRIES", 50000)
+    monkeypatch.setattr(cache, "offline", False)
+
+def age(key, seconds):
+    with db.transaction() as conn:
+        conn.execute('UPDATE tmdb_cache SET fetched_at = fetched_at - ?, last_access = last_access - ? WHERE key = ?', (seconds, seconds, key))
+
+def test_key_ignores_parameter_order():
+    assert cache.make_key("/search/movie", {"query": "heat", "page": 1}) == cache.make_key("/search/movie", {"page": 1, "query": "heat"})
+
+def test_entries_expire_after_ttl():
+    cache.cache_put("/movie/949", {"id": 949})
+    assert cache.cache_get("/movie/949") == {"id": 949}
+    age("/movie/949", 3601)
+    assert cache.cache_get("/movie/949") is None
+    assert cache.stats == {"hits": 1, "misses": 1, "evictions": 0}
+
+def test_least_recently_used_is_evicted(monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_MAX_ENTRIES", 2)
+    cache.cache_put("a", 1)
+    cache.cache_put("b", 2)
+    age("a", 20)
+    age("b", 10)
+    assert cache.cache_get("a") == 1  # Now the most recently used
+    cache.cache_put("c", 3)
+    assert cache.cache_get("b") is None
+    assert cache.cache_get("a") == 1 and cache.cache_get("c") == 3
+    assert cache.stats["evictions"] == 1
+
+def test_offline_serves_stale_entries(monkeypatch):
+    cache.cache_put("/movie/949", {"id": 949})
+    age("/movie/949", 7200)
+    monkeypatch.setattr(cache, "offline", True)
+    assert cache.cache_get("/movie/949") == {"id": 949}
+
+def test_offline_miss_makes_no_request(tmdb, monkeypatch):
+    monkeypatch.setattr(cache, "offline", True)
+    assert tmdb_get("/movie/949", "token") is None
+    assert tmdb.requests == 0
+    monkeypatch.setattr(cache, "offline", False)
+    assert tmdb_get("/movie/949", "token")["title"] == "Heat"
+    assert tmdb.requests == 1
+    monkeypatch.setattr(cache, "offline", True)
+    assert tmdb_get("/movie/949", "token")["title"] == "Heat"
+    assert tmdb.requests == 1
+
+def test_counters_are_exact_across_threads():
+    cache.cache_put("hit", 1)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda i: cache.cache_get("hit" if i % 2 else "miss"), range(400)))
+    assert cache.stats["hits"] == 200 and cache.stats["misses"] == 200
+    assert cache.cache_summary() == "TMDb cache: 200 hits, 200 misses (50% hit rate), 0 evicted"
@@ -0,0 +1,13 @@
+import db
+
+def test_update_movie_sets_tmdb_id_without_film_fields(database):
+    db.add_movie("/lib/Heat.mkv", "Heat.mkv", None, None, None, "", "", skip=0)
+    db.update_movie("/lib/Heat.mkv", tmdb_id=949)
+    assert db.query('SELECT tmdb_id FROM files WHERE absolute_path = ?', ("/lib/Heat.mkv",)) == [(949,)]
+    assert db.query('SELECT tmdb_id FROM films') == [(949,)]
+
+def test_update_movie_keeps_existing_film(database):
+    db.add_movie("/lib/Heat.mkv", "Heat.mkv", 949, "Heat", 1995, "Crime", "{}", skip=0)
+    db.add_movie("/lib/Heat.avi", "Heat.avi", None, None, None, "", "", skip=0)
+    db.update_movie("/lib/Heat.avi", tmdb_id=949)
+    assert db.query('SELECT title, year FROM films WHERE tmdb_id = 949') == [("Heat", 1995)]
@@ -0,0 +1,69 @@
+import pytest
+import db
+import dedup
+from dedup import dedup_with_policies, parse_policy, plan_dedup
+from probe import MediaInfo
+
+# (path, size, mtime, media info or None); all files of one film
+HEAT = [
+    ("/lib/a/Heat.1995.720p.x264.mkv", 4000, 300.0, None),
+    ("/lib/b/Heat.1995.1080p.x264.mkv", 8000, 100.0, None),
+    ("/lib/b/Heat.1995.mkv", 6000, 200.0, MediaInfo(10000.0, 3840, 1600, "x265")),
+]
+
+@pytest.fixture
+def films(database):
+    db.add_movies([(path, path[1:], 949, "Heat", 1995, "Crime", "{}", 0, size, mtime, None, None) for path, size, mtime, _ in HEAT])
+    db.save_media_info((path, size, mtime, info) for path, size, mtime, info in HEAT if info)
+
+def kept(*specs):
+    [(tmdb_id, title, keep, others)] = plan_dedup([parse_policy(s) for s in specs])
+    assert (tmdb_id, title) == (949, "Heat") and len(others) == 2
+    return keep
+
+def test_keep_largest(films):
+    assert kept("keep-largest") == "/lib/b/Heat.1995.1080p.x264.mkv"
+
+def test_keep_newest(films):
+    assert kept("keep-newest") == "/lib/a/Heat.1995.720p.x264.mkv"
+
+def test_prefer_resolution_reads_the_headers(films):
+    assert kept("prefer-resolution") == "/lib/b/Heat.1995.mkv"
+    assert kept("prefer-resolution=720p") == "/lib/a/Heat.1995.720p.x264.mkv"
+
+def test_prefer_codec(films):
+    assert kept("prefer-codec=x265") == "/lib/b/Heat.1995.mkv"
+
+def test_prefer_path(films):
+    assert kept("prefer-path=/lib/a") == "/lib/a/Heat.1995.720p.x264.mkv"
+
+def test_later_policies_break_ties(films):
+    # Two files use x264: the size decides between them
+    assert kept("prefer-codec=x264", "keep-largest") == "/lib/b/Heat.1995.1080p.x264.mkv"
+    assert kept("prefer-codec=x264", "keep-newest") == "/lib/a/Heat.1995.720p.x264.mkv"
+    # /lib/b holds two files: the newer one wins
+    assert kept("prefer-path=/lib/b", "keep-newest") == "/lib/b/Heat.1995.mkv"
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        parse_policy("keep-shortest")
+    with pytest.raises(ValueError):
+        parse_policy("prefer-codec")
+
+def test_dry_run_changes_nothing(films, capsys):
+    dedup_with_policies(["keep-largest"], dry_run=True)
+    out = capsys.readouterr().out
+    assert "Dedup plan (dry run)" in out
+    assert "Would keep 1 files and skip 2." in out
+    assert db.query('SELECT COUNT(*) FROM files WHERE skip = 1') == [(0,)]
+
+def test_apply_marks_the_others_skipped(films):
+    dedup_with_policies(["keep-largest"])
+    assert db.query('SELECT absolute_path FROM files WHERE skip = 0') == [("/lib/b/Heat.1995.1080p.x264.mkv",)]
+
+def test_interactive_dedup_uses_stored_sizes(films, monkeypatch, capsys):
+    monkeypatch.setattr(dedup.Prompt, "ask", lambda *args, **kwargs: "2")
+    monkeypatch.setattr(dedup.os, "stat", lambda path: pytest.fail("stat called"))
+    dedup.dedup()
+    assert "7.8 KB" in capsys.readouterr().out
+    assert db.query('SELECT absolute_path FROM files WHERE skip = 0') == [("/lib/b/Heat.1995.1080p.x264.mkv",)]
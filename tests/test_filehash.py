@@ -0,0 +1,53 @@
+import os
+import pytest
+import filehash
+from filehash import SAMPLE_SIZE, find_duplicate_files
+
+SIZE = 4 * SAMPLE_SIZE  # Large enough for sampled partial hashes
+
+def write(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+@pytest.fixture
+def files(database, tmp_path):
+    base = bytes(range(256)) * (SIZE // 256)
+    # b differs from a only between the sampled windows, so only a full hash tells them apart
+    middle = SAMPLE_SIZE + 10
+    return {
+        "a": write(tmp_path / "a.mkv", base),
+        "a_copy": write(tmp_path / "a copy.mkv", base),
+        "b": write(tmp_path / "b.mkv", base[:middle] + b"\xff" + base[middle + 1:]),
+        "other": write(tmp_path / "other.mkv", b"\x01" * (SIZE + 1)),  # No partner of its size: never read
+        "small": write(tmp_path / "small.mkv", b"tiny"),
+        "small_copy": write(tmp_path / "small copy.mkv", b"tiny"),
+    }
+
+def groups_of(result):
+    return sorted(sorted(os.path.basename(p) for p in group) for _, group in result)
+
+def test_partial_hashes_group_sampled_matches(files):
+    groups, stats = find_duplicate_files(files.values())
+    assert groups_of(groups) == [["a copy.mkv", "a.mkv", "b.mkv"], ["small copy.mkv", "small.mkv"]]
+    assert stats["files"] == 6 and stats["hashed"] == 5 and stats["full_hashed"] == 0
+
+def test_full_hashes_confirm(files):
+    groups, stats = find_duplicate_files(files.values(), full=True)
+    assert groups_of(groups) == [["a copy.mkv", "a.mkv"], ["small copy.mkv", "small.mkv"]]
+    # The small files were hashed whole already
+    assert stats["full_hashed"] == 3
+
+def test_unchanged_files_come_from_the_cache(files, monkeypatch):
+    find_duplicate_files(files.values(), full=True)
+    monkeypatch.setattr(filehash, "partial_hash", lambda *args: pytest.fail("partial hash recomputed"))
+    monkeypatch.setattr(filehash, "full_hash", lambda *args: pytest.fail("full hash recomputed"))
+    groups, stats = find_duplicate_files(files.values(), full=True)
+    assert groups_of(groups) == [["a copy.mkv", "a.mkv"], ["small copy.mkv", "small.mkv"]]
+    assert stats["cached"] == 5 and stats["hashed"] == 0 and stats["full_hashed"] == 0
+
+def test_changed_file_is_hashed_again(files):
+    find_duplicate_files(files.values())
+    st = os.stat(files["a_copy"])
+    os.utime(files["a_copy"], (st.st_atime, st.st_mtime + 10))
+    _, stats = find_duplicate_files(files.values())
+    assert stats["hashed"] == 1 and stats["cached"] == 4
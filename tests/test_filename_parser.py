@@ -0,0 +1,37 @@
+import pytest
+from benchmark import CORPUS_FILE, load_corpus
+from filename_parser import parse_filename
+from matching import normalize_title
+
+@pytest.mark.parametrize("filename,title,year", load_corpus(CORPUS_FILE))
+def test_corpus(filename, title, year):
+    parsed = parse_filename(filename)
+    assert normalize_title(parsed.title) == normalize_title(title)
+    assert parsed.year == year
+
+def test_release_tags():
+    parsed = parse_filename("Blade.Runner.2049.2017.2160p.WEB-DL.DDP5.1.HEVC-NOGRP.mkv")
+    assert parsed == ("Blade Runner 2049", 2017, "2160p", "x265", "web dl", "ddp5 1", None, "NOGRP")
+
+def test_hyphenated_title_is_not_a_group():
+    assert parse_filename("Spider-Man.mkv").title == "Spider Man"
+
+def test_trailing_year_is_not_a_group():
+    assert parse_filename("Heat.1080p-1995.mkv")[:2] == ("Heat", 1995)
+
+@pytest.mark.parametrize("filename,title,year", [
+    ("Charlotte's Web (2006).mkv", "Charlotte's Web", 2006),
+    ("The.Cam.Man.2010.mkv", "The Cam Man", 2010),
+    ("Dual.2022.mkv", "Dual", 2022),
+    ("Sub.2009.mkv", "Sub", 2009),
+    ("Limited.2010.mkv", "Limited", 2010),
+    ("Web.2013.mkv", "Web", 2013),
+])
+def test_ambiguous_words_stay_in_the_title(filename, title, year):
+    assert parse_filename(filename)[:2] == (title, year)
+
+def test_ambiguous_words_are_tags_after_the_title():
+    assert parse_filename("Heat.1995.EXTENDED.WEB.mkv")[:2] == ("Heat", 1995)
+    assert parse_filename("Heat.1995.EXTENDED.WEB.mkv").edition == "extended"
+    assert parse_filename("The Lord of the Rings (2001) Extended.mkv").edition == "extended"
+    assert parse_filename("Sample.The.Matrix.1999.mkv").title == "The Matrix"
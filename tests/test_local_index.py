@@ -0,0 +1,84 @@
+import pytest
+import local_index
+import scan
+import tmdb_stub
+
+FILMS = [
+    {"id": 8587, "title": "The Lion King", "popularity": 70.7},
+    {"id": 420818, "title": "The Lion King", "popularity": 55.8},
+    {"id": 1001, "title": "The Lion King 2: Simba's Pride", "popularity": 90.0},
+    {"id": 1002, "title": "Love", "popularity": 2.0},
+    {"id": 1003, "title": "Love Actually", "popularity": 60.0},
+    {"id": 1004, "title": "Amélie", "popularity": 30.0},
+    {"id": 1005, "title": "Love Lessons", "popularity": 99.0, "adult": True},
+    {"id": 1006, "title": "Love Trailer", "popularity": 5.0, "video": True},
+]
+
+@pytest.fixture
+def index(database, tmp_path):
+    path = str(tmp_path / "movie_ids.json.gz")
+    tmdb_stub.write_export(FILMS, path)
+    assert local_index.load_export(path) == 6
+    return path
+
+def ids(results):
+    return [r["id"] for r in results]
+
+def test_exact_title_first(index):
+    # "Love" has few votes, but is the exact title
+    assert ids(local_index.search_local("Love")) == [1002, 1003]
+
+def test_every_word_must_match(index):
+    assert ids(local_index.search_local("lion king simba")) == [1001]
+    assert local_index.search_local("lion queen") == []
+
+def test_year_breaks_ties(index):
+    assert ids(local_index.search_local("The Lion King"))[:2] == [8587, 420818]
+    local_index.note_details({"id": 420818, "title": "The Lion King", "release_date": "2019-07-12"})
+    results = local_index.search_local("The Lion King", year=2019)
+    assert ids(results)[:2] == [420818, 8587]
+    # The export has no dates: the year is known, the release date is not made up
+    assert results[0]["release_date"] == ""
+    assert results[0]["year"] == 2019
+    assert results[0]["source"] == "local index"
+
+def test_diacritics_ignored(index):
+    assert ids(local_index.search_local("amelie")) == [1004]
+
+def test_adult_and_video_excluded(index):
+    assert 1005 not in ids(local_index.search_local("Love Lessons"))
+    assert 1006 not in ids(local_index.search_local("Love Trailer"))
+
+def test_adult_included_on_request(database, tmp_path):
+    path = str(tmp_path / "movie_ids.json.gz")
+    tmdb_stub.write_export(FILMS, path)
+    assert local_index.load_export(path, include_adult=True) == 7
+    assert ids(local_index.search_local("Love Lessons")) == [1005]
+
+def test_reload_drops_removed_films(index, tmp_path):
+    path = str(tmp_path / "next.json.gz")
+    tmdb_stub.write_export(FILMS[:2], path)
+    assert local_index.load_export(path) == 2
+    assert local_index.index_size() == 2
+    assert local_index.search_local("Love") == []
+
+def test_exact_title_answered_locally(database, tmdb, tmp_path, monkeypatch):
+    monkeypatch.setattr(local_index, "stats", {"hits": 0, "misses": 0})
+    path = str(tmp_path / "movie_ids.json.gz")
+    tmdb_stub.write_export([{"id": 949, "title": "Heat", "popularity": 45.5}], path)
+    local_index.load_export(path)
+    assert ids(scan.tmdb_v4_search("heat", "token")) == [949]
+    assert tmdb.requests == 0
+    assert local_index.stats == {"hits": 1, "misses": 0}
+
+def test_loose_local_match_asks_tmdb(database, tmdb, tmp_path, monkeypatch):
+    monkeypatch.setattr(local_index, "stats", {"hits": 0, "misses": 0})
+    path = str(tmp_path / "movie_ids.json.gz")
+    # The index only knows the sequel, which contains every word of "The Matrix"
+    tmdb_stub.write_export([{"id": 604, "title": "The Matrix Reloaded", "popularity": 40.0}], path)
+    local_index.load_export(path)
+    assert ids(scan.tmdb_v4_search("The Matrix", "token")) == [603]
+    assert tmdb.requests == 1
+    assert local_index.stats == {"hits": 0, "misses": 1}
+    # TMDb has nothing either: the local results are still better than none
+    assert ids(scan.tmdb_v4_search("Matrix Reloaded", "token")) == [604]
@@ -0,0 +1,44 @@
+from matching import AUTO_MATCH_MARGIN, is_confident, normalize_title, rank_candidates, release_year, score_candidate
+
+MATRIX = {"id": 603, "title": "The Matrix", "release_date": "1999-03-30", "popularity": 80.1}
+RELOADED = {"id": 604, "title": "The Matrix Reloaded", "release_date": "2003-05-15", "popularity": 40.0}
+LION_KING_1994 = {"id": 8587, "title": "The Lion King", "release_date": "1994-06-24", "popularity": 70.7}
+LION_KING_2019 = {"id": 420818, "title": "The Lion King", "release_date": "2019-07-12", "popularity": 55.8}
+
+def test_normalize_title():
+    assert normalize_title("The Matrix") == normalize_title("matrix")
+    assert normalize_title("Amélie!") == "amelie"
+
+def test_release_year():
+    assert release_year(MATRIX) == "1999"
+    assert release_year({"release_date": "", "year": 2019}) == "2019"
+    assert release_year({"release_date": None}) == ""
+
+def test_exact_title_and_year_score_high():
+    assert score_candidate("Matrix", 1999, MATRIX) > 0.9
+    # A year off by one still counts for something; a wrong year does not
+    assert score_candidate("Matrix", 1998, MATRIX) > score_candidate("Matrix", 2005, MATRIX)
+
+def test_details_and_runtime_are_used():
+    details = dict(MATRIX, runtime=136)
+    assert score_candidate("Matrix", 1999, MATRIX, details, duration=136 * 60) > score_candidate("Matrix", 1999, MATRIX)
+    assert score_candidate("Matrix", 1999, MATRIX, details, duration=90 * 60) < score_candidate("Matrix", 1999, MATRIX)
+
+def test_rank_prefers_details():
+    details = dict(RELOADED, runtime=138)
+    ranked = rank_candidates("The Matrix", 1999, [RELOADED, MATRIX], [details, None])
+    assert [m["id"] for _, m in ranked] == [603, 604]
+    assert ranked[1][1] is details
+
+def test_confident_needs_threshold_and_margin():
+    assert is_confident(rank_candidates("The Matrix", 1999, [MATRIX, RELOADED], [None, None]))
+    assert not is_confident([])
+    assert not is_confident([(0.5, MATRIX)])
+    assert is_confident([(0.9, MATRIX)])
+    assert not is_confident([(0.9, MATRIX), (0.9 - AUTO_MATCH_MARGIN / 2, RELOADED)])
+
+def test_remake_without_year_is_not_confident():
+    ranked = rank_candidates("The Lion King", None, [LION_KING_1994, LION_KING_2019], [None, None])
+    assert not is_confident(ranked)
+    ranked = rank_candidates("The Lion King", 2019, [LION_KING_1994, LION_KING_2019], [None, None])
+    assert is_confident(ranked) and ranked[0][1]["id"] == 420818
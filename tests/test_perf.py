@@ -0,0 +1,97 @@
+import json
+import threading
+import pytest
+import perf
+
+@pytest.fixture(autouse=True)
+def profiling(monkeypatch):
+    # enable() flips module globals: put them back for the other tests
+    monkeypatch.setattr(perf, "enabled", False)
+    monkeypatch.setattr(perf, "keep_events", False)
+
+def test_off_records_nothing():
+    perf.enable()
+    perf.enabled = False
+    with perf.span("work"):
+        pass
+    perf.count("things")
+    assert perf.summary()["spans"] == {} and perf.summary()["counters"] == {}
+
+def test_spans_aggregate():
+    perf.enable()
+    perf.record("db write", 10.0, 10.5)
+    perf.record("db write", 20.0, 20.1)
+    perf.record("probe", 0.0, 2.0)
+    spans = perf.summary()["spans"]
+    assert list(spans) == ["probe", "db write"]  # Largest total first
+    s = spans["db write"]
+    assert s["calls"] == 2
+    assert s["total"] == pytest.approx(0.6)
+    assert s["mean"] == pytest.approx(0.3)
+    assert s["max"] == pytest.approx(0.5)
+
+def test_span_timed_and_count_across_threads():
+    perf.enable()
+
+    @perf.timed("job")
+    def job():
+        with perf.span("inner"):
+            perf.count("items", 2)
+
+    threads = [threading.Thread(target=lambda: [job() for _ in range(100)]) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    data = perf.summary()
+    assert data["spans"]["job"]["calls"] == data["spans"]["inner"]["calls"] == 400
+    assert data["counters"] == {"items": 800}
+
+def test_enable_resets():
+    perf.enable()
+    perf.count("items")
+    perf.enable()
+    assert perf.summary()["counters"] == {}
+
+def test_write_json(tmp_path):
+    perf.enable()
+    perf.record("scan", 0.0, 1.0)
+    perf.count("files", 3)
+    path = tmp_path / "profile.json"
+    perf.write_json(str(path), command="scan")
+    data = json.loads(path.read_text())
+    assert data["command"] == "scan"
+    assert data["spans"]["scan"]["calls"] == 1
+    assert data["counters"] == {"files": 3}
+    assert data["wall"] >= 0
+
+def test_write_chrome_trace(tmp_path):
+    perf.enable(keep_trace=True)
+    with perf.span("outer"):
+        with perf.span("inner"):
+            pass
+    worker = threading.Thread(target=lambda: perf.record("worker", perf._start, perf._start + 0.25), name="worker-1")
+    worker.start()
+    worker.join()
+    path = tmp_path / "trace.json"
+    perf.write_chrome_trace(str(path))
+    events = json.loads(path.read_text())["traceEvents"]
+    names = {e["args"]["name"] for e in events if e["ph"] == "M"}
+    assert {"MainThread", "worker-1"} <= names
+    spans = {e["name"]: e for e in events if e["ph"] == "X"}
+    assert set(spans) == {"outer", "inner", "worker"}
+    # Microseconds from the start of the run; the inner span lies inside the outer one
+    assert spans["worker"]["ts"] == pytest.approx(0) and spans["worker"]["dur"] == pytest.approx(250000)
+    assert spans["outer"]["ts"] <= spans["inner"]["ts"]
+    assert spans["inner"]["ts"] + spans["inner"]["dur"] <= spans["outer"]["ts"] + spans["outer"]["dur"]
+    assert spans["outer"]["tid"] != spans["worker"]["tid"]
+
+def test_trace_is_capped(monkeypatch, tmp_path):
+    monkeypatch.setattr(perf, "MAX_EVENTS", 5)
+    perf.enable(keep_trace=True)
+    for _ in range(10):
+        perf.record("step", 0.0, 0.001)
+    perf.write_chrome_trace(str(tmp_path / "trace.json"))
+    events = json.loads((tmp_path / "trace.json").read_text())["traceEvents"]
+    assert len([e for e in events if e["ph"] == "X"]) == 5
+    assert perf.summary()["spans"]["step"]["calls"] == 10  # Totals still cover every span
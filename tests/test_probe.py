@@ -0,0 +1,9 @@
+import io
+import struct
+from probe import probe_avi
+
+def test_avi_with_short_hdrl_is_rejected():
+    head = b"RIFF" + struct.pack("<I", 1000) + b"AVI " + b"LIST" + struct.pack("<I", 2) + b"hdrl"
+    f = io.BytesIO(head + b"\0" * 1000)
+    assert probe_avi(f) is None
+    assert f.tell() == 24  # Nothing read past the header
@@ -0,0 +1,49 @@
+import os
+from reconcile import apply_plan, plan_build, scan_target_tree
+
+def test_plan_creates_keeps_and_retargets():
+    desired = {"/t/A/A.mkv": "/s/a.mkv", "/t/B/B.mkv": "/s/b.mkv", "/t/C/C.mkv": "/s/c2.mkv"}
+    links = {"/t/B/B.mkv": "/s/b.mkv", "/t/C/C.mkv": "/s/c.mkv"}
+    plan = plan_build(desired, links, set(), {"/t/B/B.mkv": "/s/b.mkv", "/t/C/C.mkv": "/s/c.mkv"})
+    assert plan["create"] == {"/t/A/A.mkv": "/s/a.mkv"}
+    assert plan["retarget"] == {"/t/C/C.mkv": "/s/c2.mkv"}
+    assert plan["unchanged"] == 1
+    assert plan["remove"] == [] and plan["forget"] == [] and plan["collisions"] == []
+
+def test_plan_never_touches_what_it_did_not_create():
+    desired = {"/t/A/A.mkv": "/s/a.mkv", "/t/B/B.mkv": "/s/b.mkv"}
+    # A is a regular file; B is someone else's link: neither is in the manifest
+    plan = plan_build(desired, {"/t/B/B.mkv": "/elsewhere.mkv", "/t/X/X.mkv": "/s/x.mkv"}, {"/t/A/A.mkv"}, {})
+    assert sorted(plan["collisions"]) == ["/t/A/A.mkv", "/t/B/B.mkv"]
+    assert plan["create"] == {} and plan["retarget"] == {}
+    assert plan["remove"] == []  # X is not in the manifest, so it stays
+
+def test_plan_removes_and_forgets_manifest_links():
+    manifest = {"/t/A/A.mkv": "/s/a.mkv", "/t/B/B.mkv": "/s/b.mkv"}
+    plan = plan_build({}, {"/t/A/A.mkv": "/s/a.mkv"}, set(), manifest)
+    assert plan["remove"] == ["/t/A/A.mkv"]
+    assert plan["forget"] == ["/t/B/B.mkv"]  # Already gone from disk
+
+def test_apply_creates_retargets_and_removes(tmp_path):
+    target = str(tmp_path / "t")
+    first = {os.path.join(target, "A", "A.mkv"): "/s/a.mkv", os.path.join(target, "B", "B.mkv"): "/s/b.mkv"}
+    plan = plan_build(first, {}, set(), {})
+    assert apply_plan(plan, target, set()) == []
+    links, _, dirs = scan_target_tree(target)
+    assert links == first
+    second = {os.path.join(target, "A", "A.mkv"): "/s/a2.mkv"}
+    plan = plan_build(second, links, set(), first)
+    assert apply_plan(plan, target, dirs) == []
+    assert scan_target_tree(target)[0] == second
+    assert not os.path.exists(os.path.join(target, "B"))  # Emptied folders are pruned
+
+def test_retarget_replaces_a_stale_tmp_link(tmp_path):
+    target = str(tmp_path / "t")
+    link = os.path.join(target, "A", "A.mkv")
+    os.makedirs(os.path.dirname(link))
+    os.symlink("/s/a.mkv", link)
+    os.symlink("/s/half-done.mkv", link + ".movieorg-tmp")  # An interrupted retarget
+    plan = plan_build({link: "/s/a2.mkv"}, {link: "/s/a.mkv"}, set(), {link: "/s/a.mkv"})
+    assert apply_plan(plan, target, {os.path.dirname(link)}) == []
+    assert os.readlink(link) == "/s/a2.mkv"
+    assert os.listdir(os.path.dirname(link)) == ["A.mkv"]
@@ -0,0 +1,38 @@
+import json
+import db
+import refresh
+import scan
+import tmdb_client
+import tmdb_stub
+
+def add(movie, path):
+    db.add_movie(path, path, *scan.tmdb_movie_fields(movie))
+
+def test_search_result_is_incomplete(database):
+    add({"id": 603, "title": "The Matrix", "release_date": "1999-03-30"}, "/m/a.mkv")
+    assert refresh.films_to_refresh() == {603: "incomplete"}
+
+def test_film_without_genres_is_complete(database):
+    # TMDb lists some films with no genres: fetched details, not missing ones
+    details = tmdb_stub.movie_details({"id": 7, "title": "Untitled", "release_date": "2001-01-01"}, credits=True)
+    assert details["genres"] == []
+    add(details, "/m/b.mkv")
+    assert refresh.films_to_refresh() == {}
+
+def test_old_details_are_stale(database):
+    add(tmdb_stub.movie_details(tmdb_stub.DEFAULT_MOVIES[0], credits=True), "/m/a.mkv")
+    assert refresh.films_to_refresh() == {}
+    assert refresh.films_to_refresh(max_age_days=-1) == {603: "stale"}
+    assert refresh.films_to_refresh(refresh_all=True) == {603: "stale"}
+
+def test_refresh_completes_films_once(database, stub, monkeypatch):
+    url, state = stub(movies=[{"id": 7, "title": "Untitled", "release_date": "2001-01-01", "genres": []}])
+    monkeypatch.setattr(tmdb_client, "TMDB_API_URL", url)
+    add({"id": 7, "title": "Untitled", "release_date": "2001-01-01"}, "/m/b.mkv")
+    refresh.refresh_metadata("token", workers=2)
+    (metadata,) = [m for _, m in db.iter_film_metadata()]
+    assert json.loads(metadata)["genres"] == []
+    assert refresh.films_to_refresh() == {}
+    requests = state.requests
+    refresh.refresh_metadata("token", workers=2)
+    assert state.requests == requests
@@ -0,0 +1,65 @@
+import db
+import review
+
+def library(database):
+    # Ten files: even ones matched to "Heat", odd ones unmatched; one title with LIKE wildcards
+    for n in range(10):
+        path = f"/lib/{n:02d}.mkv"
+        if n % 2 == 0:
+            db.add_movie(path, path, 949, "Heat", 1995, "Crime", "{}")
+        else:
+            db.add_movie(path, path, None, None, None, "", "")
+    db.add_movie("/lib/Sale.mkv", "Sale.mkv", 1, "50%_Off", 2001, "", "{}")
+
+def paths(rows):
+    return [r[0] for r in rows]
+
+def test_keyset_pages_cover_every_file_once(database):
+    library(database)
+    seen, after = [], None
+    while True:
+        page = db.get_review_page(after, 3)
+        if not page:
+            break
+        assert len(page) <= 3
+        seen += paths(page)
+        after = page[-1][0]
+    assert seen == sorted(seen)
+    assert len(seen) == len(set(seen)) == db.count_review_rows() == 11
+
+def test_filters(database):
+    library(database)
+    assert db.count_review_rows(unmatched=True) == 5
+    assert paths(db.get_review_page(None, 2, unmatched=True)) == ["/lib/01.mkv", "/lib/03.mkv"]
+    assert paths(db.get_review_page("/lib/03.mkv", 2, unmatched=True)) == ["/lib/05.mkv", "/lib/07.mkv"]
+    assert db.count_review_rows(search="heat") == 5
+    # % and _ in the search are plain characters
+    assert paths(db.get_review_page(None, 10, search="50%_")) == ["/lib/Sale.mkv"]
+    assert db.count_review_rows(search="5_%") == 0
+
+def test_bulk_ignore_only_touches_the_filter(database):
+    library(database)
+    assert db.set_skip_flag_where(True, unmatched=True) == 5
+    assert db.set_skip_flag_where(True, unmatched=True) == 0  # Already ignored
+    assert paths(db.get_review_page(None, 20, skipped=True)) == [f"/lib/{n:02d}.mkv" for n in range(1, 10, 2)]
+    assert db.set_skip_flag_where(False, search="07") == 1
+    assert db.count_review_rows(skipped=True) == 4
+
+def test_review_bulk_ignores_filtered_files(database, monkeypatch):
+    library(database)
+    # Filter to unmatched files, bulk-ignore them, quit
+    answers = iter(["u", "b", "i", "q"])
+    monkeypatch.setattr(review.Prompt, "ask", lambda *args, **kwargs: next(answers))
+    review.review_database(page_size=3)
+    assert db.count_review_rows(skipped=True) == 5
+    assert db.count_review_rows(skipped=True, unmatched=True) == 5
+
+def test_review_pages_forward_and_back(database, monkeypatch):
+    library(database)
+    starts = []
+    get_page = db.get_review_page
+    monkeypatch.setattr(review, "get_review_page", lambda after, *args: starts.append(after) or get_page(after, *args))
+    answers = iter(["n", "n", "p", "q"])
+    monkeypatch.setattr(review.Prompt, "ask", lambda *args, **kwargs: next(answers))
+    review.review_database(page_size=4)
+    assert starts == [None, "/lib/03.mkv", "/lib/07.mkv", "/lib/03.mkv"]
@@ -0,0 +1,56 @@
+import json
+import os
+import db
+import review
+from db import QUEUE_MATCHED, QUEUE_PENDING, count_queue, get_file_index, get_pending_matches
+from scan import auto_scan_directory
+
+def test_auto_scan_matches_confident_files(database, tmdb, tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "1917.2019.2160p.mkv").write_bytes(b"x" * 10)
+    (source / "Heat.1995.1080p.mkv").write_bytes(b"x" * 20)
+    auto_scan_directory(str(source), "token")
+    assert count_queue(str(source)).get(QUEUE_MATCHED) == 2
+    # The identity found at discovery is stored with the match
+    index = get_file_index()
+    st = os.stat(source / "Heat.1995.1080p.mkv")
+    assert index[str(source / "Heat.1995.1080p.mkv")] == (20, st.st_mtime, st.st_ino, st.st_dev)
+
+def test_moved_file_is_relinked(database, tmdb, tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "1917.2019.2160p.mkv").write_bytes(b"x" * 10)
+    auto_scan_directory(str(source), "token")
+    os.rename(source / "1917.2019.2160p.mkv", source / "1917.Renamed.2019.mkv")
+    # Make sure the directory's mtime moves on even on coarse-grained filesystems
+    st = os.stat(source)
+    os.utime(source, (st.st_atime, st.st_mtime + 1))
+    requests = tmdb.requests
+    auto_scan_directory(str(source), "token")
+    assert tmdb.requests == requests  # Re-linked, not searched again
+    assert list(get_file_index()) == [str(source / "1917.Renamed.2019.mkv")]
+    assert db.query('SELECT tmdb_id FROM files') == [(530915,)]
+    counts = count_queue(str(source))
+    assert counts.get(QUEUE_MATCHED) == 1 and not counts.get(QUEUE_PENDING)
+
+def test_ambiguous_file_waits_for_review(database, tmdb, tmp_path, monkeypatch):
+    source = tmp_path / "source"
+    source.mkdir()
+    # Two films share the title and there is no year to tell them apart
+    (source / "The.Lion.King.1080p.mkv").write_bytes(b"x" * 10)
+    auto_scan_directory(str(source), "token")
+    assert count_queue(str(source)) == {QUEUE_PENDING: 1}
+    (pending,) = get_pending_matches()
+    assert pending["title_guess"] == "The Lion King"
+    ranked = json.loads(pending["candidates"])
+    assert {c["movie"]["id"] for c in ranked} == {8587, 420818}
+    assert ranked[0]["score"] >= ranked[1]["score"]
+    assert pending["best_score"] == ranked[0]["score"]
+
+    # Picking the second candidate in review matches the file
+    monkeypatch.setattr(review.Prompt, "ask", lambda *args, **kwargs: "2")
+    review.review_pending()
+    assert count_queue(str(source)) == {QUEUE_MATCHED: 1}
+    assert db.query('SELECT tmdb_id FROM files') == [(ranked[1]["movie"]["id"],)]
+    assert get_pending_matches() == []
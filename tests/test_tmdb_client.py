@@ -0,0 +1,100 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import tmdb_client
+from tmdb_client import TMDbClient, TMDbError
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(tmdb_client, "BACKOFF_BASE", 0.01)
+
+def test_get_sends_bearer_token(stub):
+    url, state = stub()
+    client = TMDbClient("secret", base_url=url)
+    assert client.get("/movie/603")["title"] == "The Matrix"
+    assert state.auth_headers == {"Bearer secret"}
+
+def test_missing_film_is_none(stub):
+    url, _ = stub()
+    assert TMDbClient("secret", base_url=url).get("/movie/1") is None
+
+def test_connections_are_reused(stub):
+    url, state = stub()
+    client = TMDbClient("secret", base_url=url, rate=1000, burst=100, pool_size=4)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(lambda _: client.get("/search/movie", {"query": "lion king"}), range(40)))
+    assert all(len(r["results"]) == 2 for r in results)
+    assert state.requests == 40
+    assert len(state.connections) <= 4
+
+def test_429_waits_for_retry_after(stub):
+    url, state = stub(rate_limit_every=2, retry_after=0.3)
+    client = TMDbClient("secret", base_url=url)
+    assert client.get("/movie/603")["id"] == 603
+    start = time.perf_counter()
+    assert client.get("/movie/949")["title"] == "Heat"  # Limited once, then answered
+    assert time.perf_counter() - start >= 0.3
+    assert state.rate_limited == 1
+    assert state.requests == 3
+    assert client.latency_report()[0][4] == 1  # One retry
+
+def test_5xx_is_retried(stub):
+    url, state = stub(error_every=2)
+    client = TMDbClient("secret", base_url=url)
+    assert client.get("/movie/603")["id"] == 603
+    assert client.get("/movie/62")["id"] == 62  # Second request fails once, then succeeds
+    assert state.errors == 1
+    assert state.requests == 3
+
+def test_retries_exhausted(stub):
+    url, state = stub(error_every=1)
+    client = TMDbClient("secret", base_url=url, max_retries=2)
+    with pytest.raises(TMDbError) as raised:
+        client.get("/movie/603")
+    assert raised.value.status_code == 503
+    assert state.requests == 3
+    assert client.latency_report()[0][4:] == (2, 3)  # Two retries, three failures
+
+def test_invalid_json_is_retried(stub):
+    url, state = stub(garble_every=2)
+    client = TMDbClient("secret", base_url=url)
+    assert client.get("/movie/603")["id"] == 603
+    assert client.get("/movie/62")["id"] == 62  # Garbled once, then answered
+    assert state.garbled == 1
+    assert state.requests == 3
+    assert client.latency_report()[0][4:] == (1, 1)
+
+def test_truncated_body_is_retried(stub):
+    url, state = stub(truncate_every=2)
+    client = TMDbClient("secret", base_url=url)
+    assert client.get("/movie/603")["id"] == 603
+    assert client.get("/movie/62")["id"] == 62  # Cut off once, then answered on a new connection
+    assert state.truncated == 1
+    assert state.requests == 3
+
+def test_garbled_responses_exhaust_retries(stub):
+    url, state = stub(garble_every=1)
+    client = TMDbClient("secret", base_url=url, max_retries=2)
+    with pytest.raises(TMDbError):
+        client.get("/movie/603")
+    assert state.requests == 3
+
+def test_no_wait_after_last_attempt(stub):
+    url, state = stub(rate_limit_every=1, retry_after=0.3)
+    client = TMDbClient("secret", base_url=url, max_retries=1)
+    start = time.perf_counter()
+    with pytest.raises(TMDbError) as raised:
+        client.get("/movie/603")
+    elapsed = time.perf_counter() - start
+    assert raised.value.status_code == 429
+    assert state.requests == 2
+    assert 0.3 <= elapsed < 0.55
+
+def test_unauthorised_is_not_retried(stub):
+    url, state = stub()
+    client = TMDbClient("secret", base_url=url)
+    client.session.headers.pop("Authorization")
+    with pytest.raises(TMDbError) as raised:
+        client.get("/movie/603")
+    assert raised.value.status_code == 401
+    assert state.requests == 1
@@ -0,0 +1,40 @@
+import os
+from db import get_queued_paths, get_scanned_dirs
+from scan import discover_files, load_walk_state, iter_new_video_files
+
+def make_tree(root, dirs=20):
+    for d in range(dirs):
+        folder = root / f"Film {d}"
+        folder.mkdir(parents=True)
+        (folder / f"Film.{d}.2001.mkv").touch()
+        (folder / "poster.jpg").touch()
+
+def bump_mtime(path):
+    st = os.stat(path)
+    os.utime(path, (st.st_atime, st.st_mtime + 10))
+
+def test_rescan_skips_unchanged_directories(database, tmp_path):
+    make_tree(tmp_path / "lib")
+    assert discover_files(str(tmp_path / "lib")) == 20
+    assert len(get_scanned_dirs()) == 21  # Every folder and the root
+    walk_state = load_walk_state()
+    assert list(iter_new_video_files(str(tmp_path / "lib"), walk_state)) == []
+    assert walk_state["skipped_dirs"] == 21
+
+def test_rescan_finds_new_files_in_changed_directories(database, tmp_path):
+    make_tree(tmp_path / "lib")
+    discover_files(str(tmp_path / "lib"))
+    folder = tmp_path / "lib" / "Film 3"
+    (folder / "Film.3.2001.720p.mp4").touch()
+    bump_mtime(folder)
+    walk_state = load_walk_state()
+    found = [rel for _, rel, _ in iter_new_video_files(str(tmp_path / "lib"), walk_state)]
+    assert found == [os.path.join("Film 3", "Film.3.2001.720p.mp4")]
+    assert walk_state["skipped_dirs"] == 20
+
+def test_filtered_walk_does_not_mark_directories(database, tmp_path):
+    make_tree(tmp_path / "lib", dirs=1)
+    (tmp_path / "lib" / "Film 0" / "Film.0.2001.mp4").touch()
+    assert discover_files(str(tmp_path / "lib"), include=["*.mkv"]) == 1
+    assert discover_files(str(tmp_path / "lib")) == 1
+    assert len(get_queued_paths()) == 2
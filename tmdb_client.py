@@ -0,0 +1,168 @@
+import os
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, Optional
+import requests
+from requests.adapters import HTTPAdapter
+import perf
+
+# Overridable so the client can be pointed at a local stub server (see tmdb_stub.py)
+TMDB_API_URL = os.environ.get("TMDB_API_URL", "https://api.themoviedb.org/3")
+
+# TMDb allows roughly 50 requests/s per IP; stay a little below
+REQUESTS_PER_SECOND = 40.0
+BURST = 20
+POOL_SIZE = 16
+# (connect, read) timeouts in seconds
+TIMEOUT = (5, 20)
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Failures in transit: a dropped connection, a timeout, a body cut short or garbled
+RETRY_ERRORS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+                requests.exceptions.JSONDecodeError)
+
+class TMDbError(Exception):
+    """TMDb could not answer (after retrying where that makes sense). Not the same as "no results"."""
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+class RateLimiter:
+    """Token bucket: `rate` tokens per second, at most `burst` saved up."""
+    def __init__(self, rate: float = REQUESTS_PER_SECOND, burst: int = BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Empty the bucket for `seconds`, e.g. after the server answered 429 with Retry-After."""
+        with self.lock:
+            self.tokens = min(self.tokens, 0) - seconds * self.rate
+            self.updated = time.monotonic()
+
+def endpoint_name(endpoint: str) -> str:
+    # /movie/603/credits -> /movie/{id}/credits, so statistics group by endpoint, not by film
+    return re.sub(r"/\d+", "/{id}", endpoint)
+
+class TMDbClient:
+    """
+    Pooled, rate-limited TMDb API client. Safe to share between threads.
+
+    get() returns the decoded JSON, None for 404, and raises TMDbError once retries are exhausted
+    or for errors that retrying cannot fix (e.g. 401).
+    """
+    def __init__(self, bearer_token: str, base_url: Optional[str] = None, rate: float = REQUESTS_PER_SECOND,
+                 burst: int = BURST, pool_size: int = POOL_SIZE, max_retries: int = MAX_RETRIES, timeout=TIMEOUT):
+        self.base_url = (base_url or TMDB_API_URL).rstrip("/")
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.limiter = RateLimiter(rate, burst)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {bearer_token}",
+            "accept": "application/json"
+        })
+        self.stats: Dict[str, Dict[str, float]] = {}
+        self.stats_lock = threading.Lock()
+
+    def _record(self, endpoint: str, elapsed: float, retried: bool = False, failed: bool = False):
+        if perf.enabled:
+            now = time.perf_counter()
+            perf.record(f"http GET {endpoint_name(endpoint)}", now - elapsed, now)
+        with self.stats_lock:
+            s = self.stats.setdefault(endpoint_name(endpoint), {"requests": 0, "total": 0.0, "max": 0.0, "retries": 0, "errors": 0})
+            s["requests"] += 1
+            s["total"] += elapsed
+            s["max"] = max(s["max"], elapsed)
+            s["retries"] += retried
+            s["errors"] += failed
+
+    def _backoff(self, attempt: int, retry_after: Optional[str]) -> float:
+        if retry_after:
+            try:
+                return min(BACKOFF_MAX, float(retry_after))
+            except ValueError:
+                pass
+        # Full jitter: spreads out the retries of concurrent workers
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+    def get(self, endpoint: str, params: Optional[Dict[str, Any]] = None) -> Optional[Any]:
+        url = f"{self.base_url}{endpoint}"
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            last = attempt == self.max_retries
+            self.limiter.acquire()
+            start = time.perf_counter()
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+                data = response.json() if response.status_code == 200 else None
+            except RETRY_ERRORS as e:
+                self._record(endpoint, time.perf_counter() - start, retried=not last, failed=True)
+                last_error = TMDbError(f"TMDb request failed: {e}")
+                if not last:
+                    time.sleep(self._backoff(attempt, None))
+                continue
+            elapsed = time.perf_counter() - start
+            perf.count("http bytes received", len(response.content))
+            if response.status_code == 200:
+                self._record(endpoint, elapsed)
+                return data
+            if response.status_code == 404:
+                self._record(endpoint, elapsed)
+                return None
+            if response.status_code in RETRY_STATUSES:
+                self._record(endpoint, elapsed, retried=not last, failed=True)
+                last_error = TMDbError(f"TMDb API error: {response.status_code} {response.text}", response.status_code)
+                delay = self._backoff(attempt, response.headers.get("Retry-After"))
+                if response.status_code == 429:
+                    # Every worker shares the limiter, so they all back off, not just this one
+                    self.limiter.pause(delay)
+                # No point waiting after the last attempt: give up straight away
+                if not last:
+                    time.sleep(delay)
+                continue
+            self._record(endpoint, elapsed, failed=True)
+            raise TMDbError(f"TMDb API error: {response.status_code} {response.text}", response.status_code)
+        raise last_error
+
+    def latency_report(self):
+        """[(endpoint, requests, mean seconds, max seconds, retries, errors)], busiest endpoint first."""
+        with self.stats_lock:
+            rows = [
+                (name, int(s["requests"]), s["total"] / s["requests"], s["max"], int(s["retries"]), int(s["errors"]))
+                for name, s in self.stats.items()
+            ]
+        return sorted(rows, key=lambda r: r[1], reverse=True)
+
+_clients: Dict[str, TMDbClient] = {}
+_clients_lock = threading.Lock()
+
+def get_client(bearer_token: str) -> TMDbClient:
+    """The shared client for a token, so every caller uses the same connection pool and rate limit."""
+    with _clients_lock:
+        client = _clients.get(bearer_token)
+        if client is None or client.base_url != TMDB_API_URL.rstrip("/"):
+            client = _clients[bearer_token] = TMDbClient(bearer_token)
+        return client
@@ -0,0 +1,188 @@
+import gzip
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import urlparse, parse_qs
+import typer
+from matching import normalize_title
+
+# A few well-known films; pass your own list to start_stub_server for larger catalogues
+DEFAULT_MOVIES = [
+    {"id": 603, "title": "The Matrix", "release_date": "1999-03-30", "runtime": 136, "popularity": 80.1, "genres": ["Action", "Science Fiction"], "director": "Lana Wachowski"},
+    {"id": 62, "title": "2001: A Space Odyssey", "release_date": "1968-04-02", "runtime": 149, "popularity": 40.2, "genres": ["Science Fiction", "Mystery"], "director": "Stanley Kubrick"},
+    {"id": 530915, "title": "1917", "release_date": "2019-12-25", "runtime": 119, "popularity": 50.3, "genres": ["War", "Drama"], "director": "Sam Mendes"},
+    {"id": 335984, "title": "Blade Runner 2049", "release_date": "2017-10-04", "runtime": 164, "popularity": 60.4, "genres": ["Science Fiction", "Drama"], "director": "Denis Villeneuve"},
+    {"id": 949, "title": "Heat", "release_date": "1995-12-15", "runtime": 170, "popularity": 45.5, "genres": ["Crime", "Thriller"], "director": "Michael Mann"},
+    {"id": 14161, "title": "2012", "release_date": "2009-10-10", "runtime": 158, "popularity": 30.6, "genres": ["Action", "Science Fiction"], "director": "Roland Emmerich"},
+    {"id": 8587, "title": "The Lion King", "release_date": "1994-06-24", "runtime": 89, "popularity": 70.7, "genres": ["Animation", "Family"], "director": "Roger Allers"},
+    {"id": 420818, "title": "The Lion King", "release_date": "2019-07-12", "runtime": 118, "popularity": 55.8, "genres": ["Adventure", "Family"], "director": "Jon Favreau"},
+]
+
+def movie_details(movie: dict, credits: bool) -> dict:
+    details = {
+        "id": movie["id"],
+        "title": movie["title"],
+        "original_title": movie.get("original_title", movie["title"]),
+        "release_date": movie.get("release_date", ""),
+        "runtime": movie.get("runtime"),
+        "popularity": movie.get("popularity", 1.0),
+        "genres": [{"id": i, "name": g} for i, g in enumerate(movie.get("genres", []))],
+        "production_companies": [{"name": movie.get("studio", "Stub Pictures")}],
+        "belongs_to_collection": movie.get("collection"),
+    }
+    if credits:
+        details["credits"] = {"crew": [{"job": "Director", "name": movie.get("director", "Jane Doe")}]}
+    return details
+
+def write_export(movies: List[dict], path: str):
+    """Write movies as a TMDb daily ID export (gzip JSON lines, no release dates), e.g. for local_index.load_export."""
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        for m in movies:
+            f.write(json.dumps({"adult": m.get("adult", False), "id": m["id"], "original_title": m.get("original_title", m["title"]),
+                                "popularity": m.get("popularity", 1.0), "video": m.get("video", False)}) + "\n")
+
+def search_result(movie: dict) -> dict:
+    return {k: movie.get(k) for k in ("id", "title", "release_date", "popularity")}
+
+class StubState:
+    def __init__(self, movies: List[dict], latency: float, rate_limit_every: int, retry_after: float, error_every: int = 0,
+                 garble_every: int = 0, truncate_every: int = 0):
+        self.movies = {m["id"]: m for m in movies}
+        # word -> films with it in their title, so a search over a large synthetic catalogue stays cheap
+        self.index: Dict[str, Set[int]] = {}
+        for m in movies:
+            for word in normalize_title(m["title"]).split():
+                self.index.setdefault(word, set()).add(m["id"])
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.error_every = error_every
+        self.garble_every = garble_every
+        self.truncate_every = truncate_every
+        self.requests = 0
+        self.rate_limited = 0
+        self.errors = 0
+        # Responses sent with invalid JSON, or cut off mid-body
+        self.garbled = 0
+        self.truncated = 0
+        # Client (host, port) pairs seen, i.e. TCP connections opened, and the Authorization headers received
+        self.connections: Set[Tuple[str, int]] = set()
+        self.auth_headers: Set[str] = set()
+        self.lock = threading.Lock()
+
+    def search(self, query: str) -> List[dict]:
+        words = set(normalize_title(query).split())
+        if not words:
+            return []
+        ids = set.intersection(*(self.index.get(w, set()) for w in words))
+        hits = [self.movies[i] for i in ids]
+        return sorted(hits, key=lambda m: m.get("popularity", 0), reverse=True)[:20]
+
+def make_handler(state: StubState):
+    class Handler(BaseHTTPRequestHandler):
+        # Keep-alive, like the real API, so clients can pool connections
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass  # Keep benchmark output clean
+
+        def send_json(self, status: int, body: dict, headers: Optional[dict] = None):
+            self.send_payload(status, json.dumps(body).encode("utf-8"), headers)
+
+        def send_payload(self, status: int, payload: bytes, headers: Optional[dict] = None):
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            with state.lock:
+                state.requests += 1
+                limited = state.rate_limit_every and state.requests % state.rate_limit_every == 0
+                if limited:
+                    state.rate_limited += 1
+                failed = not limited and state.error_every and state.requests % state.error_every == 0
+                if failed:
+                    state.errors += 1
+                ok = not limited and not failed
+                garbled = ok and state.garble_every and state.requests % state.garble_every == 0
+                if garbled:
+                    state.garbled += 1
+                truncated = ok and not garbled and state.truncate_every and state.requests % state.truncate_every == 0
+                if truncated:
+                    state.truncated += 1
+                state.connections.add(self.client_address)
+                state.auth_headers.add(self.headers.get("Authorization", ""))
+            if state.latency:
+                time.sleep(state.latency)
+            if not self.headers.get("Authorization", "").startswith("Bearer "):
+                return self.send_json(401, {"status_code": 7, "status_message": "Invalid API key"})
+            if limited:
+                return self.send_json(429, {"status_code": 25, "status_message": "Rate limit exceeded"}, {"Retry-After": str(state.retry_after)})
+            if failed:
+                return self.send_json(503, {"status_code": 9, "status_message": "Service offline."})
+            if garbled:
+                return self.send_payload(200, b'{"id": 603, "title": "The Ma')
+            if truncated:
+                # Announce a 256-byte chunk, send part of it and hang up, as a connection dropped mid-body would
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                self.wfile.write(b'100\r\n{"id": 603, "title": "The Ma')
+                self.close_connection = True
+                return
+            url = urlparse(self.path)
+            params = {k: v[0] for k, v in parse_qs(url.query).items()}
+            path = re.sub(r"^/3", "", url.path)
+            if path == "/search/movie":
+                results = [search_result(m) for m in state.search(params.get("query", ""))]
+                return self.send_json(200, {"page": 1, "results": results, "total_results": len(results), "total_pages": 1})
+            match = re.match(r"^/movie/(\d+)(/credits)?$", path)
+            movie = state.movies.get(int(match.group(1))) if match else None
+            if movie is None:
+                return self.send_json(404, {"status_code": 34, "status_message": "The resource you requested could not be found."})
+            if match.group(2):
+                return self.send_json(200, movie_details(movie, credits=True)["credits"])
+            return self.send_json(200, movie_details(movie, credits="credits" in params.get("append_to_response", "")))
+    return Handler
+
+def start_stub_server(movies: Optional[List[dict]] = None, port: int = 0, latency: float = 0.0,
+                      rate_limit_every: int = 0, retry_after: float = 0.1, error_every: int = 0,
+                      garble_every: int = 0, truncate_every: int = 0) -> Tuple[ThreadingHTTPServer, str, StubState]:
+    """
+    Serve a TMDb-like API on localhost in a background thread.
+    Every `rate_limit_every`-th request gets a 429 with Retry-After, and every `error_every`-th a 503.
+    Every `garble_every`-th gets a 200 with invalid JSON, and every `truncate_every`-th a 200 whose body
+    is cut off when the connection drops.
+    Returns (server, base_url, state); point the client at base_url (tmdb_client.TMDB_API_URL) and
+    call server.shutdown() when done.
+    """
+    state = StubState(movies or DEFAULT_MOVIES, latency, rate_limit_every, retry_after, error_every, garble_every, truncate_every)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/3", state
+
+def main(
+    port: int = typer.Option(8765, help="Port to listen on"),
+    latency: float = typer.Option(0.0, help="Seconds added to every response"),
+    rate_limit_every: int = typer.Option(0, help="Answer every Nth request with 429 (0 = never)")
+):
+    """Run the stub TMDb API until interrupted. Use TMDB_API_URL=http://127.0.0.1:PORT/3 to point the CLI at it."""
+    server, url, _ = start_stub_server(port=port, latency=latency, rate_limit_every=rate_limit_every)
+    typer.echo(f"Stub TMDb API on {url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    typer.run(main)
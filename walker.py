@@ -0,0 +1,90 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from fnmatch import fnmatch
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+import perf
+
+VIDEO_EXTENSIONS = (".mkv", ".mp4", ".avi")
+# Directories listed concurrently; on network mounts the latency of each listing dominates
+WALK_WORKERS = 8
+
+def _matches(patterns: Sequence[str], name: str, rel_path: str) -> bool:
+    return any(fnmatch(name, p) or fnmatch(rel_path, p) for p in patterns)
+
+@perf.timed("walk: list directory")
+def _scan_dir(path: str, rel_dir: str, depth: int, options: dict) -> Tuple[float, List[os.DirEntry], List[Tuple[str, str]]]:
+    """List one directory. Returns (mtime, matching file entries, [(subdir path, subdir rel path)])."""
+    mtime = os.stat(path).st_mtime
+    skip_files = options["skip_dir"] is not None and options["skip_dir"](path, mtime)
+    files, subdirs = [], []
+    with os.scandir(path) as it:
+        for entry in it:
+            name = entry.name
+            rel_path = os.path.join(rel_dir, name) if rel_dir else name
+            if entry.is_dir(follow_symlinks=False):
+                if options["max_depth"] is not None and depth >= options["max_depth"]:
+                    continue
+                if options["exclude"] and _matches(options["exclude"], name, rel_path):
+                    continue
+                subdirs.append((entry.path, rel_path))
+                continue
+            # Cheap suffix test first: most entries are rejected before any other path work
+            if skip_files or not name.lower().endswith(options["extensions"]):
+                continue
+            if options["include"] and not _matches(options["include"], name, rel_path):
+                continue
+            if options["exclude"] and _matches(options["exclude"], name, rel_path):
+                continue
+            if options["stat_files"]:
+                try:
+                    entry.stat()  # Cached on the entry, so the caller gets it for free
+                except OSError:
+                    continue
+            files.append(entry)
+    return mtime, files, subdirs
+
+def walk_video_dirs(
+    root: str,
+    extensions: Tuple[str, ...] = VIDEO_EXTENSIONS,
+    include: Optional[Sequence[str]] = None,
+    exclude: Optional[Sequence[str]] = None,
+    max_depth: Optional[int] = None,
+    workers: int = WALK_WORKERS,
+    skip_dir: Optional[Callable[[str, float], bool]] = None,
+    stat_files: bool = False,
+) -> Iterator[Tuple[str, str, float, List[os.DirEntry]]]:
+    """
+    Walk root with os.scandir, listing subdirectories concurrently on `workers` threads.
+
+    Yields (dir_path, rel_dir, dir_mtime, entries) as soon as each directory is listed, where
+    entries are the os.DirEntry of files with one of `extensions`. dir_path is absolute and
+    rel_dir is relative to root ("" for root itself).
+
+    include/exclude are glob patterns matched against the name and the path relative to root;
+    exclude also prunes directories. max_depth=0 lists root only. skip_dir(path, mtime) returning
+    True suppresses the files of that directory (its subdirectories are still walked).
+    stat_files stats matching files on the worker threads so entry.stat() does not block the caller.
+    """
+    options = {
+        "extensions": tuple(e.lower() for e in extensions),
+        "include": list(include or []),
+        "exclude": list(exclude or []),
+        "max_depth": max_depth,
+        "skip_dir": skip_dir,
+        "stat_files": stat_files,
+    }
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(_scan_dir, os.path.abspath(root), "", 0, options): (os.path.abspath(root), "", 0)}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, rel_dir, depth = pending.pop(future)
+                try:
+                    mtime, files, subdirs = future.result()
+                except OSError:
+                    continue  # Unreadable or vanished directory: same as os.walk, just skip it
+                for sub_path, sub_rel in subdirs:
+                    pending[pool.submit(_scan_dir, sub_path, sub_rel, depth + 1, options)] = (sub_path, sub_rel, depth + 1)
+                perf.count("directories listed")
+                perf.count("video files found", len(files))
+                yield path, rel_dir, mtime, files